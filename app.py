@@ -1,11 +1,352 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, filedialog
-import networkx as nx
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from collections import deque
-import re
-from pathlib import Path
+from tkinter import font as tkfont
+import queue
+import threading
+import time
+from bisect import bisect_left, insort
+from inference_core import (KnowledgeBase, InferenceCancelled, InferenceStats, RuleFileError, RuleStore, TRACE_LEVELS,
+                            parse_facts, parse_goals, parse_premises, rule_order)
+
+VERBOSITY_CHOICES = list(TRACE_LEVELS)
+RULE_FILE_TYPES = [("Rule files", "*.txt *.json *.kbs"), ("Text files", "*.txt"),
+                   ("JSON files", "*.json"), ("Snapshot", "*.kbs")]
+CLOSURE_DERIVATIONS = 10  # số fact của KL được hiện kèm các luật dẫn tới nó
+
+
+class InferenceRunner:
+    """Chạy suy diễn trên luồng phụ để cửa sổ không bị treo.
+    Vết suy diễn được đẩy qua hàng đợi và ghi vào ô kết quả theo lô bằng
+    root.after; nút Hủy bật cờ mà bộ suy diễn kiểm tra sau mỗi bước (cancel).
+    Thống kê (InferenceStats) của lần chạy được hiện ở stats_var khi kết thúc,
+    kèm dòng do summary() trả về (nếu có).
+    """
+    POLL_MS = 50
+    MAX_BATCH = 5000  # số dòng vết tối đa ghi ra trong một lần flush
+    
+    def __init__(self, root, output, run_button, cancel_button, progress, status_var, stats_var, summary=None):
+        self.root = root
+        self.output = output
+        self.run_button = run_button
+        self.cancel_button = cancel_button
+        self.progress = progress
+        self.status_var = status_var
+        self.stats_var = stats_var
+        self.summary = summary
+        self.stats = None
+        self.lines = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.thread = None
+        self.outcome = None
+        self.count = 0
+    
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+    
+    def start(self, task):
+        """task(emit, cancel, stats) chạy trên luồng phụ; emit nhận một dòng vết"""
+        if self.running():
+            return
+        self.output.delete(1.0, tk.END)
+        self.lines = queue.Queue()
+        self.cancel_event.clear()
+        self.outcome = None
+        self.count = 0
+        self.stats = InferenceStats()
+        self.stats_var.set("")
+        
+        self.run_button.config(state='disabled')
+        self.cancel_button.config(state='normal')
+        self.progress.start(10)
+        self.status_var.set("Đang suy diễn...")
+        
+        self.thread = threading.Thread(target=self._work, args=(task,), daemon=True)
+        self.thread.start()
+        self.root.after(self.POLL_MS, self._poll)
+    
+    def cancel(self):
+        self.cancel_event.set()
+        self.status_var.set("Đang hủy...")
+    
+    def _work(self, task):
+        try:
+            task(self.lines.put, self.cancel_event.is_set, self.stats)
+            self.outcome = 'done'
+        except InferenceCancelled:
+            self.outcome = 'cancelled'
+        except Exception as e:
+            self.lines.put(f"\n❌ Lỗi: {e}\n")
+            self.outcome = 'error'
+    
+    def _flush(self):
+        """Ghi tối đa MAX_BATCH dòng vết đang chờ bằng một lần insert"""
+        batch = []
+        try:
+            while len(batch) < self.MAX_BATCH:
+                batch.append(self.lines.get_nowait())
+        except queue.Empty:
+            pass
+        if batch:
+            self.count += len(batch)
+            self.output.insert(tk.END, ''.join(batch))
+            self.output.see(tk.END)
+        return len(batch) == self.MAX_BATCH
+    
+    def _poll(self):
+        alive = self.thread.is_alive()
+        more = self._flush()
+        if alive or more:
+            if not self.cancel_event.is_set():
+                self.status_var.set(f"Đang suy diễn... {self.count} dòng vết")
+            self.root.after(self.POLL_MS, self._poll)
+            return
+        
+        self.progress.stop()
+        self.run_button.config(state='normal')
+        self.cancel_button.config(state='disabled')
+        text = self.stats.format()
+        if self.summary is not None:
+            text += '\n' + self.summary()
+        self.stats_var.set(text)
+        if self.outcome == 'cancelled':
+            self.output.insert(tk.END, "\n⛔ Đã hủy suy diễn\n")
+            self.output.see(tk.END)
+            self.status_var.set(f"Đã hủy ({self.count} dòng vết)")
+        elif self.outcome == 'error':
+            self.status_var.set("Lỗi khi suy diễn")
+        else:
+            self.status_var.set(f"Hoàn tất ({self.count} dòng vết)")
+
+
+class VirtualRuleList(ttk.Frame):
+    """Danh sách luật ảo: Listbox chỉ chứa các dòng đang nhìn thấy.
+    Thứ tự hiển thị là danh sách khóa (số thứ tự, idx) đã sắp, được cập nhật
+    bằng bisect khi thêm/sửa/xóa một luật thay vì sắp lại toàn bộ. Chỉ mục
+    fact -> các luật nhắc tới fact (vế trái hoặc vế phải) phục vụ ô lọc.
+    """
+    def __init__(self, master, on_select=None):
+        super().__init__(master)
+        self.on_select = on_select
+        
+        filter_frame = ttk.Frame(self)
+        filter_frame.pack(side='top', fill='x', pady=(0, 5))
+        ttk.Label(filter_frame, text="Lọc theo fact:").pack(side='left')
+        self.filter_var = tk.StringVar()
+        self.filter_var.trace_add('write', lambda *args: self.apply_filter())
+        ttk.Entry(filter_frame, textvariable=self.filter_var, width=25).pack(side='left', padx=5)
+        self.count_var = tk.StringVar()
+        ttk.Label(filter_frame, textvariable=self.count_var).pack(side='left')
+        
+        self.facts_var = tk.StringVar()
+        ttk.Label(self, textvariable=self.facts_var, justify='left').pack(side='bottom', fill='x', pady=(5, 0))
+        
+        self.scrollbar = ttk.Scrollbar(self, orient='vertical', command=self.scroll)
+        self.scrollbar.pack(side='right', fill='y')
+        self.listbox = tk.Listbox(self, activestyle='none', exportselection=False, font='TkFixedFont')
+        self.listbox.pack(side='left', fill='both', expand=True)
+        self.row_height = tkfont.nametofont('TkFixedFont').metrics('linespace') + 1
+        
+        self.listbox.bind('<Configure>', lambda e: self.render())
+        self.listbox.bind('<MouseWheel>', lambda e: self.scroll('scroll', -1 if e.delta > 0 else 1, 'units'))
+        self.listbox.bind('<Button-4>', lambda e: self.scroll('scroll', -1, 'units'))
+        self.listbox.bind('<Button-5>', lambda e: self.scroll('scroll', 1, 'units'))
+        self.listbox.bind('<<ListboxSelect>>', self._selected)
+        
+        self.rules = {}       # idx -> luật đang hiển thị
+        self.keys = []        # (số thứ tự, idx) đã sắp
+        self.fact_rules = {}  # fact -> tập idx nhắc tới fact
+        self.shown = None     # khóa sau khi lọc; None là tất cả
+        self.top = 0
+        self.visible = []
+    
+    @staticmethod
+    def _key(idx):
+        return (rule_order(idx), idx)
+    
+    @staticmethod
+    def _facts(rule):
+        return parse_premises(rule['left']) | {rule['right']}
+    
+    def _index(self, idx, rule, add):
+        for fact in self._facts(rule):
+            if add:
+                self.fact_rules.setdefault(fact, set()).add(idx)
+            else:
+                members = self.fact_rules.get(fact)
+                if members is not None:
+                    members.discard(idx)
+                    if not members:
+                        del self.fact_rules[fact]
+    
+    def reset(self, rules):
+        """Dựng lại toàn bộ danh sách (sau khi đọc file hoặc đánh số lại)"""
+        self.rules = dict(rules)
+        self.keys = sorted(self._key(idx) for idx in self.rules)
+        self.fact_rules = {}
+        for idx, rule in self.rules.items():
+            self._index(idx, rule, True)
+        self.apply_filter()
+    
+    def update_rule(self, idx, rule):
+        """Cập nhật một luật; rule=None là luật đã bị xóa"""
+        old = self.rules.pop(idx, None)
+        if old is not None:
+            self._index(idx, old, False)
+            del self.keys[bisect_left(self.keys, self._key(idx))]
+        if rule is not None:
+            self.rules[idx] = rule
+            self._index(idx, rule, True)
+            insort(self.keys, self._key(idx))
+        self.apply_filter(keep_position=True)
+    
+    def set_facts(self, GT, KL):
+        lines = []
+        if GT:
+            lines.append(f"GT = {', '.join(sorted(GT))}")
+        if KL:
+            lines.append(f"KL = {', '.join(sorted(KL))}")
+        self.facts_var.set('\n'.join(lines))
+    
+    def apply_filter(self, keep_position=False):
+        """Chỉ hiện các luật nhắc tới mọi fact gõ trong ô lọc"""
+        facts = parse_facts(self.filter_var.get())
+        if not facts:
+            self.shown = None
+        else:
+            matched = None
+            for fact in facts:
+                members = self.fact_rules.get(fact, set())
+                matched = set(members) if matched is None else matched & members
+            self.shown = sorted(self._key(idx) for idx in matched)
+        rows = self.keys if self.shown is None else self.shown
+        self.count_var.set(f"{len(rows)} / {len(self.keys)} luật")
+        if not keep_position:
+            self.top = 0
+        self.render()
+    
+    def _page_size(self):
+        return max(1, self.listbox.winfo_height() // self.row_height)
+    
+    def render(self):
+        """Đưa vào Listbox đúng các dòng đang nhìn thấy"""
+        rows = self.keys if self.shown is None else self.shown
+        page = self._page_size()
+        self.top = max(0, min(self.top, len(rows) - page))
+        self.visible = [idx for _, idx in rows[self.top:self.top + page]]
+        self.listbox.delete(0, tk.END)
+        for idx in self.visible:
+            rule = self.rules[idx]
+            self.listbox.insert(tk.END, f"{idx:<6} {rule['left']}->{rule['right']}")
+        if rows:
+            self.scrollbar.set(self.top / len(rows), min(1.0, (self.top + page) / len(rows)))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+    
+    def scroll(self, action, amount=None, unit=None):
+        """Lệnh của thanh cuộn: ('moveto', tỉ lệ) hoặc ('scroll', n, 'units'/'pages')"""
+        rows = self.keys if self.shown is None else self.shown
+        if action == 'moveto':
+            self.top = int(float(amount) * len(rows))
+        else:
+            step = self._page_size() if unit == 'pages' else 1
+            self.top += int(amount) * step
+        self.render()
+        return 'break'
+    
+    def _selected(self, event):
+        selection = self.listbox.curselection()
+        if selection and self.on_select is not None:
+            idx = self.visible[selection[0]]
+            self.on_select(idx, self.rules[idx])
+
+
+class GraphPanel:
+    """Vẽ đồ thị FPG/RPG trên một Figure dùng lại cho mọi lần vẽ của tab.
+    Đồ thị và bố cục lấy từ KnowledgeBase.graph nên chỉ được tính lại khi tập
+    luật đổi phiên bản hoặc đổi mức chi tiết (phạm vi k bước quanh GT/KL, gộp
+    SCC). Đồ thị lớn được vẽ giản lược: ẩn nhãn, đỉnh nhỏ, cung không mũi tên.
+    networkx/matplotlib chỉ được nạp ở lần vẽ đầu tiên để cửa sổ mở nhanh.
+    """
+    NODE_LABEL_LIMIT = 300  # nhiều đỉnh hơn thì ẩn nhãn đỉnh và thu nhỏ đỉnh
+    ARROW_LIMIT = 1000      # nhiều cung hơn thì vẽ đoạn thẳng thay cho mũi tên
+    
+    def __init__(self, parent, kb, kind, button_text, title, colors, node_size, font_color, figsize):
+        self.parent = parent
+        self.figsize = figsize
+        self.kb = kb
+        self.kind = kind
+        self.title = title
+        self.colors = colors
+        self.node_size = node_size
+        self.font_color = font_color
+        self.edge_attr = 'rule' if kind == 'fpg' else 'label'
+        
+        control_frame = ttk.Frame(parent)
+        control_frame.pack(side='top', fill='x', padx=5, pady=5)
+        
+        ttk.Button(control_frame, text=button_text, command=self.draw).pack(side='left', padx=5)
+        ttk.Label(control_frame, text="Phạm vi quanh GT/KL (bước, 0 = tất cả):").pack(side='left', padx=(15, 2))
+        self.hops_var = tk.IntVar(value=0)
+        ttk.Spinbox(control_frame, from_=0, to=50, width=4, textvariable=self.hops_var).pack(side='left')
+        ttk.Label(control_frame, text="Ẩn nhãn cung khi quá:").pack(side='left', padx=(15, 2))
+        self.label_limit_var = tk.IntVar(value=200)
+        ttk.Spinbox(control_frame, from_=0, to=100000, increment=50, width=7,
+                    textvariable=self.label_limit_var).pack(side='left')
+        ttk.Label(control_frame, text="cung").pack(side='left', padx=2)
+        self.collapse_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(control_frame, text="Gộp SCC", variable=self.collapse_var).pack(side='left', padx=15)
+        self.status_var = tk.StringVar()
+        ttk.Label(control_frame, textvariable=self.status_var).pack(side='left', padx=5)
+        
+        self.fig = self.ax = self.canvas = None
+    
+    def _create_canvas(self):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        
+        self.fig = Figure(figsize=self.figsize)
+        self.ax = self.fig.add_subplot()
+        self.ax.axis('off')
+        self.canvas = FigureCanvasTkAgg(self.fig, self.parent)
+        self.canvas.get_tk_widget().pack(fill='both', expand=True)
+    
+    def draw(self):
+        try:
+            hops = max(0, self.hops_var.get())
+            label_limit = self.label_limit_var.get()
+        except tk.TclError:
+            messagebox.showerror("Lỗi", "Phạm vi và ngưỡng nhãn cung phải là số nguyên!")
+            return
+        
+        start = time.perf_counter()
+        import networkx as nx
+        if self.canvas is None:
+            self._create_canvas()
+        G, pos = self.kb.graph(self.kind, hops, self.collapse_var.get())
+        n, m = G.number_of_nodes(), G.number_of_edges()
+        
+        ax = self.ax
+        ax.clear()
+        if n:
+            small = n <= self.NODE_LABEL_LIMIT
+            node_size = self.node_size if small else max(10, self.node_size * self.NODE_LABEL_LIMIT // n)
+            colors = [self.colors[data.get('role')] for _, data in G.nodes(data=True)]
+            nx.draw_networkx_nodes(G, pos, node_color=colors, node_size=node_size, ax=ax)
+            if small:
+                nx.draw_networkx_labels(G, pos, font_size=10, font_weight="bold", font_color=self.font_color, ax=ax)
+            if m <= self.ARROW_LIMIT:
+                nx.draw_networkx_edges(G, pos, arrows=True, arrowsize=20, width=2, node_size=node_size, ax=ax)
+            else:
+                nx.draw_networkx_edges(G, pos, arrows=False, width=0.5, alpha=0.4, ax=ax)
+            if m <= label_limit:
+                edge_labels = {(u, v): d[self.edge_attr] for u, v, d in G.edges(data=True)}
+                nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels, font_size=8, ax=ax)
+        
+        ax.set_title(self.title, fontsize=14, fontweight="bold")
+        ax.axis('off')
+        self.canvas.draw_idle()
+        self.status_var.set(f"{n} đỉnh, {m} cung ({time.perf_counter() - start:.2f} s)")
+
 
 class InferenceSystem:
     def __init__(self, root):
@@ -13,10 +354,9 @@ class InferenceSystem:
         self.root.title("Hệ thống Suy diễn Tri thức")
         self.root.geometry("1200x800")
         
-        self.rules_file = "rules.txt"
-        self.rules = {}
-        self.GT = set()
-        self.KL = set()
+        self.kb = KnowledgeBase()
+        self.store = RuleStore(self.kb, "rules.txt")
+        self.root.protocol("WM_DELETE_WINDOW", self.quit)
         
         self.create_menu()
         self.create_notebook()
@@ -30,8 +370,9 @@ class InferenceSystem:
         menubar.add_cascade(label="File", menu=file_menu)
         file_menu.add_command(label="Mở file luật", command=self.open_file)
         file_menu.add_command(label="Lưu file luật", command=self.save_file)
+        file_menu.add_command(label="Xóa bộ đệm kết quả", command=self.clear_results)
         file_menu.add_separator()
-        file_menu.add_command(label="Thoát", command=self.root.quit)
+        file_menu.add_command(label="Thoát", command=self.quit)
         
     def create_notebook(self):
         self.notebook = ttk.Notebook(self.root)
@@ -68,8 +409,8 @@ class InferenceSystem:
         left_frame = ttk.LabelFrame(self.tab_rules, text="Danh sách Luật", padding=10)
         left_frame.pack(side='left', fill='both', expand=True, padx=5, pady=5)
         
-        self.rules_text = scrolledtext.ScrolledText(left_frame, width=50, height=30)
-        self.rules_text.pack(fill='both', expand=True)
+        self.rule_list = VirtualRuleList(left_frame, on_select=self.select_rule)
+        self.rule_list.pack(fill='both', expand=True)
         
         # Frame phải: Thêm/Sửa/Xóa
         right_frame = ttk.LabelFrame(self.tab_rules, text="Chỉnh sửa", padding=10)
@@ -93,6 +434,7 @@ class InferenceSystem:
         ttk.Button(btn_frame, text="Thêm Luật", command=self.add_rule).pack(side='left', padx=5)
         ttk.Button(btn_frame, text="Sửa Luật", command=self.edit_rule).pack(side='left', padx=5)
         ttk.Button(btn_frame, text="Xóa Luật", command=self.delete_rule).pack(side='left', padx=5)
+        ttk.Button(btn_frame, text="Đánh số lại", command=self.renumber_rules).pack(side='left', padx=5)
         
         ttk.Separator(right_frame, orient='horizontal').grid(row=4, column=0, columnspan=2, sticky='ew', pady=10)
         
@@ -107,62 +449,70 @@ class InferenceSystem:
         ttk.Button(right_frame, text="Cập nhật GT/KL", command=self.update_gt_kl).grid(row=7, column=0, columnspan=2, pady=10)
         
         ttk.Button(right_frame, text="Tải lại từ file", command=self.load_rules).grid(row=8, column=0, columnspan=2, pady=5)
-    
-    def load_rules(self):
-        """Đọc luật từ file"""
-        self.rules = {}
-        self.GT = set()
-        self.KL = set()
         
-        if not Path(self.rules_file).exists():
-            return
-        
-        with open(self.rules_file, 'r', encoding='utf-8') as f:
-            lines = [l.strip() for l in f if l.strip()]
-        
-        for line in lines:
-            if '->' in line:
-                parts = line.split('\t')
-                if len(parts) >= 2:
-                    idx = parts[0]
-                    rule = parts[1]
-                    left, right = map(str.strip, rule.split('->'))
-                    self.rules[idx] = {'left': left, 'right': right}
-            elif line.lower().startswith('gt'):
-                gt_str = line.split('=')[1].strip() if '=' in line else ''
-                self.GT = set(re.findall(r"[a-zA-Z0-9]+", gt_str))
-            elif line.lower().startswith('kl'):
-                kl_str = line.split('=')[1].strip() if '=' in line else ''
-                self.KL = set(re.findall(r"[a-zA-Z0-9]+", kl_str))
+        # Bao đóng của GT được cập nhật tăng dần sau mỗi lần sửa luật/GT (thử "nếu... thì...")
+        self.closure_var = tk.StringVar()
+        ttk.Label(right_frame, textvariable=self.closure_var, justify='left',
+                  wraplength=350).grid(row=9, column=0, columnspan=2, sticky='w', pady=5)
         
+        ttk.Button(right_frame, text="Phân tích tập luật", command=self.analyze_rules).grid(row=10, column=0, pady=5, sticky='w')
+        self.reduced_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(right_frame, text="Suy diễn trên tập luật rút gọn",
+                        variable=self.reduced_var).grid(row=10, column=1, sticky='w')
+    
+    def load_rules(self, filename=None):
+        """Đọc luật từ file (kèm nhật ký thay đổi của file)"""
+        try:
+            self.store.load(filename)
+        except (RuleFileError, OSError) as e:
+            messagebox.showerror("Lỗi", f"Không đọc được file luật:\n{e}")
+            return
         self.display_rules()
     
     def display_rules(self):
-        """Hiển thị luật lên giao diện"""
-        self.rules_text.delete(1.0, tk.END)
-        for idx, rule in sorted(self.rules.items(), key=lambda x: int(x[0]) if x[0].isdigit() else 0):
-            self.rules_text.insert(tk.END, f"{idx}\t{rule['left']}->{rule['right']}\n")
-        
-        if self.GT:
-            self.rules_text.insert(tk.END, f"\nGT = {', '.join(sorted(self.GT))}\n")
-        if self.KL:
-            self.rules_text.insert(tk.END, f"KL = {', '.join(sorted(self.KL))}\n")
+        """Hiển thị lại toàn bộ luật (sau khi đọc file hoặc đánh số lại)"""
+        self.rule_list.reset(self.kb.rules)
+        self.display_facts()
+    
+    def refresh_rule(self, idx):
+        """Cập nhật riêng dòng của luật idx sau khi thêm/sửa/xóa"""
+        self.rule_list.update_rule(idx, self.kb.rules.get(idx))
+        self.display_closure()
+    
+    def display_facts(self):
+        """Hiển thị GT/KL lên giao diện"""
+        self.rule_list.set_facts(self.kb.GT, self.kb.KL)
         
         self.gt_entry.delete(0, tk.END)
-        self.gt_entry.insert(0, ', '.join(sorted(self.GT)))
+        self.gt_entry.insert(0, ', '.join(sorted(self.kb.GT)))
         
         self.kl_entry.delete(0, tk.END)
-        self.kl_entry.insert(0, ', '.join(sorted(self.KL)))
-    
-    def save_to_file(self):
-        """Lưu luật vào file"""
-        with open(self.rules_file, 'w', encoding='utf-8') as f:
-            for idx, rule in sorted(self.rules.items(), key=lambda x: int(x[0]) if x[0].isdigit() else 0):
-                f.write(f"{idx}\t{rule['left']}->{rule['right']}\n")
-            if self.GT:
-                f.write(f"GT = {', '.join(sorted(self.GT))}\n")
-            if self.KL:
-                f.write(f"KL = {', '.join(sorted(self.KL))}\n")
+        self.kl_entry.insert(0, ', '.join(sorted(self.kb.KL)))
+        self.display_closure()
+    
+    def display_closure(self):
+        """Hiển thị bao đóng hiện tại của GT và các fact của KL đã/chưa đạt"""
+        closure = self.kb.closure()
+        achieved = closure.achieved(self.kb.KL)
+        lines = [f"Bao đóng GT: {len(closure.facts)} fact"]
+        if self.kb.KL:
+            lines.append(f"KL đạt được: {', '.join(sorted(achieved)) or '(không)'}")
+            # Các luật dẫn tới từng fact của KL theo lý do đã ghi trong bao đóng
+            for fact in sorted(achieved)[:CLOSURE_DERIVATIONS]:
+                rules = sorted(closure.derivation(fact).values(), key=rule_order)
+                lines.append(f"  {fact} ← {', '.join(f'r{idx}' for idx in rules) or 'GT'}")
+            if len(achieved) > CLOSURE_DERIVATIONS:
+                lines.append(f"  … và {len(achieved) - CLOSURE_DERIVATIONS} fact khác")
+            if achieved != self.kb.KL:
+                lines.append(f"KL chưa đạt: {', '.join(sorted(self.kb.KL - achieved))}")
+        self.closure_var.set('\n'.join(lines))
+    
+    def select_rule(self, idx, rule):
+        """Chọn một dòng trong danh sách: đưa luật vào các ô chỉnh sửa"""
+        for entry, value in ((self.rule_id_entry, idx), (self.rule_left_entry, rule['left']),
+                             (self.rule_right_entry, rule['right'])):
+            entry.delete(0, tk.END)
+            entry.insert(0, value)
     
     def add_rule(self):
         idx = self.rule_id_entry.get().strip()
@@ -173,9 +523,8 @@ class InferenceSystem:
             messagebox.showwarning("Cảnh báo", "Vui lòng nhập đầy đủ thông tin!")
             return
         
-        self.rules[idx] = {'left': left, 'right': right}
-        self.save_to_file()
-        self.display_rules()
+        self.store.set_rule(idx, left, right)
+        self.refresh_rule(idx)
         messagebox.showinfo("Thành công", f"Đã thêm luật {idx}")
     
     def edit_rule(self):
@@ -183,243 +532,94 @@ class InferenceSystem:
         left = self.rule_left_entry.get().strip()
         right = self.rule_right_entry.get().strip()
         
-        if idx not in self.rules:
+        if idx not in self.kb.rules:
             messagebox.showwarning("Cảnh báo", f"Không tìm thấy luật {idx}!")
             return
         
-        self.rules[idx] = {'left': left, 'right': right}
-        self.save_to_file()
-        self.display_rules()
+        try:
+            self.store.set_rule(idx, left, right)
+        except ValueError as e:
+            messagebox.showwarning("Cảnh báo", str(e))
+            return
+        self.refresh_rule(idx)
         messagebox.showinfo("Thành công", f"Đã sửa luật {idx}")
     
     def delete_rule(self):
         idx = self.rule_id_entry.get().strip()
         
-        if idx not in self.rules:
+        if idx not in self.kb.rules:
             messagebox.showwarning("Cảnh báo", f"Không tìm thấy luật {idx}!")
             return
         
-        # Xóa luật
-        del self.rules[idx]
+        # Số thứ tự các luật còn lại giữ nguyên (dùng "Đánh số lại" nếu cần)
+        self.store.delete_rule(idx)
         
-        # Tái đánh số thứ tự các luật
-        try:
-            # Chuyển số thứ tự hiện tại sang dạng số để sắp xếp
-            numeric_keys = []
-            non_numeric_keys = []
-            
-            for key in self.rules.keys():
-                if key.isdigit():
-                    numeric_keys.append(int(key))
-                else:
-                    non_numeric_keys.append(key)
-            
-            numeric_keys.sort()
-            
-            # Tạo dict mới với số thứ tự liên tiếp
-            new_rules = {}
-            for new_idx, old_idx in enumerate(numeric_keys, 1):
-                new_rules[str(new_idx)] = self.rules[str(old_idx)]
-            
-            # Thêm lại những luật không phải số
-            for key in non_numeric_keys:
-                new_rules[key] = self.rules[key]
-            
-            self.rules = new_rules
-        except:
-            pass
-        
-        self.save_to_file()
+        self.refresh_rule(idx)
+        messagebox.showinfo("Thành công", f"Đã xóa luật {idx}")
+    
+    def renumber_rules(self):
+        """Đánh số lại liên tiếp các luật (ghi lại toàn bộ file luật)"""
+        self.store.renumber()
         self.display_rules()
-        messagebox.showinfo("Thành công", f"Đã xóa luật {idx} và cập nhật lại số thứ tự")
+        messagebox.showinfo("Thành công", "Đã cập nhật lại số thứ tự các luật")
     
     def update_gt_kl(self):
         gt_str = self.gt_entry.get().strip()
         kl_str = self.kl_entry.get().strip()
         
-        self.GT = set(re.findall(r"[a-zA-Z0-9]+", gt_str))
-        self.KL = set(re.findall(r"[a-zA-Z0-9]+", kl_str))
+        self.store.set_facts(parse_facts(gt_str), parse_facts(kl_str))
         
-        self.save_to_file()
-        self.display_rules()
+        self.display_facts()
         messagebox.showinfo("Thành công", "Đã cập nhật GT và KL")
     
+    def analyze_rules(self):
+        """Tìm luật trùng, bị bao hàm, luật chết, chu trình FPG và đo tốc độ trên tập luật rút gọn"""
+        report = self.kb.analysis().format(self.kb.measure_reduction())
+        window = tk.Toplevel(self.root)
+        window.title("Phân tích tập luật")
+        text = scrolledtext.ScrolledText(window, width=90, height=25)
+        text.pack(fill='both', expand=True, padx=5, pady=5)
+        text.insert(tk.END, report + "\n")
+        text.config(state='disabled')
+    
     def open_file(self):
-        filename = filedialog.askopenfilename(filetypes=[("Text files", "*.txt")])
+        filename = filedialog.askopenfilename(filetypes=RULE_FILE_TYPES)
         if filename:
-            self.rules_file = filename
-            self.load_rules()
+            self.load_rules(filename)
     
     def save_file(self):
-        filename = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text files", "*.txt")])
+        filename = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=RULE_FILE_TYPES)
         if filename:
-            self.rules_file = filename
-            self.save_to_file()
+            self.store.save_as(filename)
+    
+    def clear_results(self):
+        """Bỏ các kết quả suy diễn đã nhớ (lần chạy sau sẽ suy diễn lại)"""
+        self.kb.results.clear()
+        messagebox.showinfo("Thành công", self.kb.results.format())
+    
+    def quit(self):
+        """Chờ lần ghi lại file luật đang chạy nền (nếu có) rồi thoát"""
+        self.store.wait()
+        self.root.quit()
     
     # ============ TAB 2: ĐỒ THỊ FPG ============
     def create_fpg_tab(self):
-        control_frame = ttk.Frame(self.tab_fpg)
-        control_frame.pack(side='top', fill='x', padx=5, pady=5)
-        
-        ttk.Button(control_frame, text="Vẽ đồ thị FPG", command=self.draw_fpg).pack(side='left', padx=5)
-        
-        self.fpg_canvas_frame = ttk.Frame(self.tab_fpg)
-        self.fpg_canvas_frame.pack(fill='both', expand=True)
-    
-    def draw_fpg(self):
-        """Vẽ đồ thị FPG (Facts Precedence Graph)"""
-        for widget in self.fpg_canvas_frame.winfo_children():
-            widget.destroy()
-        
-        G = nx.DiGraph()
-        
-        for idx, rule in self.rules.items():
-            left_items = re.split(r'\^', rule['left'])
-            left_items = [i.strip() for i in left_items if i.strip()]
-            right = rule['right']
-            
-            for item in left_items:
-                G.add_edge(item, right, rule=f"r{idx}")
-        
-        fig, ax = plt.subplots(figsize=(10, 7))
-        pos = nx.shell_layout(G)
-        
-        colors = []
-        for node in G.nodes():
-            if node in self.GT:
-                colors.append("#8da0cb") # Giả thiết
-            elif node in self.KL:
-                colors.append("#fc8d62") # Kết luận
-            else:
-                colors.append("#a6d854") # Trung gian
-        
-        nx.draw_networkx_nodes(G, pos, node_color=colors, node_size=1500, ax=ax)
-        nx.draw_networkx_labels(G, pos, font_size=10, font_weight="bold", ax=ax)
-        nx.draw_networkx_edges(G, pos, arrows=True, arrowsize=20, width=2, ax=ax)
-        
-        edge_labels = {(u, v): d['rule'] for u, v, d in G.edges(data=True)}
-        nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels, font_size=8, ax=ax)
-        
-        ax.set_title("Facts Precedence Graph (FPG)", fontsize=14, fontweight="bold")
-        ax.axis('off')
-        
-        canvas = FigureCanvasTkAgg(fig, self.fpg_canvas_frame)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill='both', expand=True)
+        self.fpg_panel = GraphPanel(
+            self.tab_fpg, self.kb, 'fpg', "Vẽ đồ thị FPG", "Facts Precedence Graph (FPG)",
+            colors={'GT': "#8da0cb",   # Giả thiết
+                    'KL': "#fc8d62",   # Kết luận
+                    None: "#a6d854"},  # Trung gian
+            node_size=1500, font_color='black', figsize=(10, 7))
     
     # ============ TAB 3: ĐỒ THỊ RPG ============
     def create_rpg_tab(self):
-        control_frame = ttk.Frame(self.tab_rpg)
-        control_frame.pack(side='top', fill='x', padx=5, pady=5)
-        
-        ttk.Button(control_frame, text="Vẽ đồ thị RPG", command=self.draw_rpg).pack(side='left', padx=5)
-        
-        self.rpg_canvas_frame = ttk.Frame(self.tab_rpg)
-        self.rpg_canvas_frame.pack(fill='both', expand=True)
-    
-    def draw_rpg(self):
-        """Vẽ đồ thị RPG (Rules Precedence Graph)"""
-        for widget in self.rpg_canvas_frame.winfo_children():
-            widget.destroy()
-        
-        G = nx.DiGraph()
-        
-        # Xây dựng đồ thị phụ thuộc giữa các luật
-        for idx_i, rule_i in self.rules.items():
-            for idx_j, rule_j in self.rules.items():
-                if idx_i != idx_j:
-                    left_j = re.split(r'\^', rule_j['left'])
-                    left_j = [i.strip() for i in left_j if i.strip()]
-                    if rule_i['right'] in left_j:
-                        G.add_edge(f"r{idx_i}", f"r{idx_j}", label=rule_i['right'])
-        
-        # Phân loại R_GT và R_KL
-        R_GT = set()
-        R_KL = set()
-        
-        for idx, rule in self.rules.items():
-            left_items = re.split(r'\^', rule['left'])
-            left_items = set([i.strip() for i in left_items if i.strip()])
-            
-            if left_items.issubset(self.GT):
-                R_GT.add(f"r{idx}")
-            if rule['right'] in self.KL:
-                R_KL.add(f"r{idx}")
-        
-        fig, ax = plt.subplots(figsize=(12, 8))
-        pos = nx.shell_layout(G)
-        
-        colors = []
-        for node in G.nodes():
-            if node in R_GT:
-                colors.append("#FF5722") # Luật xuất phát từ GT
-            elif node in R_KL:
-                colors.append("#4CAF50") # Luật dẫn đến KL
-            else:
-                colors.append("#2196F3") # Luật trung gian
-        
-        nx.draw_networkx_nodes(G, pos, node_color=colors, node_size=2000, ax=ax)
-        nx.draw_networkx_labels(G, pos, font_size=10, font_weight="bold", font_color='white', ax=ax)
-        nx.draw_networkx_edges(G, pos, arrows=True, arrowsize=20, width=2, ax=ax)
-        
-        edge_labels = {(u, v): d['label'] for u, v, d in G.edges(data=True)}
-        nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels, font_size=8, ax=ax)
-        
-        ax.set_title("Rules Precedence Graph (RPG)", fontsize=14, fontweight="bold")
-        ax.axis('off')
-        
-        canvas = FigureCanvasTkAgg(fig, self.rpg_canvas_frame)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill='both', expand=True)
-
-    # ============ FPG/RPG HELPERS ============
-    def build_fpg(self, rules):
-        """Xây dựng đồ thị FPG (Facts Precedence Graph) từ dict luật.
-        rules: dict mapping idx -> (premises_set, conclusion)
-        """
-        G = nx.DiGraph()
-        for idx, (premises, conclusion) in rules.items():
-            for p in premises:
-                G.add_edge(p, conclusion, rule=f"r{idx}")
-        return G
-
-    def build_rpg(self, rules):
-        """Xây dựng đồ thị RPG (Rules Precedence Graph) từ dict luật.
-        rules: dict mapping idx -> (premises_set, conclusion)
-        """
-        G = nx.DiGraph()
-        for idx1, (prem1, concl1) in rules.items():
-            for idx2, (prem2, concl2) in rules.items():
-                if idx1 != idx2 and concl1 in prem2:
-                    G.add_edge(idx1, idx2)
-        return G
-
-    def d_fpg(self, G, start, end):
-        try:
-            return nx.shortest_path_length(G, start, end)
-        except (nx.NetworkXNoPath, nx.NodeNotFound):
-            return float('inf')
+        self.rpg_panel = GraphPanel(
+            self.tab_rpg, self.kb, 'rpg', "Vẽ đồ thị RPG", "Rules Precedence Graph (RPG)",
+            colors={'GT': "#FF5722",   # Luật xuất phát từ GT
+                    'KL': "#4CAF50",   # Luật dẫn đến KL
+                    None: "#2196F3"},  # Luật trung gian
+            node_size=2000, font_color='white', figsize=(12, 8))
 
-    def heuristic_fpg(self, G, premises, goal):
-        """Tính h(r,GT) = max{d(f, goal) | f in premises} (the smaller the better).
-        Nếu mọi d là inf thì trả về inf.
-        """
-        if not premises or not goal:
-            return float('inf')
-        vals = []
-        for f in premises:
-            vals.append(self.d_fpg(G, f, goal))
-        return max(vals) if vals else float('inf')
-
-    def heuristic_rpg(self, G, rule_idx):
-        """Tính h(r) = số lượng luật phụ thuộc vào r trong RPG.
-        Luật càng ít ảnh hưởng đến luật khác thì càng tốt (nhỏ).
-        """
-        try:
-            return len(nx.descendants(G, rule_idx))
-        except:
-            return 0
-    
     # ============ TAB 4: SUY DIỄN TIẾN ============
     def create_forward_tab(self):
         control_frame = ttk.LabelFrame(self.tab_forward, text="Tùy chọn", padding=10)
@@ -437,119 +637,68 @@ class InferenceSystem:
         ttk.Radiobutton(control_frame, text="Queue (FIFO)", variable=self.fwd_agenda_var, value="queue").grid(row=1, column=1)
         ttk.Radiobutton(control_frame, text="Stack (LIFO)", variable=self.fwd_agenda_var, value="stack").grid(row=1, column=2)
         
-        ttk.Button(control_frame, text="Thực hiện Suy diễn Tiến", command=self.run_forward).grid(row=2, column=0, columnspan=5, pady=10)
+        ttk.Label(control_frame, text="Mức vết:").grid(row=1, column=3, padx=5, sticky='e')
+        self.fwd_verbosity_var = tk.StringVar(value="full")
+        ttk.Combobox(control_frame, textvariable=self.fwd_verbosity_var, values=VERBOSITY_CHOICES,
+                     state='readonly', width=10).grid(row=1, column=4, sticky='w')
+        
+        self.fwd_prune_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(control_frame, text="Chỉ xét luật dẫn tới KL",
+                        variable=self.fwd_prune_var).grid(row=0, column=5, padx=10, sticky='w')
+        self.fwd_stop_early_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(control_frame, text="Dừng khi đạt đủ KL",
+                        variable=self.fwd_stop_early_var).grid(row=1, column=5, padx=10, sticky='w')
+        
+        fwd_run_btn = ttk.Button(control_frame, text="Thực hiện Suy diễn Tiến", command=self.run_forward)
+        fwd_run_btn.grid(row=2, column=0, columnspan=3, pady=10)
+        fwd_cancel_btn = ttk.Button(control_frame, text="Hủy", state='disabled')
+        fwd_cancel_btn.grid(row=2, column=3, pady=10)
+        
+        fwd_progress = ttk.Progressbar(control_frame, mode='indeterminate', length=200)
+        fwd_progress.grid(row=3, column=0, columnspan=3, sticky='w', padx=5)
+        fwd_status = tk.StringVar()
+        ttk.Label(control_frame, textvariable=fwd_status).grid(row=3, column=3, columnspan=2, sticky='w')
+        
+        stats_frame = ttk.LabelFrame(self.tab_forward, text="Thống kê", padding=5)
+        stats_frame.pack(side='top', fill='x', padx=5)
+        fwd_stats = tk.StringVar()
+        ttk.Label(stats_frame, textvariable=fwd_stats, justify='left').pack(anchor='w')
         
         self.fwd_result = scrolledtext.ScrolledText(self.tab_forward, height=30)
         self.fwd_result.pack(fill='both', expand=True, padx=5, pady=5)
+        
+        self.fwd_runner = InferenceRunner(self.root, self.fwd_result, fwd_run_btn, fwd_cancel_btn, fwd_progress,
+                                          fwd_status, fwd_stats,
+                                          lambda: self.kb.results.format())
+        fwd_cancel_btn.config(command=self.fwd_runner.cancel)
     
     def run_forward(self):
-        """Thực hiện suy diễn tiến"""
+        """Thực hiện suy diễn tiến (trên luồng phụ)"""
+        if self.fwd_runner.running():
+            return
         self.fwd_result.delete(1.0, tk.END)
         
-        if not self.GT:
+        if not self.kb.GT:
             self.fwd_result.insert(tk.END, "❌ Chưa có giả thiết (GT)!\n")
             return
         
-        facts = set(self.GT)
+        GT, KL = set(self.kb.GT), set(self.kb.KL)
         strategy = self.fwd_strategy_var.get()
         agenda_type = self.fwd_agenda_var.get()
-        
-        # Chuyển đổi rules sang format dict
-        rules_dict = {}
-        for idx, rule in self.rules.items():
-            left_items = re.split(r'\^', rule['left'])
-            premises = set([i.strip() for i in left_items if i.strip()])
-            rules_dict[idx] = (premises, rule['right'])
-        
-        # Xây dựng đồ thị FPG/RPG nếu cần
-        G_fpg = None
-        G_rpg = None
-        if strategy == 'fpg':
-            G_fpg = self.build_fpg(rules_dict)
-        elif strategy == 'rpg':
-            G_rpg = self.build_rpg(rules_dict)
-        
-        self.fwd_result.insert(tk.END, f"=== SUY DIỄN TIẾN ===\n")
-        self.fwd_result.insert(tk.END, f"GT ban đầu: {facts}\n")
-        self.fwd_result.insert(tk.END, f"Chiến lược: {strategy.upper()}\n")
-        self.fwd_result.insert(tk.END, f"Tập THOA: {agenda_type.upper()}\n\n")
-        
-        # Khởi tạo agenda
-        if agenda_type == 'queue':
-            container = deque()
-            push = container.append
-            pop = container.popleft
-        else:
-            container = []
-            push = container.append
-            pop = container.pop
-        
-        # Tìm luật khả dụng ban đầu
-        available_rules = []
-        for idx, (prem, concl) in rules_dict.items():
-            if prem.issubset(facts) and concl not in facts:
-                available_rules.append(idx)
-        
-        for idx in available_rules:
-            push(idx)
-        
-        step = 1
-        while container:
-            # Chọn luật theo chiến lược
-            if strategy == 'min':
-                indices = list(container)
-                chosen = min(indices, key=lambda x: int(x) if str(x).isdigit() else 0)
-                container.remove(chosen)
-            elif strategy == 'max':
-                indices = list(container)
-                chosen = max(indices, key=lambda x: int(x) if str(x).isdigit() else 0)
-                container.remove(chosen)
-            elif strategy == 'fpg':
-                indices = list(container)
-                h_values = {}
-                for idx in indices:
-                    premises, conclusion = rules_dict[idx]
-                    h_values[idx] = self.heuristic_fpg(G_fpg, premises, conclusion)
-                chosen = min(indices, key=lambda x: h_values.get(x, float('inf')))
-                container.remove(chosen)
-                self.fwd_result.insert(tk.END, f"  → h values: {h_values}\n")
-            elif strategy == 'rpg':
-                indices = list(container)
-                h_values = {}
-                for idx in indices:
-                    h_values[idx] = self.heuristic_rpg(G_rpg, idx)
-                chosen = min(indices, key=lambda x: h_values.get(x, float('inf')))
-                container.remove(chosen)
-                self.fwd_result.insert(tk.END, f"  → h(r) values: {h_values}\n")
-            else:
-                chosen = pop()
-            
-            premises, conclusion = rules_dict[chosen]
-            
-            if premises.issubset(facts) and conclusion not in facts:
-                facts.add(conclusion)
-                self.fwd_result.insert(tk.END, f"Bước {step}: Áp dụng luật r{chosen} ({premises} → {conclusion})\n")
-                self.fwd_result.insert(tk.END, f"   Suy ra: {conclusion}\n")
-                self.fwd_result.insert(tk.END, f"   Tập facts mới: {facts}\n\n")
-                step += 1
-                
-                # Kiểm tra KL
-                if self.KL and conclusion in self.KL:
-                    self.fwd_result.insert(tk.END, f"🎯 Đã đạt được kết luận: {conclusion}\n\n")
-                
-                # Thêm luật mới khả dụng
-                for idx, (prem, concl) in rules_dict.items():
-                    if prem.issubset(facts) and concl not in facts and idx not in container:
-                        push(idx)
-        
-        self.fwd_result.insert(tk.END, f"\n✅ Tập fact cuối cùng: {facts}\n")
-        
-        if self.KL:
-            achieved = self.KL.intersection(facts)
-            if achieved:
-                self.fwd_result.insert(tk.END, f"✅ Đã đạt KL: {achieved}\n")
-            else:
-                self.fwd_result.insert(tk.END, f"❌ Chưa đạt KL: {self.KL}\n")
+        verbosity = self.fwd_verbosity_var.get()
+        prune, stop_early = self.fwd_prune_var.get(), self.fwd_stop_early_var.get()
+        reduced = self.reduced_var.get()
+        # Trên luồng Tk chỉ sao chép tập luật; luồng phụ biên dịch và dựng các bảng
+        # trên bản sao này (sau thanh tiến trình) nên cửa sổ không bị treo và các nút
+        # sửa luật vẫn dùng được trong lúc suy diễn
+        kb = self.kb.snapshot(warm=False)
+        
+        def task(emit, cancel, stats):
+            kb.warm(strategy, reduced)
+            return kb.forward(GT, KL, strategy, agenda_type, emit=emit, verbosity=verbosity, cancel=cancel,
+                              prune=prune, stop_early=stop_early, stats=stats, reduced=reduced)
+        
+        self.fwd_runner.start(task)
     
     # ============ TAB 5: SUY DIỄN LÙI ============
     def create_backward_tab(self):
@@ -561,120 +710,76 @@ class InferenceSystem:
         ttk.Radiobutton(control_frame, text="Min", variable=self.bwd_strategy_var, value="min").grid(row=0, column=1)
         ttk.Radiobutton(control_frame, text="Max", variable=self.bwd_strategy_var, value="max").grid(row=0, column=2)
         ttk.Radiobutton(control_frame, text="FPG", variable=self.bwd_strategy_var, value="fpg").grid(row=0, column=3)
+        ttk.Radiobutton(control_frame, text="Best-first (A*, ít luật nhất)", variable=self.bwd_strategy_var,
+                        value="best").grid(row=1, column=5, sticky='w')
         
-        ttk.Label(control_frame, text="Mục tiêu:").grid(row=1, column=0, padx=5)
+        ttk.Label(control_frame, text="Mục tiêu (vd: r, s):").grid(row=1, column=0, padx=5)
         self.bwd_goal_entry = ttk.Entry(control_frame, width=20)
         self.bwd_goal_entry.grid(row=1, column=1, columnspan=2, sticky='w')
         
-        ttk.Button(control_frame, text="Thực hiện Suy diễn Lùi", command=self.run_backward).grid(row=2, column=0, columnspan=3, pady=10)
+        self.bwd_tabled_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(control_frame, text="Ghi nhớ mục tiêu (tabled)", variable=self.bwd_tabled_var).grid(row=1, column=3, columnspan=2, sticky='w')
+        
+        ttk.Label(control_frame, text="Mức vết:").grid(row=0, column=4, padx=5, sticky='e')
+        self.bwd_verbosity_var = tk.StringVar(value="full")
+        ttk.Combobox(control_frame, textvariable=self.bwd_verbosity_var, values=VERBOSITY_CHOICES,
+                     state='readonly', width=10).grid(row=0, column=5, sticky='w')
+        
+        bwd_run_btn = ttk.Button(control_frame, text="Thực hiện Suy diễn Lùi", command=self.run_backward)
+        bwd_run_btn.grid(row=2, column=0, columnspan=3, pady=10)
+        bwd_cancel_btn = ttk.Button(control_frame, text="Hủy", state='disabled')
+        bwd_cancel_btn.grid(row=2, column=3, pady=10)
+        
+        bwd_progress = ttk.Progressbar(control_frame, mode='indeterminate', length=200)
+        bwd_progress.grid(row=3, column=0, columnspan=3, sticky='w', padx=5)
+        bwd_status = tk.StringVar()
+        ttk.Label(control_frame, textvariable=bwd_status).grid(row=3, column=3, columnspan=2, sticky='w')
+        
+        stats_frame = ttk.LabelFrame(self.tab_backward, text="Thống kê", padding=5)
+        stats_frame.pack(side='top', fill='x', padx=5)
+        bwd_stats = tk.StringVar()
+        ttk.Label(stats_frame, textvariable=bwd_stats, justify='left').pack(anchor='w')
         
         self.bwd_result = scrolledtext.ScrolledText(self.tab_backward, height=30)
         self.bwd_result.pack(fill='both', expand=True, padx=5, pady=5)
+        
+        self.bwd_runner = InferenceRunner(self.root, self.bwd_result, bwd_run_btn, bwd_cancel_btn, bwd_progress,
+                                          bwd_status, bwd_stats,
+                                          lambda: self.kb.results.format())
+        bwd_cancel_btn.config(command=self.bwd_runner.cancel)
     
     def run_backward(self):
-        """Thực hiện suy diễn lùi"""
+        """Thực hiện suy diễn lùi (trên luồng phụ)"""
+        if self.bwd_runner.running():
+            return
         self.bwd_result.delete(1.0, tk.END)
         
-        goal = self.bwd_goal_entry.get().strip()
-        if not goal:
-            if self.KL:
-                goal = next(iter(self.KL))
-            else:
-                self.bwd_result.insert(tk.END, "❌ Vui lòng nhập mục tiêu hoặc thiết lập KL!\n")
-                return
+        # Nhiều mục tiêu (hoặc để trống khi KL có nhiều fact) thì chứng minh tất cả trong một lượt
+        goals = parse_goals(self.bwd_goal_entry.get()) or sorted(self.kb.KL)
+        if not goals:
+            self.bwd_result.insert(tk.END, "❌ Vui lòng nhập mục tiêu hoặc thiết lập KL!\n")
+            return
         
-        if not self.GT:
+        if not self.kb.GT:
             self.bwd_result.insert(tk.END, "❌ Chưa có giả thiết (GT)!\n")
             return
         
-        known = set(self.GT)
+        GT = set(self.kb.GT)
         strategy = self.bwd_strategy_var.get()
-        
-        # Chuyển đổi rules
-        rules_dict = {}
-        for idx, rule in self.rules.items():
-            left_items = re.split(r'\^', rule['left'])
-            premises = set([i.strip() for i in left_items if i.strip()])
-            rules_dict[idx] = (premises, rule['right'])
-        
-        # Xây dựng đồ thị FPG nếu cần
-        G = None
-        if strategy == 'fpg':
-            G = self.build_fpg(rules_dict)
-            self.bwd_result.insert(tk.END, "→ Xây dựng đồ thị FPG...\n")
-        
-        self.bwd_result.insert(tk.END, f"=== SUY DIỄN LÙI ===\n")
-        self.bwd_result.insert(tk.END, f"GT ban đầu: {known}\n")
-        self.bwd_result.insert(tk.END, f"Mục tiêu: {goal}\n")
-        self.bwd_result.insert(tk.END, f"Chiến lược: {strategy.upper()}\n\n")
-        
-        result = self.backward_chain(goal, known, rules_dict, strategy, 0, set(), G)
-        
-        if result:
-            self.bwd_result.insert(tk.END, f"\n✅ THÀNH CÔNG: Đã chứng minh được {goal}\n")
-        else:
-            self.bwd_result.insert(tk.END, f"\n❌ THẤT BẠI: Không thể chứng minh {goal}\n")
-    
-    def backward_chain(self, goal, known, rules, strategy, depth, used, G=None):
-        """Thuật toán suy diễn lùi"""
-        indent = "  " * depth
-        
-        self.bwd_result.insert(tk.END, f"{indent}→ Cần chứng minh: {goal}\n")
-        
-        if goal in known:
-            self.bwd_result.insert(tk.END, f"{indent}  ✓ {goal} đã có trong GT\n")
-            return True
-        
-        # Tìm luật có kết luận là goal
-        applicable = [idx for idx, (prem, concl) in rules.items() if concl == goal and idx not in used]
-        
-        if not applicable:
-            self.bwd_result.insert(tk.END, f"{indent}  ✗ Không có luật nào suy ra {goal}\n")
-            return False
-        
-        # Sắp xếp các luật áp dụng được theo chiến lược
-        if strategy == 'min':
-            sorted_rules = sorted(applicable, key=lambda x: int(x) if str(x).isdigit() else 0)
-        elif strategy == 'max':
-            sorted_rules = sorted(applicable, key=lambda x: int(x) if str(x).isdigit() else 0, reverse=True)
-        elif strategy == 'fpg' and G is not None:
-            # Tính h(r,GT) cho từng luật và sắp xếp theo h tăng dần
-            h_values = {}
-            for r in applicable:
-                premises = rules[r][0]
-                h_values[r] = self.heuristic_fpg(G, premises, goal)
-            
-            self.bwd_result.insert(tk.END, f"{indent}→ h(r,GT) values: {h_values}\n")
-            sorted_rules = sorted(applicable, key=lambda r: h_values.get(r, float('inf')))
-        else:
-            sorted_rules = sorted(applicable, key=lambda x: int(x) if str(x).isdigit() else 0)
-        
-        # Thử từng luật một (Backtracking)
-        for r_chosen in sorted_rules:
-            premises, conclusion = rules[r_chosen]
-            
-            self.bwd_result.insert(tk.END, f"{indent}  • Thử luật r{r_chosen}: {premises} → {conclusion}\n")
-            
-            # Đánh dấu luật đã dùng trong nhánh này
-            new_used = used.copy()
-            new_used.add(r_chosen)
-            
-            all_proven = True
-            for p in premises:
-                if not self.backward_chain(p, known, rules, strategy, depth + 1, new_used, G):
-                    all_proven = False
-                    self.bwd_result.insert(tk.END, f"{indent}    ✗ Thất bại khi chứng minh tiền đề {p} của r{r_chosen}\n")
-                    break
-            
-            if all_proven:
-                self.bwd_result.insert(tk.END, f"{indent}  ✓ Chứng minh thành công {goal} bằng r{r_chosen}\n")
-                known.add(goal)
-                return True
-            else:
-                self.bwd_result.insert(tk.END, f"{indent}  ✗ Quay lui từ r{r_chosen}\n")
-        
-        self.bwd_result.insert(tk.END, f"{indent}✗ Đã thử hết luật, không chứng minh được {goal}\n")
-        return False
+        tabled = self.bwd_tabled_var.get()
+        verbosity = self.bwd_verbosity_var.get()
+        reduced = self.reduced_var.get()
+        kb = self.kb.snapshot(warm=False)  # như run_forward
+        
+        def task(emit, cancel, stats):
+            kb.warm(strategy, reduced)
+            if len(goals) > 1:
+                return kb.backward_all(goals, GT, strategy, emit=emit, verbosity=verbosity, cancel=cancel,
+                                       stats=stats, reduced=reduced)
+            return kb.backward(goals[0], GT, strategy, tabled, emit=emit, verbosity=verbosity, cancel=cancel,
+                               stats=stats, reduced=reduced)
+        
+        self.bwd_runner.start(task)
 
 
 # ============ CHẠY CHƯƠNG TRÌNH ============
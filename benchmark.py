@@ -0,0 +1,324 @@
+"""Đo hiệu năng trên các tập luật tổng hợp, không cần giao diện.
+
+Các dạng tập luật (--shapes): chain (chuỗi dài), fanin (nhiều luật cùng suy
+ra một fact, một luật nhiều tiền đề), layered (DAG theo tầng), cyclic (có chu
+trình) và random (ngẫu nhiên thưa); kích thước (--sizes) từ 10^2 tới 10^6 luật.
+Với mỗi tập luật đo: đọc file luật (văn bản và snapshot), biên dịch, dựng đồ
+thị FPG/RPG (build_fpg/build_rpg), bảng FPG/RPG, phân tích luật thừa
+(analyze_rules), suy diễn tiến theo từng chiến lược và tập THOA, suy diễn lùi
+theo từng chiến lược (đệ quy và tabled), best-first (A*) và nhiều mục tiêu
+(mode "all-goals": kết luận của MULTI_GOALS luật cuối, chung bảng mục tiêu
+con). Các phép đo suy diễn tắt bộ đệm kết quả; riêng mode "cached" đo một lần
+trúng bộ đệm.
+
+Trước các tập luật là thời gian khởi động (op "startup"): nạp inference_core,
+cli, server và app trong một tiến trình mới. Các module này không được kéo theo
+networkx/matplotlib/numpy; nếu có thì trạng thái là "heavy" thay vì "ok".
+
+Kết quả là JSONL: dòng đầu {"meta": ...} (phiên bản Python, commit, tham số),
+mỗi dòng sau là một phép đo {"shape", "rules", "op", ..., "seconds", "status"}:
+
+    python benchmark.py --sizes 100 1000 10000 -o bench.jsonl
+
+So sánh hai lần đo (ví dụ trước/sau một thay đổi); mã thoát 1 nếu có phép đo
+chậm hơn --threshold lần:
+
+    python benchmark.py --compare old.jsonl bench.jsonl
+"""
+import argparse
+import json
+import math
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from inference_core import (CompiledRuleBase, FPGDistanceTable, InferenceCancelled, KnowledgeBase,
+                            RPGReachTable, ResultCache, analyze_rules, build_fpg, build_rpg, write_rules_file)
+
+FORWARD_STRATEGIES = ('min', 'max', 'fpg', 'rpg')
+AGENDA_TYPES = ('queue', 'stack')
+BACKWARD_STRATEGIES = ('min', 'max', 'fpg')
+MULTI_GOALS = 100  # số mục tiêu của phép đo suy diễn lùi nhiều mục tiêu
+STARTUP_MODULES = ('inference_core', 'cli', 'server', 'app')
+HEAVY_MODULES = ('networkx', 'matplotlib', 'numpy')
+
+
+# ============ SINH TẬP LUẬT ============
+# Mỗi hàm nhận (n, rng) và trả về (rules, GT, KL) với rules: dict idx -> {'left', 'right'}
+
+def gen_chain(n, rng):
+    """Chuỗi f0 -> f1 -> ... -> fn: độ sâu suy diễn bằng số luật"""
+    rules = {str(i): {'left': f"f{i - 1}", 'right': f"f{i}"} for i in range(1, n + 1)}
+    return rules, {'f0'}, {f"f{n}"}
+
+
+def gen_fanin(n, rng):
+    """n - 1 luật p_i -> t_(i mod T) cùng một luật t_0^...^t_(T-1) -> goal (T = n/1000).
+    Chỉ nửa sau các p_i thuộc GT nên suy diễn lùi phải thử qua nhiều luật thất bại.
+    """
+    targets = max(1, n // 1000)
+    rules = {str(i): {'left': f"p{i}", 'right': f"t{i % targets}"} for i in range(1, n)}
+    rules[str(n)] = {'left': '^'.join(f"t{j}" for j in range(targets)), 'right': 'goal'}
+    return rules, {f"p{i}" for i in range(n // 2, n)}, {'goal'}
+
+
+def gen_layered(n, rng):
+    """DAG theo tầng rộng W = sqrt(n): luật ở tầng k đi từ 1-3 fact tầng k tới một fact tầng k+1"""
+    width = max(2, math.isqrt(n))
+    rules = {}
+    for i in range(n):
+        layer = i // width
+        premises = {f"l{layer}_{rng.randrange(width)}" for _ in range(rng.randint(1, 3))}
+        rules[str(i + 1)] = {'left': '^'.join(sorted(premises)), 'right': f"l{layer + 1}_{rng.randrange(width)}"}
+    return rules, {f"l0_{j}" for j in range(width)}, {rules[str(n)]['right']}
+
+
+def gen_cyclic(n, rng):
+    """Vòng f0 -> f1 -> ... -> f0 trên n/2 fact cùng các luật quay ngược ngẫu nhiên"""
+    facts = max(2, n // 2)
+    rules = {}
+    for i in range(n):
+        if i < facts:
+            left, right = f"f{i}", f"f{(i + 1) % facts}"
+            if rng.random() < 0.3:
+                left += f"^f{rng.randrange(facts)}"
+        else:
+            a = rng.randrange(1, facts)
+            left, right = f"f{a}", f"f{rng.randrange(a)}"
+        rules[str(i + 1)] = {'left': left, 'right': right}
+    return rules, {'f0'}, {f"f{facts - 1}"}
+
+
+def gen_random(n, rng):
+    """Tập luật ngẫu nhiên thưa trên n fact: 1-3 tiền đề, GT là 1% số fact"""
+    rules = {}
+    for i in range(n):
+        premises = {f"f{rng.randrange(n)}" for _ in range(rng.randint(1, 3))}
+        rules[str(i + 1)] = {'left': '^'.join(sorted(premises)), 'right': f"f{rng.randrange(n)}"}
+    GT = {f"f{i}" for i in rng.sample(range(n), max(1, n // 100))}
+    return rules, GT, {rules[str(rng.randint(1, n))]['right']}
+
+
+SHAPES = {'chain': gen_chain, 'fanin': gen_fanin, 'layered': gen_layered,
+          'cyclic': gen_cyclic, 'random': gen_random}
+
+
+# ============ ĐO ============
+def measure(fn, repeat=1, timeout=None):
+    """Chạy fn(cancel) repeat lần, trả về (thời gian nhỏ nhất, kết quả lần cuối, trạng thái).
+    cancel trả về True khi quá timeout giây; lần chạy bị hủy cho trạng thái 'timeout'.
+    """
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        deadline = start + timeout if timeout else None
+        cancel = (lambda: time.perf_counter() > deadline) if deadline else None
+        try:
+            result = fn(cancel)
+        except InferenceCancelled:
+            return time.perf_counter() - start, None, 'timeout'
+        except RecursionError:
+            return time.perf_counter() - start, None, 'recursion'
+        best = min(best, time.perf_counter() - start)
+    return best, result, 'ok'
+
+
+def bench_startup(repeat=1):
+    """Thời gian nạp từng module của STARTUP_MODULES trong một tiến trình Python mới.
+    seconds là thời gian import (nhỏ nhất qua repeat lần), process là thời gian
+    cả tiến trình; heavy là các thư viện của HEAVY_MODULES đã bị nạp theo.
+    """
+    for module in STARTUP_MODULES:
+        code = (f"import sys, time, json\nstart = time.perf_counter()\nimport {module}\n"
+                f"print(json.dumps([time.perf_counter() - start, "
+                f"[m for m in {HEAVY_MODULES!r} if m in sys.modules]]))")
+        best = best_process = float('inf')
+        heavy, status = [], 'ok'
+        for _ in range(repeat):
+            start = time.perf_counter()
+            out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                 cwd=Path(__file__).parent)
+            best_process = min(best_process, time.perf_counter() - start)
+            if out.returncode:
+                status = 'error'
+                break
+            seconds, heavy = json.loads(out.stdout.strip().splitlines()[-1])
+            best = min(best, seconds)
+        if status == 'ok' and heavy:
+            status = 'heavy'
+        yield {'op': 'startup', 'mode': module, 'heavy': heavy, 'process': round(best_process, 6),
+               'seconds': round(best if best < float('inf') else 0.0, 6), 'status': status}
+
+
+def bench_rule_base(shape, n, rng, workdir, repeat=1, timeout=None, plain_limit=1000):
+    """Sinh một tập luật rồi sinh các bản ghi đo cho nó"""
+    rules, GT, KL = SHAPES[shape](n, rng)
+    text_path = Path(workdir) / f"{shape}_{n}.txt"
+    snapshot_path = text_path.with_suffix('.kbs')
+    write_rules_file(text_path, rules, GT, KL)
+    KnowledgeBase(rules, GT, KL).save(snapshot_path)
+    base = {'shape': shape, 'rules': n}
+
+    def record(op, seconds, status='ok', **extra):
+        return {**base, 'op': op, **extra, 'seconds': round(seconds, 6), 'status': status}
+
+    def load(path):
+        kb = KnowledgeBase()
+        kb.results = None  # đo thời gian suy diễn thật, không trả lời từ bộ đệm
+        kb.load(path)
+        return kb
+
+    seconds, kb, _ = measure(lambda cancel: load(text_path), repeat)
+    yield record('load_text', seconds)
+    seconds, _, _ = measure(lambda cancel: load(snapshot_path).compiled(), repeat)
+    yield record('load_snapshot', seconds)
+    seconds, compiled, _ = measure(lambda cancel: CompiledRuleBase.from_text_rules(kb.rules), repeat)
+    yield record('compile', seconds)
+    seconds, G, _ = measure(lambda cancel: build_fpg(compiled), repeat)
+    yield record('build_fpg', seconds, edges=G.number_of_edges())
+    seconds, G, _ = measure(lambda cancel: build_rpg(compiled), repeat)
+    yield record('build_rpg', seconds, edges=G.number_of_edges())
+    del G
+    seconds, _, _ = measure(lambda cancel: FPGDistanceTable(compiled), repeat)
+    yield record('fpg_table', seconds)
+    seconds, _, _ = measure(lambda cancel: RPGReachTable(compiled), repeat)
+    yield record('rpg_table', seconds)
+    seconds, analysis, _ = measure(lambda cancel: analyze_rules(compiled, GT), repeat)
+    yield record('analyze', seconds, removed=len(analysis.removed), cycles=len(analysis.cycles))
+    del analysis
+
+    # Các lần suy diễn dùng bảng FPG/RPG đã dựng sẵn của kb như khi chạy thật
+    kb.fpg_table()
+    kb.rpg_table()
+    for strategy in FORWARD_STRATEGIES:
+        for agenda_type in AGENDA_TYPES:
+            seconds, res, status = measure(
+                lambda cancel: kb.forward(strategy=strategy, agenda_type=agenda_type,
+                                          verbosity='off', cancel=cancel), repeat, timeout)
+            yield record('forward', seconds, status, strategy=strategy, agenda=agenda_type,
+                         fired=len(res['fired']) if res else None,
+                         achieved=bool(res['achieved']) if res else None)
+
+    goal = min(KL)
+    for strategy in BACKWARD_STRATEGIES:
+        for tabled in (False, True):
+            mode = 'tabled' if tabled else 'plain'
+            if not tabled and n > plain_limit:
+                yield record('backward', 0.0, 'skipped', strategy=strategy, mode=mode)
+                continue
+            seconds, res, status = measure(
+                lambda cancel: kb.backward(goal, strategy=strategy, tabled=tabled,
+                                           verbosity='off', cancel=cancel), repeat, timeout)
+            yield record('backward', seconds, status, strategy=strategy, mode=mode,
+                         success=res['success'] if res else None)
+    seconds, res, status = measure(
+        lambda cancel: kb.backward(goal, strategy='best', verbosity='off', cancel=cancel), repeat, timeout)
+    yield record('backward', seconds, status, strategy='best', mode='best-first',
+                 success=res['success'] if res else None,
+                 proof=len(res['proof']) if res else None, optimal=res['optimal'] if res else None)
+    goals = sorted({rule['right'] for rule in list(kb.rules.values())[-MULTI_GOALS:]})
+    seconds, res, status = measure(
+        lambda cancel: kb.backward_all(goals, verbosity='off', cancel=cancel, proofs=False), repeat, timeout)
+    yield record('backward', seconds, status, strategy='min', mode='all-goals', goals=len(goals),
+                 proven=sum(r['success'] for r in res['results'].values()) if res else None,
+                 subgoals=res['subgoals'] if res else None)
+
+    # Trả lời lại cùng truy vấn từ bộ đệm kết quả (lần đầu nạp bộ đệm không được tính)
+    kb.results = ResultCache()
+    seconds, res, status = measure(lambda cancel: kb.forward(verbosity='off', cancel=cancel), 1, timeout)
+    if status == 'ok':
+        seconds, res, status = measure(lambda cancel: kb.forward(verbosity='off', cancel=cancel), repeat, timeout)
+    yield record('forward', seconds, status, strategy='min', agenda='queue', mode='cached',
+                 fired=len(res['fired']) if res else None)
+    kb.results = None
+
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                             cwd=Path(__file__).parent, timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# ============ SO SÁNH ============
+def record_key(rec):
+    return tuple((k, rec[k]) for k in ('shape', 'rules', 'op', 'strategy', 'agenda', 'mode') if k in rec)
+
+
+def read_records(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return {record_key(rec): rec for rec in map(json.loads, filter(str.strip, f)) if 'meta' not in rec}
+
+
+def compare(old_path, new_path, threshold, out):
+    """In tỉ lệ thời gian mới/cũ của các phép đo chung; trả về số phép đo chậm đi quá threshold lần"""
+    old, new = read_records(old_path), read_records(new_path)
+    regressions = 0
+    for key in sorted(old.keys() & new.keys(), key=str):
+        a, b = old[key], new[key]
+        if a['status'] != 'ok' or b['status'] != 'ok':
+            ratio_text = f"{a['status']} -> {b['status']}"
+        else:
+            ratio = b['seconds'] / a['seconds'] if a['seconds'] > 0 else float('inf')
+            slower = ratio > threshold and b['seconds'] - a['seconds'] > 1e-3
+            regressions += slower
+            ratio_text = f"{ratio:6.2f}x" + ("  << chậm hơn" if slower else "")
+        name = ' '.join(str(v) for _, v in key)
+        out.write(f"{name:<45} {a['seconds']:>10.4f} {b['seconds']:>10.4f}  {ratio_text}\n")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Đo hiệu năng suy diễn trên các tập luật tổng hợp")
+    parser.add_argument('--shapes', nargs='+', choices=list(SHAPES), default=list(SHAPES),
+                        help="các dạng tập luật (mặc định: tất cả)")
+    parser.add_argument('--sizes', nargs='+', type=int, default=[100, 1000, 10000],
+                        help="số luật của mỗi tập (mặc định: 100 1000 10000)")
+    parser.add_argument('--repeat', type=int, default=3, help="số lần chạy mỗi phép đo, lấy nhanh nhất (mặc định: 3)")
+    parser.add_argument('--timeout', type=float, default=60.0,
+                        help="giới hạn giây cho mỗi lần suy diễn (mặc định: 60)")
+    parser.add_argument('--plain-limit', type=int, default=1000,
+                        help="bỏ qua suy diễn lùi đệ quy khi số luật lớn hơn (mặc định: 1000)")
+    parser.add_argument('--seed', type=int, default=0, help="hạt giống sinh tập luật (mặc định: 0)")
+    parser.add_argument('-o', '--output', default='-', help="file kết quả JSONL ('-' để ghi ra stdout)")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="so sánh hai file kết quả")
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help="tỉ lệ chậm đi bị coi là hồi quy khi so sánh (mặc định: 1.2)")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        regressions = compare(*args.compare, args.threshold, sys.stdout)
+        if regressions:
+            print(f"{regressions} phép đo chậm hơn {args.threshold} lần", file=sys.stderr)
+        return 1 if regressions else 0
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        meta = {'python': platform.python_version(), 'platform': platform.platform(), 'commit': git_commit(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'seed': args.seed, 'repeat': args.repeat}
+        out.write(json.dumps({'meta': meta}) + '\n')
+        for rec in bench_startup(args.repeat):
+            out.write(json.dumps(rec) + '\n')
+            out.flush()
+        with tempfile.TemporaryDirectory() as workdir:
+            for shape in args.shapes:
+                for n in args.sizes:
+                    rng = random.Random(f"{args.seed}:{shape}:{n}")
+                    for rec in bench_rule_base(shape, n, rng, workdir, args.repeat, args.timeout,
+                                               args.plain_limit):
+                        out.write(json.dumps(rec) + '\n')
+                        out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
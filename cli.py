@@ -0,0 +1,360 @@
+"""Chạy suy diễn hàng loạt từ dòng lệnh, không cần giao diện.
+
+Mỗi dòng của file truy vấn (JSONL) là một đối tượng JSON, ví dụ:
+
+    {"id": 1, "mode": "forward", "gt": ["a", "b", "c"], "kl": ["r"], "strategy": "fpg", "agenda": "queue"}
+    {"id": 2, "mode": "backward", "gt": "a, b, c", "goal": "r", "strategy": "min", "tabled": true}
+    {"id": 3, "mode": "batch", "gts": [["a", "b"], "a, c"], "kl": ["r"]}
+
+Thiếu gt/kl thì dùng GT/KL trong file luật. Truy vấn có thể đặt "verbosity"
+('off'/'summary'/'steps'/'full') để ghi đè mức vết của --trace. Truy vấn suy diễn
+tiến có thể đặt "prune": true (chỉ xét các luật có thể dẫn tới KL) và
+"stop_early": true (dừng khi đã suy ra mọi fact của KL). Truy vấn "batch" suy
+diễn tiến cùng lúc cho mọi tập trong "gts" (cần numpy, không ghi vết) và trả
+về "achieved" theo thứ tự các tập. Truy vấn suy diễn lùi với "strategy": "best"
+tìm chứng minh ít luật nhất bằng A* (giới hạn bằng "max_nodes", "max_open") và
+trả thêm "dag" (mục tiêu -> các tiền đề) cùng "optimal". Truy vấn suy diễn lùi
+với "goals" (danh sách hoặc chuỗi; rỗng là mọi fact của KL) chứng minh mọi mục
+tiêu trong một lượt, dùng chung bảng mục tiêu con, và trả về "results" (mục
+tiêu -> success, proof), "proof" chung (hợp các chứng minh) cùng "success" khi
+mọi mục tiêu đều đạt; "proofs": false bỏ proof riêng của từng mục tiêu:
+
+    {"id": 4, "mode": "backward", "goals": ["r", "s"], "strategy": "fpg"}
+
+Kết quả được ghi ra JSONL theo
+đúng thứ tự truy vấn, mỗi truy vấn một dòng, ngay khi có kết quả:
+
+    python cli.py queries.jsonl -r rules.txt -o results.jsonl
+
+File luật có thể là dạng văn bản, JSON (rules.json) hoặc snapshot nhị phân
+(.kbs) tạo bằng --save-snapshot; snapshot nạp nhanh nhất với tập luật lớn:
+
+    python cli.py -r rules.txt --save-snapshot rules.kbs
+
+--apply áp dụng một file thay đổi JSONL (mỗi dòng một thay đổi, xem
+KnowledgeBase.apply) vào file luật như một giao dịch duy nhất:
+
+    {"op": "set", "id": "17", "left": "a^b", "right": "d"}
+    {"op": "delete", "id": "3"}
+
+-j/--workers chạy các truy vấn song song trên nhiều tiến trình, mỗi tác vụ
+một khối --chunk-size truy vấn; kết quả vẫn theo đúng thứ tự truy vấn:
+
+    python cli.py queries.jsonl -r rules.kbs -j 8 -o results.jsonl
+
+--stats (hoặc "stats": true trong truy vấn) kèm "stats" trong kết quả suy diễn
+tiến/lùi: các bộ đếm (luật đã xét, tiền đề đã kiểm tra, lần tính heuristic,
+lần duyệt đồ thị, quay lui, sự kiện/byte vết, trúng bộ đệm) và thời gian từng pha (giây).
+--profile PATH chạy cả lô dưới cProfile (chỉ khi -j 1), ghi kết quả cho pstats
+vào PATH và in các hàm tốn thời gian nhất ra stderr:
+
+    python cli.py queries.jsonl -r rules.txt --stats --profile run.prof
+
+--analyze in ra stderr báo cáo các luật thừa (trùng, bị bao hàm, suy ra được
+từ luật khác, luật chết), chu trình FPG và tốc độ suy diễn trên tập luật rút
+gọn; --save-reduced ghi tập luật rút gọn ra file. --reduced (hoặc "reduced":
+true trong truy vấn) suy diễn trên tập luật rút gọn:
+
+    python cli.py queries.jsonl -r rules.txt --analyze --reduced
+
+Kết quả suy diễn tiến/lùi được nhớ trong bộ đệm LRU (--cache-size mục, theo
+nội dung tập luật và các tham số truy vấn) nên các truy vấn lặp lại được trả
+lời ngay; --cache PATH thêm tầng lưu trên đĩa (sqlite) dùng chung giữa các lần
+chạy, --no-cache tắt bộ đệm. Với --stats, số lần trúng/trượt được in ra stderr:
+
+    python cli.py queries.jsonl -r rules.txt --cache results.cache --stats
+"""
+import argparse
+import cProfile
+import json
+import multiprocessing
+import os
+import pstats
+import sys
+
+from inference_core import (InferenceStats, KnowledgeBase, RESULT_CACHE_SIZE, ResultCache, RuleFileError, RuleStore,
+                            TRACE_LEVELS, parse_facts, parse_goals, rule_order)
+
+
+def as_facts(value, default):
+    """Đọc tập fact từ JSON: danh sách hoặc chuỗi 'a, b, c'; None thì dùng mặc định"""
+    if value is None:
+        return set(default)
+    if isinstance(value, str):
+        return parse_facts(value)
+    return set(value)
+
+
+def as_goals(value):
+    """Đọc danh sách mục tiêu từ JSON: danh sách hoặc chuỗi 'r, s'; giữ thứ tự nhập, bỏ trùng"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return parse_goals(value)
+    return list(dict.fromkeys(value))
+
+
+def sort_proof(proof):
+    """Chứng minh (mục tiêu -> luật) theo thứ tự luật"""
+    return {g: r for g, r in sorted(proof.items(), key=lambda x: rule_order(x[1]))}
+
+
+def run_query(kb, query, trace=None, stats=False, reduced=False):
+    """Thực hiện một truy vấn trên cơ sở tri thức kb, trả về dict kết quả (JSON được).
+    trace: mức chi tiết vết kèm trong kết quả; None/'off' thì không ghi vết.
+    stats: kèm thống kê InferenceStats của truy vấn (truy vấn có thể ghi đè bằng "stats").
+    reduced: suy diễn trên tập luật rút gọn (truy vấn có thể ghi đè bằng "reduced").
+    """
+    if trace:
+        trace = query.get('verbosity', trace)
+    if trace == 'off':
+        trace = None
+    lines = [] if trace else None
+    emit = lines.append if trace else None
+    stats = InferenceStats() if query.get('stats', stats) else None
+    reduced = bool(query.get('reduced', reduced))
+
+    mode = query.get('mode', 'forward')
+    strategy = query.get('strategy', 'min')
+    GT = as_facts(query.get('gt'), kb.GT)
+    result = {'id': query.get('id'), 'mode': mode, 'strategy': strategy}
+
+    if mode == 'forward':
+        KL = as_facts(query.get('kl'), kb.KL)
+        agenda_type = query.get('agenda', 'queue')
+        res = kb.forward(GT, KL, strategy, agenda_type, emit=emit, verbosity=trace or 'off',
+                         prune=bool(query.get('prune', False)),
+                         stop_early=bool(query.get('stop_early', False)), stats=stats, reduced=reduced)
+        result.update({
+            'agenda': agenda_type,
+            'facts': sorted(res['facts']),
+            'fired': res['fired'],
+            'achieved': sorted(res['achieved']),
+        })
+    elif mode == 'backward' and 'goals' in query:
+        goals = as_goals(query['goals']) or sorted(as_facts(query.get('kl'), kb.KL))
+        if not goals:
+            raise ValueError("thiếu mục tiêu (goals) và KL")
+        res = kb.backward_all(goals, GT, strategy, emit=emit, verbosity=trace or 'off', stats=stats,
+                              max_nodes=query.get('max_nodes'), max_open=query.get('max_open'), reduced=reduced,
+                              proofs=bool(query.get('proofs', True)))
+        results = {}
+        for goal, res_goal in res['results'].items():
+            results[goal] = {'success': res_goal['success']}
+            if 'proof' in res_goal:
+                results[goal]['proof'] = sort_proof(res_goal['proof'])
+            if 'dag' in res_goal:
+                results[goal].update({'optimal': res_goal['optimal'], 'dag': dict(sorted(res_goal['dag'].items()))})
+        result.update({'goals': res['goals'], 'success': res['success'], 'results': results,
+                       'subgoals': res['subgoals']})
+        if 'proof' in res:
+            result['proof'] = sort_proof(res['proof'])
+    elif mode == 'backward':
+        goal = query.get('goal')
+        if not goal:
+            KL = sorted(as_facts(query.get('kl'), kb.KL))
+            if not KL:
+                raise ValueError("thiếu mục tiêu (goal) và KL")
+            goal = KL[0]
+        res = kb.backward(goal, GT, strategy, tabled=bool(query.get('tabled', False)), emit=emit,
+                          verbosity=trace or 'off', stats=stats,
+                          max_nodes=query.get('max_nodes'), max_open=query.get('max_open'), reduced=reduced)
+        result.update({
+            'goal': goal,
+            'success': res['success'],
+            'proof': sort_proof(res['proof']),
+        })
+        if 'dag' in res:
+            result.update({'optimal': res['optimal'], 'dag': dict(sorted(res['dag'].items()))})
+    elif mode == 'batch':
+        KL = as_facts(query.get('kl'), kb.KL)
+        gts = [as_facts(gt, ()) for gt in query.get('gts') or ()]
+        result['achieved'] = [sorted(achieved) for achieved in kb.forward_batch(gts, KL, reduced=reduced)]
+    else:
+        raise ValueError(f"mode không hợp lệ: {mode}")
+
+    if stats is not None and mode != 'batch':
+        result['stats'] = stats.as_dict()
+    if trace:
+        result['trace'] = ''.join(lines)
+    return result
+
+
+def read_queries(lines):
+    """Sinh (lineno, truy vấn) cho từng dòng không trống; dòng JSON hỏng cho ValueError thay cho truy vấn"""
+    for lineno, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield lineno, json.loads(line)
+        except ValueError as e:
+            yield lineno, ValueError(str(e))
+
+
+def answer(kb, lineno, query, trace=None, stats=False, reduced=False):
+    """Trả lời một truy vấn của read_queries, trả về (dict kết quả, có lỗi hay không)"""
+    try:
+        if isinstance(query, ValueError):
+            raise query
+        return run_query(kb, query, trace, stats, reduced), False
+    except (ValueError, KeyError, TypeError, AttributeError, ImportError, RecursionError) as e:
+        query_id = query.get('id') if isinstance(query, dict) else None
+        message = str(e)
+        if isinstance(e, RecursionError):
+            # suy diễn lùi đệ quy (không tabled) trên chuỗi luật quá sâu
+            message = f"chuỗi suy diễn quá sâu cho suy diễn lùi đệ quy, hãy dùng \"tabled\": true ({e})"
+        return {'id': query_id, 'line': lineno, 'error': message}, True
+
+
+# Trạng thái chỉ đọc của tiến trình con: (kb, trace, stats, reduced)
+_worker_state = None
+
+
+def _init_worker(state):
+    global _worker_state
+    _worker_state = state
+
+
+def _answer_chunk(chunk):
+    kb, trace, stats, reduced = _worker_state
+    return [answer(kb, lineno, query, trace, stats, reduced) for lineno, query in chunk]
+
+
+def run_parallel(kb, numbered, trace=None, workers=None, chunk_size=64, stats=False, reduced=False):
+    """Trả lời các truy vấn (lineno, truy vấn) trên pool tiến trình, sinh kết quả theo đúng thứ tự.
+    Tập luật biên dịch và các bảng FPG/RPG mà các truy vấn cần được dựng một
+    lần ở tiến trình chính trước khi tạo pool. Với fork, tiến trình con kế thừa
+    chúng như trạng thái chỉ đọc (copy-on-write) thay vì nhận qua pickle theo
+    từng tác vụ; nơi không có fork chúng được gửi một lần khi khởi tạo mỗi
+    tiến trình con. Mỗi tác vụ là một khối chunk_size truy vấn.
+    """
+    global _worker_state
+    queries = [query for _, query in numbered if isinstance(query, dict)]
+    strategies = {query.get('strategy', 'min') for query in queries}
+    kb.compiled()
+    variants = {bool(query.get('reduced', reduced)) for query in queries}
+    if True in variants:
+        kb.reduced()
+    for variant in variants:
+        if 'fpg' in strategies:
+            kb.fpg_table(variant)
+        if 'rpg' in strategies:
+            kb.rpg_table(variant)
+    chunks = [numbered[i:i + chunk_size] for i in range(0, len(numbered), chunk_size)]
+    
+    if 'fork' in multiprocessing.get_all_start_methods():
+        _worker_state = (kb, trace, stats, reduced)
+        pool = multiprocessing.get_context('fork').Pool(workers)
+    else:
+        pool = multiprocessing.Pool(workers, _init_worker, ((kb, trace, stats, reduced),))
+    try:
+        with pool:
+            for answers in pool.imap(_answer_chunk, chunks):
+                yield from answers
+    finally:
+        _worker_state = None
+
+
+def run_batch(kb, queries, out, trace=None, workers=1, chunk_size=64, stats=False, reduced=False):
+    """Đọc từng dòng truy vấn JSONL, ghi từng dòng kết quả; trả về số truy vấn lỗi.
+    workers > 1 chạy song song bằng run_parallel (đọc hết các truy vấn trước).
+    """
+    numbered = read_queries(queries)
+    if workers > 1:
+        answers = run_parallel(kb, list(numbered), trace, workers, chunk_size, stats, reduced)
+    else:
+        answers = (answer(kb, lineno, query, trace, stats, reduced) for lineno, query in numbered)
+    errors = 0
+    for result, failed in answers:
+        errors += failed
+        out.write(json.dumps(result, ensure_ascii=False) + '\n')
+    out.flush()
+    return errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Suy diễn tiến/lùi hàng loạt từ file truy vấn JSONL")
+    parser.add_argument('queries', nargs='?', help="file truy vấn JSONL ('-' để đọc từ stdin)")
+    parser.add_argument('-r', '--rules', default='rules.txt',
+                        help="file luật .txt/.json hoặc snapshot .kbs (mặc định: rules.txt)")
+    parser.add_argument('--apply', metavar='CHANGES',
+                        help="áp dụng file thay đổi JSONL vào file luật trong một giao dịch")
+    parser.add_argument('--save-snapshot', metavar='PATH', help="ghi snapshot nhị phân của tập luật đã nạp")
+    parser.add_argument('-o', '--output', default='-', help="file kết quả JSONL ('-' để ghi ra stdout)")
+    parser.add_argument('--trace', nargs='?', const='full', choices=list(TRACE_LEVELS),
+                        help="kèm vết suy diễn trong mỗi kết quả với mức chi tiết cho trước (mặc định: full)")
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help="số tiến trình chạy truy vấn song song (mặc định: 1; 0 = số CPU)")
+    parser.add_argument('--chunk-size', type=int, default=64,
+                        help="số truy vấn trong mỗi tác vụ gửi cho tiến trình con (mặc định: 64)")
+    parser.add_argument('--stats', action='store_true',
+                        help="kèm bộ đếm và thời gian từng pha suy diễn trong mỗi kết quả")
+    parser.add_argument('--profile', metavar='PATH',
+                        help="chạy các truy vấn dưới cProfile và ghi kết quả (pstats) vào PATH")
+    parser.add_argument('--analyze', action='store_true',
+                        help="in ra stderr báo cáo các luật thừa, chu trình FPG và tốc độ trên tập luật rút gọn")
+    parser.add_argument('--save-reduced', metavar='PATH', help="ghi tập luật rút gọn (bỏ các luật thừa)")
+    parser.add_argument('--reduced', action='store_true', help="suy diễn trên tập luật rút gọn")
+    parser.add_argument('--cache', metavar='PATH', help="lưu bộ đệm kết quả trên đĩa (sqlite) ở PATH")
+    parser.add_argument('--cache-size', type=int, default=RESULT_CACHE_SIZE,
+                        help=f"số kết quả giữ trong bộ đệm trong bộ nhớ (mặc định: {RESULT_CACHE_SIZE})")
+    parser.add_argument('--no-cache', action='store_true', help="không dùng bộ đệm kết quả")
+    args = parser.parse_args(argv)
+
+    if args.queries is None and not (args.save_snapshot or args.apply or args.analyze or args.save_reduced):
+        parser.error("cần file truy vấn, --apply, --save-snapshot, --analyze hoặc --save-reduced")
+    if args.workers < 0 or args.chunk_size < 1 or args.cache_size < 0:
+        parser.error("--workers, --cache-size phải >= 0 và --chunk-size phải >= 1")
+    workers = args.workers or os.cpu_count() or 1
+    if args.profile and workers > 1:
+        parser.error("--profile chỉ dùng được với -j 1")
+
+    kb = KnowledgeBase()
+    kb.results = None if args.no_cache else ResultCache(args.cache_size, args.cache)
+    store = RuleStore(kb, args.rules)
+    try:
+        store.load()
+        if args.apply:
+            with open(args.apply, 'r', encoding='utf-8') as f:
+                changes = [json.loads(line) for line in f if line.strip()]
+            store.apply(changes)
+            store.wait()
+    except (RuleFileError, ValueError, OSError) as e:
+        print(e, file=sys.stderr)
+        return 2
+    if args.save_snapshot:
+        kb.save(args.save_snapshot)
+    if args.analyze:
+        print(kb.analysis().format(kb.measure_reduction()), file=sys.stderr)
+    if args.save_reduced:
+        KnowledgeBase(kb.analysis().reduced_rules(kb.rules), kb.GT, kb.KL).save(args.save_reduced)
+    if args.queries is None:
+        return 0
+
+    queries = sys.stdin if args.queries == '-' else open(args.queries, 'r', encoding='utf-8')
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    profiler = cProfile.Profile() if args.profile else None
+    try:
+        if profiler is not None:
+            profiler.enable()
+        errors = run_batch(kb, queries, out, args.trace, workers, args.chunk_size, args.stats, args.reduced)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(20)
+        if queries is not sys.stdin:
+            queries.close()
+        if out is not sys.stdout:
+            out.close()
+
+    if args.stats and kb.results is not None and workers == 1:
+        print(kb.results.format(), file=sys.stderr)
+    if errors:
+        print(f"{errors} truy vấn lỗi", file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2992 @@
+"""Lõi suy diễn không phụ thuộc giao diện (không dùng Tk hay matplotlib).
+
+Gồm mô hình luật (đọc/ghi file luật), suy diễn tiến, suy diễn lùi và các
+heuristic FPG/RPG. Giao diện Tk (app.py) và công cụ dòng lệnh (cli.py) đều
+gọi vào module này.
+
+Các bộ suy diễn ghi vết qua tham số emit: hàm nhận một chuỗi (một dòng vết);
+emit=None nghĩa là không ghi vết. Vết là các sự kiện có cấu trúc (loại sự
+kiện + dữ liệu, xem TRACE_EVENTS) chỉ được định dạng thành chuỗi khi mức chi
+tiết verbosity ('off' / 'summary' / 'steps' / 'full') cho phép hiển thị.
+Tham số cancel (hàm không đối số) được kiểm tra sau mỗi bước; trả về True thì
+bộ suy diễn dừng bằng InferenceCancelled. Tham số stats (InferenceStats) nhận
+các bộ đếm và thời gian theo pha của lần suy diễn.
+
+Các heuristic FPG/RPG chỉ dùng chỉ mục của CompiledRuleBase (Python thuần).
+networkx (dựng đồ thị để vẽ) và numpy (forward_batch) chỉ được nạp khi gọi
+tới các hàm cần chúng, nên nạp module này không kéo theo hai thư viện đó.
+"""
+from array import array
+from bisect import bisect_left
+from collections import ChainMap, OrderedDict, deque
+import copy
+import hashlib
+import heapq
+import json
+import os
+import pickle
+import re
+import struct
+import sys
+import threading
+from pathlib import Path
+from time import perf_counter
+
+
+class InferenceCancelled(Exception):
+    """Suy diễn bị hủy giữa chừng (hàm cancel trả về True hoặc emit ném ra)"""
+
+
+# ============ VẾT SUY DIỄN ============
+TRACE_OFF, TRACE_SUMMARY, TRACE_STEPS, TRACE_FULL = range(4)
+TRACE_LEVELS = {'off': TRACE_OFF, 'summary': TRACE_SUMMARY, 'steps': TRACE_STEPS, 'full': TRACE_FULL}
+
+# loại sự kiện -> mẫu định dạng; {indent} được tính từ depth khi định dạng
+TRACE_EVENTS = {
+    'fwd_start': "=== SUY DIỄN TIẾN ===\nGT ban đầu: {facts}\nChiến lược: {strategy}\nTập THOA: {agenda}\n\n",
+    'fwd_pruned': "→ Chỉ xét {used}/{total} luật có thể dẫn tới KL\n\n",
+    'fwd_h': "  → {label}: {values}\n",
+    'fwd_fire': "Bước {step}: Áp dụng luật r{rule} ({premises} → {conclusion})\n   Suy ra: {conclusion}\n",
+    'fwd_facts': "   Tập facts mới: {facts}\n",
+    'fwd_step_end': "\n",
+    'fwd_goal': "🎯 Đã đạt được kết luận: {fact}\n\n",
+    'fwd_stop': "→ Đã suy ra mọi fact của KL, dừng sớm\n",
+    'fwd_final': "\n✅ Tập fact cuối cùng: {facts}\n",
+    'fwd_achieved': "✅ Đã đạt KL: {achieved}\n",
+    'fwd_not_achieved': "❌ Chưa đạt KL: {KL}\n",
+    'bwd_build_fpg': "→ Xây dựng đồ thị FPG...\n",
+    'bwd_start': "=== SUY DIỄN LÙI ===\nGT ban đầu: {facts}\nMục tiêu: {goal}\nChiến lược: {strategy}\n\n",
+    'bwd_proof_rules': "\nCác luật trong chứng minh: {rules}\n",
+    'bwd_success': "\n✅ THÀNH CÔNG: Đã chứng minh được {goal}\n",
+    'bwd_failure': "\n❌ THẤT BẠI: Không thể chứng minh {goal}\n",
+    'bwd_multi_start': "=== SUY DIỄN LÙI NHIỀU MỤC TIÊU ===\nGT ban đầu: {facts}\nCác mục tiêu ({total}): {goals}\nChiến lược: {strategy}\n\n",
+    'bwd_multi_goal': "\n--- Mục tiêu {n}/{total}: {goal} ---\n",
+    'bwd_multi_done': "\n=== Đã chứng minh {proven}/{total} mục tiêu ({subgoals} mục tiêu con được ghi nhớ dùng chung) ===\n",
+    'bwd_multi_failed': "❌ Không chứng minh được: {goals}\n",
+    'bwd_goal': "{indent}→ Cần chứng minh: {goal}\n",
+    'bwd_in_gt': "{indent}  ✓ {goal} đã có trong GT\n",
+    'bwd_memo_proven': "{indent}  ✓ {goal} đã được chứng minh trước đó (r{rule})\n",
+    'bwd_memo_failed': "{indent}  ✗ {goal} đã thất bại trước đó\n",
+    'bwd_memo_tentative': "{indent}  ✗ {goal} đã thất bại tạm thời trong cùng chu trình\n",
+    'bwd_reopen': "{indent}↻ Giải lại {goal}: một mục tiêu từng bị giả định thất bại đã chứng minh được\n",
+    'bwd_cycle': "{indent}  ✗ {goal} đang được chứng minh ở tầng trên (chu trình)\n",
+    'bwd_no_rule': "{indent}  ✗ Không có luật nào suy ra {goal}\n",
+    'bwd_h': "{indent}→ h(r,GT) values: {values}\n",
+    'bwd_try': "{indent}  • Thử luật r{rule}: {premises} → {conclusion}\n",
+    'bwd_premise_failed': "{indent}    ✗ Thất bại khi chứng minh tiền đề {premise} của r{rule}\n",
+    'bwd_proved': "{indent}  ✓ Chứng minh thành công {goal} bằng r{rule}\n",
+    'bwd_backtrack': "{indent}  ✗ Quay lui từ r{rule}\n",
+    'bwd_exhausted': "{indent}✗ Đã thử hết luật, không chứng minh được {goal}\n",
+    'bwd_best_start': "→ Tìm kiếm best-first (A*): cần ít nhất {bound} luật (tối đa {nodes} trạng thái, giữ {limit} trạng thái chờ)\n",
+    'bwd_best_unprovable': "  ✗ {goal} không suy ra được từ GT theo bất kỳ luật nào\n",
+    'bwd_best_expand': "  • Trạng thái #{node}: đã dùng {cost} luật, f = {bound}; chọn luật cho {goal}, mục tiêu mở: {open}\n",
+    'bwd_best_rule': "    + r{rule} cho {goal} → f = {bound}\n",
+    'bwd_best_dropped': "  → Vượt giới hạn bộ nhớ: bỏ {dropped} trạng thái chờ kém nhất\n",
+    'bwd_best_budget': "  → Đã mở hết {nodes} trạng thái cho phép\n",
+    'bwd_best_found': "→ Chứng minh gồm {size} luật ({optimal}) sau {nodes} trạng thái\n",
+    'bwd_best_fallback': "→ Dùng chứng minh gần đúng gồm {size} luật (chưa chắc tối ưu)\n",
+}
+
+
+def trace_level(verbosity):
+    """Đổi tên mức chi tiết ('off'/'summary'/'steps'/'full') hoặc số sang số"""
+    if isinstance(verbosity, int):
+        return verbosity
+    try:
+        return TRACE_LEVELS[verbosity]
+    except KeyError:
+        raise ValueError(f"mức chi tiết vết không hợp lệ: {verbosity}") from None
+
+
+class Tracer:
+    """Ghi vết theo mức chi tiết. Bộ suy diễn kiểm tra các cờ summary/steps/full
+    trước khi tạo sự kiện nên mức bị tắt không tốn chi phí định dạng nào.
+    Tracer cũng mang InferenceStats (nếu có) qua các lời gọi đệ quy.
+    """
+    __slots__ = ('emit', 'level', 'summary', 'steps', 'full', 'stats')
+    
+    def __init__(self, emit=None, verbosity='full', stats=None):
+        self.emit = emit
+        self.stats = stats
+        self.level = trace_level(verbosity) if emit is not None else TRACE_OFF
+        self.summary = self.level >= TRACE_SUMMARY
+        self.steps = self.level >= TRACE_STEPS
+        self.full = self.level >= TRACE_FULL
+    
+    @classmethod
+    def of(cls, emit, verbosity='full', stats=None):
+        """emit có thể đã là Tracer (khi gọi đệ quy) hoặc hàm nhận chuỗi"""
+        return emit if isinstance(emit, cls) else cls(emit, verbosity, stats)
+    
+    def event(self, kind, **data):
+        """Định dạng sự kiện theo TRACE_EVENTS rồi ghi ra emit.
+        Tập fact được in theo thứ tự đã sắp để vết không phụ thuộc thứ tự băm.
+        """
+        start = perf_counter()
+        if 'depth' in data:
+            data['indent'] = "  " * data['depth']
+        for key, value in data.items():
+            if isinstance(value, (set, frozenset)) and value:
+                data[key] = '{' + ', '.join(map(repr, sorted(value))) + '}'
+        text = TRACE_EVENTS[kind].format(**data)
+        self.emit(text)
+        stats = self.stats
+        if stats is not None:
+            stats.trace_events += 1
+            stats.trace_bytes += len(text.encode('utf-8'))
+            stats.add_time('trace', perf_counter() - start)
+
+
+# ============ THỐNG KÊ SUY DIỄN ============
+STATS_COUNTERS = {
+    'rules_examined': "Luật được xét",
+    'premises_checked': "Tiền đề được kiểm tra",
+    'heuristic_evals': "Lần tính heuristic",
+    'graph_traversals': "Lần duyệt đồ thị",
+    'backtracks': "Lần quay lui",
+    'trace_events': "Dòng vết",
+    'trace_bytes': "Byte vết",
+    'cache_hits': "Trúng bộ đệm",
+}
+STATS_PHASES = {
+    'total': "tổng",
+    'prepare': "chuẩn bị",
+    'select': "chọn luật",
+    'propagate': "lan truyền",
+    'search': "tìm kiếm",
+    'heuristic': "heuristic",
+    'trace': "ghi vết",
+}
+
+
+class InferenceStats:
+    """Bộ đếm và thời gian theo pha (giây) của một lần suy diễn.
+    Truyền qua tham số stats của forward_chain/prove; các bộ đếm xem
+    STATS_COUNTERS. Pha heuristic và trace nằm lồng trong các pha khác
+    (prepare/propagate/search) nên tổng các pha không bằng total.
+    """
+    def __init__(self):
+        for name in STATS_COUNTERS:
+            setattr(self, name, 0)
+        self.phases = {}
+    
+    def add_time(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+    
+    def timed(self, phase, fn, counter=None):
+        """Bọc fn để cộng thời gian chạy vào phase (và tăng counter mỗi lần gọi)"""
+        def wrapper(*args):
+            start = perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                self.add_time(phase, perf_counter() - start)
+                if counter is not None:
+                    setattr(self, counter, getattr(self, counter) + 1)
+        return wrapper
+    
+    def as_dict(self):
+        data = {name: getattr(self, name) for name in STATS_COUNTERS}
+        data['phases'] = {phase: round(seconds, 6) for phase, seconds in self.phases.items()}
+        return data
+    
+    def format(self):
+        """Tóm tắt hai dòng để hiển thị"""
+        counters = ' · '.join(f"{label}: {getattr(self, name)}" for name, label in STATS_COUNTERS.items())
+        phases = ' · '.join(f"{STATS_PHASES.get(phase, phase)} {self.phases[phase]:.4f} s"
+                            for phase in STATS_PHASES if phase in self.phases)
+        return f"{counters}\nThời gian: {phases}"
+
+
+def check_cancel(cancel):
+    if cancel is not None and cancel():
+        raise InferenceCancelled()
+
+
+# ============ TẬP THOA (AGENDA) ============
+class Agenda:
+    """Tập THOA dạng hàng đợi (FIFO) hoặc ngăn xếp (LIFO).
+    Thành viên được lưu song song trong một dict (giữ thứ tự thêm vào) để
+    kiểm tra `in` trong O(1); xóa bằng discard là xóa lười.
+    """
+    def __init__(self, lifo=False):
+        self.lifo = lifo
+        self.items = deque()
+        self.members = {}  # idx -> số thứ tự lần thêm
+        self.counter = 0
+    
+    def push(self, idx):
+        if idx in self.members:
+            return
+        self.counter += 1
+        self.members[idx] = self.counter
+        self._push_entry(idx, self.counter)
+    
+    def _push_entry(self, idx, seq):
+        self.items.append((seq, idx))
+    
+    def _pop_entry(self):
+        return self.items.pop() if self.lifo else self.items.popleft()
+    
+    def pop(self):
+        while self.items:
+            seq, idx = self._pop_entry()
+            if self.members.get(idx) == seq:
+                del self.members[idx]
+                return idx
+        raise IndexError("pop from empty agenda")
+    
+    def discard(self, idx):
+        self.members.pop(idx, None)
+    
+    def __contains__(self, idx):
+        return idx in self.members
+    
+    def __len__(self):
+        return len(self.members)
+    
+    def __iter__(self):
+        """Duyệt các luật theo thứ tự được thêm vào (như list(container) trước đây)."""
+        return iter(self.members)
+
+
+class PriorityAgenda(Agenda):
+    """Tập THOA dạng hàng đợi ưu tiên (heap) cho các chiến lược min/max/FPG/RPG.
+    priority: hàm idx -> khóa, luật có khóa nhỏ nhất được lấy trước; các luật
+    cùng khóa được lấy theo thứ tự thêm vào, giống min()/max() trên danh sách.
+    """
+    def __init__(self, priority):
+        super().__init__()
+        self.priority = priority
+        self.items = []
+    
+    def _push_entry(self, idx, seq):
+        heapq.heappush(self.items, (self.priority(idx), seq, idx))
+    
+    def _pop_entry(self):
+        _, seq, idx = heapq.heappop(self.items)
+        return seq, idx
+
+
+# ============ BẢNG KHOẢNG CÁCH FPG ============
+FPG_TABLE_TARGETS = 64  # số bảng khoảng cách theo đích giữ lại (LRU)
+
+
+class FPGDistanceTable:
+    """Khoảng cách trên đồ thị FPG của một CompiledRuleBase.
+    h(r) của heuristic FPG chỉ cần d(tiền đề, kết luận) của chính luật r nên
+    được tính thẳng từ danh sách tiền đề (rule_heuristic), không duyệt đồ thị.
+    Khoảng cách tổng quát d(f, đích) (distance) chạy một lần BFS ngược cho mỗi
+    đích và lưu kết quả dưới dạng hai mảng song song đã sắp theo mã fact:
+    (mã fact, khoảng cách); chỉ giữ FPG_TABLE_TARGETS đích dùng gần nhất.
+    Bảng dùng lại được cho tới khi tập luật thay đổi.
+    """
+    def __init__(self, rules, max_targets=FPG_TABLE_TARGETS):
+        self.rules = rules
+        self.max_targets = max_targets
+        self.tables = OrderedDict()  # mã đích -> (array mã fact, array khoảng cách), cũ nhất ở đầu
+        self.traversals = 0  # số lần BFS đã chạy
+    
+    def _in_graph(self, f):
+        rules = self.rules
+        if f >= len(rules.fact_index):
+            return False  # fact riêng của truy vấn (CompiledRuleBase.with_facts)
+        return bool(rules.fact_index[f]) or any(rules.rules[pos].premises for pos in rules.producers[f])
+    
+    def _table(self, target):
+        table = self.tables.get(target)
+        if table is not None:
+            self.tables.move_to_end(target)
+            return table
+        records, producers = self.rules.rules, self.rules.producers
+        dist = {}
+        self.traversals += 1
+        if self._in_graph(target):
+            dist[target] = 0
+            frontier = [target]
+            d = 0
+            while frontier:
+                d += 1
+                next_frontier = []
+                for node in frontier:
+                    for pos in producers[node]:
+                        for pred in records[pos].premises:
+                            if pred not in dist:
+                                dist[pred] = d
+                                next_frontier.append(pred)
+                frontier = next_frontier
+        pairs = sorted(dist.items())
+        table = (array('I', [i for i, _ in pairs]), array('I', [d for _, d in pairs]))
+        self.tables[target] = table
+        while len(self.tables) > self.max_targets:
+            self.tables.popitem(last=False)
+        return table
+    
+    def distance(self, start, target):
+        """Độ dài đường đi ngắn nhất start -> target (mã fact), inf nếu không có đường."""
+        ids, dists = self._table(target)
+        pos = bisect_left(ids, start)
+        if pos < len(ids) and ids[pos] == start:
+            return dists[pos]
+        return float('inf')
+    
+    def rule_heuristic(self, pos):
+        """max{d(f, kết luận) | f in tiền đề} của luật ở vị trí pos.
+        Chính luật tạo cung f -> kết luận nên d là 0 khi f là kết luận, còn lại
+        là 1; luật không có tiền đề cho inf.
+        """
+        r = self.rules.rules[pos]
+        if not r.premises:
+            return float('inf')
+        return max(0 if f == r.conclusion else 1 for f in r.premises)
+
+
+# ============ BẢNG KHẢ NĂNG ĐẠT TỚI TRÊN RPG ============
+class RPGReachTable:
+    """Số luật con cháu của mỗi luật trong RPG (như nx.descendants), tính một lần.
+    Cung r_i -> r_j khi kết luận của r_i là tiền đề của r_j (i != j).
+    Đồ thị được co theo thành phần liên thông mạnh (Tarjan, không đệ quy);
+    tập đỉnh đạt tới của mỗi thành phần là một bitset (int) được hợp từ các
+    thành phần kế tiếp theo thứ tự topo ngược.
+    """
+    def __init__(self, rules):
+        n = len(rules.rules)
+        succ = [[j for j in rules.fact_index[r.conclusion] if j != i]
+                for i, r in enumerate(rules.rules)]
+        
+        comp_of = [-1] * n
+        comp_bits = []   # bitset các đỉnh của từng thành phần
+        comp_reach = []  # bitset các đỉnh đạt tới được từ thành phần (ngoài chính nó)
+        comp_size = []
+        
+        index = [-1] * n
+        lowlink = [0] * n
+        on_stack = [False] * n
+        scc_stack = []
+        counter = 0
+        for root in range(n):
+            if index[root] != -1:
+                continue
+            work = [(root, 0)]
+            while work:
+                v, i = work.pop()
+                if i == 0:
+                    index[v] = lowlink[v] = counter
+                    counter += 1
+                    scc_stack.append(v)
+                    on_stack[v] = True
+                recurse = False
+                while i < len(succ[v]):
+                    w = succ[v][i]
+                    i += 1
+                    if index[w] == -1:
+                        work.append((v, i))
+                        work.append((w, 0))
+                        recurse = True
+                        break
+                    if on_stack[w]:
+                        lowlink[v] = min(lowlink[v], index[w])
+                if recurse:
+                    continue
+                if lowlink[v] == index[v]:
+                    # Tarjan sinh các thành phần theo thứ tự topo ngược nên
+                    # mọi thành phần kế tiếp đã có bitset đạt tới
+                    c = len(comp_bits)
+                    bits = 0
+                    members = []
+                    while True:
+                        w = scc_stack.pop()
+                        on_stack[w] = False
+                        comp_of[w] = c
+                        bits |= 1 << w
+                        members.append(w)
+                        if w == v:
+                            break
+                    reach = 0
+                    for u in members:
+                        for w in succ[u]:
+                            cw = comp_of[w]
+                            if cw != c:
+                                reach |= comp_reach[cw] | comp_bits[cw]
+                    comp_bits.append(bits)
+                    comp_reach.append(reach)
+                    comp_size.append(len(members))
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[v])
+        
+        self.counts = array('I', [comp_reach[comp_of[i]].bit_count() + comp_size[comp_of[i]] - 1
+                                  for i in range(n)])
+    
+    def descendants_count(self, pos):
+        """Số luật con cháu của luật ở vị trí pos"""
+        return self.counts[pos]
+
+
+class GoalFrame:
+    """Một mục tiêu đang được chứng minh trên ngăn xếp của suy diễn lùi có ghi nhớ"""
+    __slots__ = ('goal', 'depth', 'rules', 'rule_pos', 'premises', 'prem_pos', 'low', 'base', 'revised')
+    
+    def __init__(self, goal, depth, rules, base=0, revised=0):
+        self.goal = goal
+        self.depth = depth
+        self.rules = rules        # các luật suy ra goal, đã sắp theo chiến lược
+        self.rule_pos = 0
+        self.premises = None      # tiền đề của luật đang thử
+        self.prem_pos = 0
+        self.low = float('inf')   # vị trí nhỏ nhất trên ngăn xếp hoàn tất của mục tiêu mà kết quả phụ thuộc
+        self.base = base          # vị trí của goal trên ngăn xếp hoàn tất
+        self.revised = revised    # số lần giả định bị lật khi bắt đầu giải goal
+
+
+def rule_order(idx):
+    """Khóa sắp xếp số thứ tự luật (số thứ tự không phải số được coi là 0)."""
+    return int(idx) if str(idx).isdigit() else 0
+
+
+def extract_proof(goal, proven, rules):
+    """Lấy các luật thực sự nằm trong chứng minh của goal.
+    proven: dict mã mục tiêu -> vị trí luật đã chứng minh nó; rules: CompiledRuleBase.
+    Trả về dict tên mục tiêu -> số thứ tự luật.
+    """
+    return extract_proofs([goal], proven, rules)
+
+
+def extract_proofs(goals, proven, rules):
+    """Như extract_proof cho nhiều mục tiêu cùng lúc: hợp các chứng minh, mỗi
+    mục tiêu con chỉ được duyệt một lần.
+    """
+    proof = {}
+    pending = list(goals)
+    while pending:
+        g = pending.pop()
+        if g in proof or g not in proven:
+            continue
+        proof[g] = proven[g]
+        pending.extend(rules.rules[proven[g]].premises)
+    return {rules.fact_names[g]: rules.rules[pos].idx for g, pos in proof.items()}
+
+
+# ============ TẬP LUẬT ĐÃ BIÊN DỊCH ============
+
+
+class CompiledRule:
+    """Một luật đã biên dịch: tiền đề và kết luận là mã fact (số nguyên)"""
+    __slots__ = ('idx', 'order', 'premises', 'conclusion')
+    
+    def __init__(self, idx, premises, conclusion, order=None):
+        self.idx = idx                # số thứ tự luật (chuỗi, như trong file)
+        self.order = rule_order(idx) if order is None else order  # khóa sắp xếp theo số thứ tự
+        self.premises = premises      # frozenset mã fact
+        self.conclusion = conclusion  # mã fact
+
+
+class CompiledRuleBase:
+    """Tập luật đã biên dịch, dùng chung cho mọi bộ suy diễn và đồ thị.
+    Tên fact được intern thành mã số nguyên liên tiếp; luật được lưu theo vị
+    trí (thứ tự của dict luật) cùng các chỉ mục theo mã fact:
+    fact_index[f] là các vị trí luật có f ở vế trái, producers[f] là các vị
+    trí luật suy ra f. Sau khi biên dịch tập luật chỉ được đọc nên dùng chung
+    được giữa các luồng; fact chưa có (vd. trong GT của truy vấn) có mã riêng
+    của truy vấn qua with_facts().
+    """
+    def __init__(self):
+        self.fact_names = []   # mã -> tên
+        self.fact_ids = {}     # tên -> mã
+        self.rules = []        # vị trí -> CompiledRule
+        self.positions = {}    # số thứ tự luật -> vị trí
+        self.fact_index = []
+        self.producers = []
+    
+    @classmethod
+    def from_rules(cls, rules):
+        """Biên dịch dict idx -> (premises_set, conclusion)"""
+        compiled = cls()
+        for idx, (premises, conclusion) in rules.items():
+            compiled.add(idx, premises, conclusion)
+        return compiled
+    
+    @classmethod
+    def from_text_rules(cls, rules):
+        """Biên dịch dict idx -> {'left': 'a^b', 'right': 'c'} (dạng lưu trong file)"""
+        compiled = cls()
+        for idx, rule in rules.items():
+            # tách giữ thứ tự viết để mã fact (và thứ tự tiền đề) ổn định giữa các lần chạy
+            compiled.add(idx, [i.strip() for i in rule['left'].split('^') if i.strip()], rule['right'])
+        return compiled
+    
+    @classmethod
+    def from_arrays(cls, fact_names, rule_ids, arrays):
+        """Dựng lại từ các phần của snapshot (xem save_snapshot) mà không phải tách luật.
+        fact_names, rule_ids: chuỗi ngăn cách bởi '\\0'; arrays: tên phần -> dãy uint32
+        (orders: int64, -1 thì order được tính lại từ số thứ tự luật).
+        """
+        compiled = cls()
+        compiled.fact_names = [sys.intern(name) for name in fact_names.split('\0')] if fact_names else []
+        compiled.fact_ids = {name: i for i, name in enumerate(compiled.fact_names)}
+        
+        # tolist() một lần rồi cắt list nhanh hơn nhiều so với cắt memoryview
+        prem_offsets, prem_ids = arrays['prem_offsets'].tolist(), arrays['prem_ids'].tolist()
+        conclusions, orders = arrays['conclusions'].tolist(), arrays['orders'].tolist()
+        rule_ids = rule_ids.split('\0') if rule_ids else []
+        compiled.rules = [CompiledRule(idx, frozenset(prem_ids[prem_offsets[i]:prem_offsets[i + 1]]),
+                                       conclusions[i], orders[i] if orders[i] >= 0 else None)
+                          for i, idx in enumerate(rule_ids)]
+        compiled.positions = {idx: i for i, idx in enumerate(rule_ids)}
+        
+        def lists(offsets, values):
+            offsets, values = offsets.tolist(), values.tolist()
+            return [values[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+        compiled.fact_index = lists(arrays['index_offsets'], arrays['index_rules'])
+        compiled.producers = lists(arrays['prod_offsets'], arrays['prod_rules'])
+        return compiled
+    
+    def fact_id(self, name):
+        """Mã của fact name; KeyError nếu tập luật không có fact này (xem with_facts())"""
+        return self.fact_ids[name]
+    
+    def ids(self, names):
+        fact_ids = self.fact_ids
+        return {fact_ids[name] for name in names}
+    
+    def with_facts(self, names):
+        """Tập luật dùng cho một truy vấn nhắc tới các fact names: chính nó nếu mọi
+        fact đã có mã, ngược lại một bản sao nông riêng của truy vấn, trong đó các
+        fact chưa có được cấp mã tiếp theo (không luật nào dùng tới chúng). Tập
+        luật gốc không thay đổi nên không lớn dần theo các truy vấn.
+        """
+        fact_ids = self.fact_ids
+        unknown = [name for name in dict.fromkeys(names) if name not in fact_ids]
+        if not unknown:
+            return self
+        local = copy.copy(self)
+        local.fact_names = self.fact_names + unknown
+        local.fact_ids = ChainMap({name: fid for fid, name in enumerate(unknown, len(self.fact_names))}, fact_ids)
+        local.fact_index = self.fact_index + [[] for _ in unknown]
+        local.producers = self.producers + [[] for _ in unknown]
+        return local
+    
+    def _intern(self, name):
+        # chỉ dùng khi biên dịch (add()), trước khi tập luật được chia sẻ
+        fid = self.fact_ids.get(name)
+        if fid is None:
+            fid = len(self.fact_names)
+            name = sys.intern(name)
+            self.fact_names.append(name)
+            self.fact_index.append([])
+            self.producers.append([])
+            self.fact_ids[name] = fid
+        return fid
+    
+    def names(self, ids):
+        return {self.fact_names[i] for i in ids}
+    
+    def add(self, idx, premises, conclusion):
+        """Thêm luật idx vào cuối tập luật, trả về vị trí của luật"""
+        pos = len(self.rules)
+        rule = CompiledRule(idx, frozenset(self._intern(p) for p in premises), self._intern(conclusion))
+        self.rules.append(rule)
+        self.positions[idx] = pos
+        for p in rule.premises:
+            self.fact_index[p].append(pos)
+        self.producers[rule.conclusion].append(pos)
+        return pos
+    
+    def __len__(self):
+        return len(self.rules)
+    
+    def rules_dict(self):
+        """dict idx -> (premises_set, conclusion) theo tên fact"""
+        return {r.idx: (self.names(r.premises), self.fact_names[r.conclusion]) for r in self.rules}
+    
+    def text_rules(self):
+        """dict idx -> {'left': 'a^b', 'right': 'c'} (dạng lưu trong file); thứ tự tiền đề theo mã fact"""
+        names = self.fact_names
+        return {r.idx: {'left': '^'.join(names[p] for p in sorted(r.premises)), 'right': names[r.conclusion]}
+                for r in self.rules}
+
+
+def compile_rules(rules):
+    """Trả về CompiledRuleBase; dict idx -> (premises_set, conclusion) được biên dịch"""
+    if isinstance(rules, CompiledRuleBase):
+        return rules
+    return CompiledRuleBase.from_rules(rules)
+
+
+# ============ MÔ HÌNH LUẬT / FILE LUẬT ============
+def parse_facts(text):
+    """Tách danh sách fact từ chuỗi dạng 'a, b, c'"""
+    return set(re.findall(r"[a-zA-Z0-9]+", text))
+
+
+def parse_goals(text):
+    """Tách danh sách mục tiêu 'r, s' hoặc 'r s' theo thứ tự nhập, bỏ trùng.
+    Chỉ tách ở dấu phẩy và khoảng trắng nên tên mục tiêu có ký tự khác (vd 'x-1')
+    được giữ nguyên.
+    """
+    return list(dict.fromkeys(g for g in re.split(r'[,\s]+', text) if g))
+
+
+def parse_premises(left):
+    """Tách vế trái 'a^b^c' thành tập tiền đề"""
+    left_items = re.split(r'\^', left)
+    return set([i.strip() for i in left_items if i.strip()])
+
+
+class RuleFileError(ValueError):
+    """File luật sai định dạng; lineno là số dòng (bắt đầu từ 1) nếu xác định được"""
+    def __init__(self, path, lineno, message):
+        self.path = str(path)
+        self.lineno = lineno
+        self.message = message
+        where = f"{self.path}:{lineno}" if lineno else self.path
+        super().__init__(f"{where}: {message}")
+
+
+def iter_rules_text(path):
+    """Đọc từng dòng file luật dạng '<stt>\\t<vế trái>-><vế phải>' cùng các dòng GT = ..., KL = ...
+    Sinh (lineno, loại, giá trị): ('rule', (idx, left, right)), ('GT', tập fact) hoặc ('KL', tập fact).
+    Dòng sai định dạng làm ném RuleFileError kèm số dòng.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if '->' in line:
+                parts = line.split('\t')
+                if len(parts) < 2:
+                    raise RuleFileError(path, lineno, "thiếu dấu tab giữa số thứ tự và luật")
+                idx = parts[0].strip()
+                sides = parts[1].split('->')
+                if len(sides) != 2:
+                    raise RuleFileError(path, lineno, f"luật phải có đúng một '->': {parts[1]}")
+                left, right = map(str.strip, sides)
+                if not idx or not left or not right:
+                    raise RuleFileError(path, lineno, f"luật thiếu số thứ tự, vế trái hoặc vế phải: {line}")
+                yield lineno, 'rule', (idx, left, right)
+            elif line.lower().startswith('gt'):
+                yield lineno, 'GT', parse_facts(line.split('=')[1].strip() if '=' in line else '')
+            elif line.lower().startswith('kl'):
+                yield lineno, 'KL', parse_facts(line.split('=')[1].strip() if '=' in line else '')
+            else:
+                raise RuleFileError(path, lineno, f"dòng không phải luật, GT hay KL: {line}")
+
+
+def iter_rules_json(path, chunk_size=1 << 16):
+    """Đọc dần file luật JSON: một mảng các đối tượng {"id", "antecedent", "consequent"}.
+    Phần tử {"GT": ...} hoặc {"KL": ...} (danh sách hoặc chuỗi 'a, b') đặt GT/KL.
+    Mảng được giải mã từng phần tử một theo từng khối chunk_size ký tự nên
+    không cần đọc cả file vào bộ nhớ. Sinh cùng dạng với iter_rules_text.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buf = ''
+        pos = 0
+        lineno = 1
+        
+        def fill():
+            nonlocal buf, pos
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return False
+            buf = buf[pos:] + chunk
+            pos = 0
+            return True
+        
+        def skip_ws():
+            nonlocal pos, lineno
+            while True:
+                end = pos
+                while end < len(buf) and buf[end] in ' \t\r\n':
+                    end += 1
+                lineno += buf.count('\n', pos, end)
+                pos = end
+                if pos < len(buf) or not fill():
+                    return
+        
+        def expect(chars, what):
+            nonlocal pos
+            skip_ws()
+            if pos >= len(buf) or buf[pos] not in chars:
+                found = buf[pos] if pos < len(buf) else 'hết file'
+                raise RuleFileError(path, lineno, f"cần {what}, gặp {found!r}")
+            pos += 1
+            return buf[pos - 1]
+        
+        expect('[', "'[' mở đầu mảng luật")
+        skip_ws()
+        if pos < len(buf) and buf[pos] == ']':
+            return
+        while True:
+            skip_ws()
+            start_line = lineno
+            while True:
+                try:
+                    item, end = decoder.raw_decode(buf, pos)
+                    break
+                except json.JSONDecodeError as e:
+                    # Phần tử có thể chưa nằm trọn trong bộ đệm
+                    if not fill():
+                        raise RuleFileError(path, start_line + buf.count('\n', pos, e.pos), e.msg) from None
+            lineno += buf.count('\n', pos, end)
+            pos = end
+            yield json_rule_item(path, start_line, item)
+            if expect(',]', "',' hoặc ']'") == ']':
+                return
+
+
+def json_rule_item(path, lineno, item):
+    """Kiểm tra một phần tử của file luật JSON, trả về (lineno, loại, giá trị)"""
+    if not isinstance(item, dict):
+        raise RuleFileError(path, lineno, f"phần tử phải là đối tượng JSON: {item!r}")
+    for key in ('GT', 'KL'):
+        if key in item:
+            value = item[key]
+            return lineno, key, parse_facts(value) if isinstance(value, str) else set(map(str, value))
+    try:
+        idx, left, right = item['id'], item['antecedent'], item['consequent']
+    except KeyError as e:
+        raise RuleFileError(path, lineno, f"luật thiếu trường {e.args[0]!r}") from None
+    if isinstance(left, list):
+        left = '^'.join(map(str, left))
+    idx, left, right = str(idx).strip(), str(left).strip(), str(right).strip()
+    if not idx or not left or not right:
+        raise RuleFileError(path, lineno, f"luật thiếu số thứ tự, vế trái hoặc vế phải: {item!r}")
+    return lineno, 'rule', (idx, left, right)
+
+
+def iter_rules_file(path):
+    """Chọn bộ đọc theo phần mở rộng: .json là mảng JSON, còn lại là dạng văn bản"""
+    if Path(path).suffix.lower() == '.json':
+        return iter_rules_json(path)
+    return iter_rules_text(path)
+
+
+def read_rules_file(path):
+    """Đọc file luật (văn bản hoặc JSON) theo từng dòng/phần tử.
+    Trả về (rules, GT, KL) với rules: dict idx -> {'left': ..., 'right': ...}
+    Ném RuleFileError kèm số dòng khi luật sai định dạng hoặc trùng số thứ tự.
+    """
+    rules = {}
+    lines = {}
+    GT = set()
+    KL = set()
+    
+    for lineno, kind, value in iter_rules_file(path):
+        if kind == 'rule':
+            idx, left, right = value
+            if idx in rules:
+                raise RuleFileError(path, lineno, f"trùng số thứ tự luật {idx} (đã có ở dòng {lines[idx]})")
+            rules[idx] = {'left': left, 'right': right}
+            lines[idx] = lineno
+        elif kind == 'GT':
+            GT = value
+        else:
+            KL = value
+    
+    return rules, GT, KL
+
+
+def write_rules_file(path, rules, GT, KL):
+    """Ghi luật (sắp theo số thứ tự) cùng GT/KL ra file; file .json được ghi dạng mảng JSON"""
+    ordered = sorted(rules.items(), key=lambda x: int(x[0]) if x[0].isdigit() else 0)
+    with open(path, 'w', encoding='utf-8') as f:
+        if Path(path).suffix.lower() == '.json':
+            items = [{'id': int(idx) if idx.isdigit() else idx,
+                      'antecedent': rule['left'], 'consequent': rule['right']}
+                     for idx, rule in ordered]
+            if GT:
+                items.append({'GT': sorted(GT)})
+            if KL:
+                items.append({'KL': sorted(KL)})
+            f.write('[')
+            for i, item in enumerate(items):
+                text = json.dumps(item, ensure_ascii=False, indent=2).replace('\n', '\n  ')
+                f.write(f"{',' if i else ''}\n  {text}")
+            f.write('\n]' if items else ']')
+            return
+        for idx, rule in ordered:
+            f.write(f"{idx}\t{rule['left']}->{rule['right']}\n")
+        if GT:
+            f.write(f"GT = {', '.join(sorted(GT))}\n")
+        if KL:
+            f.write(f"KL = {', '.join(sorted(KL))}\n")
+
+
+# ============ SNAPSHOT NHỊ PHÂN ============
+SNAPSHOT_SUFFIX = '.kbs'
+SNAPSHOT_MAGIC = b'KBSNAP02'
+# các phần của snapshot theo thứ tự ghi: khối chuỗi UTF-8 (ngăn cách bởi '\0')
+# hoặc mảng uint32 (orders là int64, -1 khi số thứ tự không vừa và được tính
+# lại từ rule_ids); chỉ mục fact_index/producers lưu dạng CSR (offsets + giá trị)
+SNAPSHOT_SECTIONS = ('fact_names', 'rule_ids', 'orders', 'prem_offsets', 'prem_ids', 'conclusions',
+                     'index_offsets', 'index_rules', 'prod_offsets', 'prod_rules', 'GT', 'KL')
+SNAPSHOT_HEADER = struct.Struct(f'<8s4s{len(SNAPSHOT_SECTIONS)}Q')
+SNAPSHOT_ORDER_MAX = (1 << 63) - 1
+
+
+def _csr(lists):
+    offsets = array('I', [0])
+    values = array('I')
+    for values_i in lists:
+        values.extend(values_i)
+        offsets.append(len(values))
+    return offsets, values
+
+
+def save_snapshot(path, compiled, GT=(), KL=()):
+    """Ghi tập luật đã biên dịch cùng GT/KL ra file snapshot nhị phân.
+    Mọi phần được căn 8 byte để khi đọc lại các mảng được ép kiểu thẳng từ
+    nội dung file (memoryview.cast).
+    """
+    compiled = compiled.with_facts([*GT, *KL])
+    gt_ids = array('I', sorted(compiled.ids(GT)))
+    kl_ids = array('I', sorted(compiled.ids(KL)))
+    prem_offsets, prem_ids = _csr(sorted(r.premises) for r in compiled.rules)
+    index_offsets, index_rules = _csr(compiled.fact_index)
+    prod_offsets, prod_rules = _csr(compiled.producers)
+    sections = {
+        'fact_names': '\0'.join(compiled.fact_names).encode('utf-8'),
+        'rule_ids': '\0'.join(r.idx for r in compiled.rules).encode('utf-8'),
+        'orders': array('q', [r.order if r.order <= SNAPSHOT_ORDER_MAX else -1 for r in compiled.rules]),
+        'prem_offsets': prem_offsets, 'prem_ids': prem_ids,
+        'conclusions': array('I', [r.conclusion for r in compiled.rules]),
+        'index_offsets': index_offsets, 'index_rules': index_rules,
+        'prod_offsets': prod_offsets, 'prod_rules': prod_rules,
+        'GT': gt_ids, 'KL': kl_ids,
+    }
+    blobs = [sections[name] if isinstance(sections[name], bytes) else sections[name].tobytes()
+             for name in SNAPSHOT_SECTIONS]
+    byteorder = b'LE\0\0' if sys.byteorder == 'little' else b'BE\0\0'
+    with open(path, 'wb') as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, byteorder, *(len(b) for b in blobs)))
+        for blob in blobs:
+            f.write(blob)
+            f.write(b'\0' * (-len(blob) % 8))
+
+
+def load_snapshot(path):
+    """Đọc snapshot, trả về (CompiledRuleBase, GT, KL).
+    Cả file được đọc một lần; các mảng được ép kiểu thẳng từ nội dung file nên
+    không phải tách chuỗi luật hay dựng lại chỉ mục (các đối tượng luật vẫn
+    được dựng ngay khi đọc).
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < SNAPSHOT_HEADER.size or data[:8] != SNAPSHOT_MAGIC:
+        raise RuleFileError(path, None, "không phải file snapshot tập luật")
+    magic, byteorder, *sizes = SNAPSHOT_HEADER.unpack_from(data)
+    if byteorder[:2] != (b'LE' if sys.byteorder == 'little' else b'BE'):
+        raise RuleFileError(path, None, "snapshot được tạo trên máy có thứ tự byte khác")
+    view = memoryview(data)
+    parts = {}
+    offset = SNAPSHOT_HEADER.size
+    for name, size in zip(SNAPSHOT_SECTIONS, sizes):
+        if offset + size > len(data):
+            raise RuleFileError(path, None, f"snapshot bị cắt cụt (phần {name})")
+        parts[name] = view[offset:offset + size]
+        offset += size + (-size % 8)
+    arrays = {name: part.cast('q' if name == 'orders' else 'I') for name, part in parts.items()
+              if name not in ('fact_names', 'rule_ids')}
+    compiled = CompiledRuleBase.from_arrays(
+        bytes(parts['fact_names']).decode('utf-8'),
+        bytes(parts['rule_ids']).decode('utf-8'), arrays)
+    return compiled, compiled.names(arrays['GT']), compiled.names(arrays['KL'])
+
+
+def normalize_change(change):
+    """Kiểm tra một thay đổi tập luật, trả về dict chuẩn hóa (JSON được)"""
+    if not isinstance(change, dict):
+        raise ValueError(f"thay đổi phải là dict: {change!r}")
+    op = change.get('op')
+    if op == 'set':
+        idx = str(change.get('id', '')).strip()
+        left = str(change.get('left', '')).strip()
+        right = str(change.get('right', '')).strip()
+        if not idx or not left or not right:
+            raise ValueError(f"thay đổi 'set' thiếu id, left hoặc right: {change!r}")
+        return {'op': 'set', 'id': idx, 'left': left, 'right': right}
+    if op == 'delete':
+        idx = str(change.get('id', '')).strip()
+        if not idx:
+            raise ValueError(f"thay đổi 'delete' thiếu id: {change!r}")
+        return {'op': 'delete', 'id': idx}
+    if op in ('GT', 'KL'):
+        facts = change.get('facts', ())
+        facts = parse_facts(facts) if isinstance(facts, str) else set(map(str, facts))
+        return {'op': op, 'facts': sorted(facts)}
+    raise ValueError(f"loại thay đổi không hợp lệ: {op!r}")
+
+
+class KnowledgeBase:
+    """Cơ sở tri thức: tập luật, GT, KL cùng các chỉ mục/đồ thị tính trước.
+    rules: dict idx -> {'left': 'a^b', 'right': 'c'} (dạng lưu trong file).
+    Mọi thay đổi tập luật phải đi qua các hàm của lớp (hoặc gọi invalidate())
+    để các chỉ mục và bảng FPG/RPG theo phiên bản được tính lại. Riêng bao
+    đóng của GT (closure()) được giữ qua các phiên bản và cập nhật tăng dần.
+    Kết quả forward()/backward() được nhớ trong results (ResultCache, None để
+    tắt) theo mã băm nội dung tập luật (digest()) cùng các tham số truy vấn
+    (với tập luật rút gọn thì cả GT của cơ sở tri thức), nên mọi thay đổi
+    luật/GT/KL tự động làm các kết quả cũ không còn trúng.
+    Thay đổi và việc dựng các chỉ mục/bảng diễn ra dưới self.lock; mỗi truy
+    vấn chạy trên một snapshot() nên dùng được từ luồng khác trong lúc cơ sở
+    tri thức đang được sửa.
+    """
+    def __init__(self, rules=None, GT=None, KL=None):
+        self._rules = dict(rules or {})
+        self.GT = set(GT or ())
+        self.KL = set(KL or ())
+        self.version = 0
+        self.cache = {}
+        self._closure = None
+        self.results = ResultCache()
+        self.lock = threading.RLock()
+    
+    def __getstate__(self):
+        # Gửi sang tiến trình con hoặc sao chép (snapshot()): không kèm khóa
+        state = self.__dict__.copy()
+        state['lock'] = None
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+    
+    @property
+    def rules(self):
+        # Nạp từ snapshot thì dạng văn bản chỉ được dựng khi cần đến
+        if self._rules is None:
+            self._rules = self.cache['compiled'].text_rules()
+        return self._rules
+    
+    @rules.setter
+    def rules(self, rules):
+        self._rules = rules
+        self._closure = None  # thay cả tập luật thì bao đóng được dựng lại khi cần
+    
+    def invalidate(self):
+        """Tập luật đã thay đổi: tăng phiên bản và bỏ các chỉ mục/bảng đã tính trước.
+        self.cache được thay bằng dict mới (không xóa tại chỗ) nên các snapshot
+        của phiên bản cũ vẫn giữ nguyên chỉ mục/bảng của chúng.
+        """
+        with self.lock:
+            self.rules  # giữ lại dạng văn bản trước khi bỏ tập luật đã biên dịch
+            self.version += 1
+            self.cache = {}
+    
+    def invalidate_facts(self, GT=True):
+        """Chỉ GT/KL thay đổi, tập luật giữ nguyên: giữ phiên bản, tập luật đã biên
+        dịch, digest() và các bảng FPG/RPG; chỉ bỏ các mục phụ thuộc GT (analysis(),
+        tập luật rút gọn và các bảng của nó) và đồ thị (tô màu theo GT/KL).
+        GT=False khi chỉ KL thay đổi. Như invalidate(), self.cache được thay bằng
+        dict mới.
+        """
+        with self.lock:
+            def depends(key):
+                if isinstance(key, tuple) and key[0] == 'graph':
+                    return True
+                return GT and key in ('analysis', 'reduced', ('fpg', True), ('rpg', True))
+            self.cache = {key: value for key, value in self.cache.items() if not depends(key)}
+    
+    def load(self, path):
+        """Đọc luật từ file văn bản, JSON hoặc snapshot (.kbs); file không tồn tại
+        thì cơ sở tri thức rỗng. File sai định dạng ném RuleFileError và giữ
+        nguyên cơ sở tri thức hiện tại.
+        """
+        compiled = None
+        if not Path(path).exists():
+            rules, GT, KL = {}, set(), set()
+        elif Path(path).suffix.lower() == SNAPSHOT_SUFFIX:
+            compiled, GT, KL = load_snapshot(path)
+            rules = None
+        else:
+            rules, GT, KL = read_rules_file(path)
+        with self.lock:
+            self.rules, self.GT, self.KL = {}, GT, KL
+            self.invalidate()
+            self.rules = rules
+            if compiled is not None:
+                self.cache['compiled'] = compiled
+    
+    def save(self, path):
+        """Ghi ra file văn bản, JSON hoặc snapshot (.kbs) theo phần mở rộng"""
+        if Path(path).suffix.lower() == SNAPSHOT_SUFFIX:
+            save_snapshot(path, self.compiled(), self.GT, self.KL)
+        else:
+            write_rules_file(path, self.rules, self.GT, self.KL)
+    
+    def set_rule(self, idx, left, right):
+        self.apply([{'op': 'set', 'id': idx, 'left': left, 'right': right}])
+    
+    def delete_rule(self, idx):
+        """Xóa luật idx; số thứ tự các luật khác giữ nguyên (xem renumber())"""
+        if idx not in self.rules:
+            raise KeyError(idx)
+        self.apply([{'op': 'delete', 'id': idx}])
+    
+    def renumber(self):
+        """Đánh số lại liên tiếp các luật có số thứ tự là số"""
+        with self.lock:
+            numeric_keys = sorted(int(key) for key in self.rules if key.isdigit())
+            
+            # Tạo dict mới với số thứ tự liên tiếp
+            new_rules = {}
+            for new_idx, old_idx in enumerate(numeric_keys, 1):
+                new_rules[str(new_idx)] = self.rules[str(old_idx)]
+            
+            # Thêm lại những luật không phải số
+            for key, rule in self.rules.items():
+                if not key.isdigit():
+                    new_rules[key] = rule
+            
+            self.rules = new_rules
+            self.invalidate()
+    
+    def apply(self, changes, strict=True):
+        """Áp dụng một lô thay đổi như một giao dịch, chỉ invalidate một lần
+        (invalidate_facts() nếu lô chỉ đổi GT/KL).
+        changes: các dict {'op': 'set', 'id', 'left', 'right'}, {'op': 'delete', 'id'},
+        {'op': 'GT', 'facts'} hoặc {'op': 'KL', 'facts'} (facts: danh sách hoặc chuỗi).
+        Cả lô được kiểm tra trước khi áp dụng: thay đổi sai thì ném ValueError
+        và cơ sở tri thức không đổi. strict=False bỏ qua việc xóa luật không
+        tồn tại (dùng khi phát lại nhật ký).
+        """
+        with self.lock:
+            changes = [normalize_change(change) for change in changes]
+            present = {}  # idx -> còn tồn tại sau các thay đổi trước đó trong lô
+            for change in changes:
+                if change['op'] == 'set':
+                    present[change['id']] = True
+                elif change['op'] == 'delete':
+                    idx = change['id']
+                    if strict and not present.get(idx, idx in self.rules):
+                        raise ValueError(f"không tìm thấy luật {idx}")
+                    present[idx] = False
+            
+            closure = self._closure
+            for change in changes:
+                op = change['op']
+                if op == 'set':
+                    self.rules[change['id']] = {'left': change['left'], 'right': change['right']}
+                    if closure is not None:
+                        closure.set_rule(change['id'], parse_premises(change['left']), change['right'])
+                elif op == 'delete':
+                    if self.rules.pop(change['id'], None) is not None and closure is not None:
+                        closure.delete_rule(change['id'])
+                elif op == 'GT':
+                    self.GT = set(change['facts'])
+                    if closure is not None:
+                        closure.set_facts(self.GT)
+                else:
+                    self.KL = set(change['facts'])
+            ops = {change['op'] for change in changes}
+            if ops & {'set', 'delete'}:
+                self.invalidate()
+            elif ops:
+                self.invalidate_facts('GT' in ops)
+            return changes
+    
+    def _cached(self, key, build):
+        with self.lock:
+            cache = self.cache
+            if key not in cache:
+                # Ảnh chụp dùng chung dict này với khóa riêng: nếu hai bên cùng dựng thì giữ bản đầu tiên
+                return cache.setdefault(key, build())
+            return cache[key]
+    
+    def snapshot(self, strategy=None, reduced=False, warm=True):
+        """Ảnh chụp chỉ đọc của phiên bản hiện tại, để truy vấn trên luồng khác.
+        Tập luật đã biên dịch, digest() và các bảng mà strategy/reduced cần được
+        dựng ngay dưới self.lock (warm()) nên luôn thuộc cùng một phiên bản; các
+        thay đổi sau đó không ảnh hưởng tới ảnh chụp. Ảnh chụp dùng chung các chỉ
+        mục/bảng của phiên bản (self.cache) và bộ đệm kết quả với cơ sở tri thức.
+        warm=False chỉ sao chép tập luật dạng văn bản, GT và KL (rẻ, dùng trên
+        luồng giao diện); gọi warm() của ảnh chụp trên luồng phụ để dựng sau.
+        """
+        with self.lock:
+            if warm:
+                self.warm(strategy, reduced)
+            snapshot = copy.copy(self)
+            snapshot.GT, snapshot.KL = set(self.GT), set(self.KL)
+            if warm:
+                snapshot._rules = None  # dựng lại từ tập luật đã biên dịch khi cần
+            elif self._rules is not None:
+                snapshot._rules = dict(self._rules)
+        snapshot._closure = None
+        return snapshot
+    
+    def warm(self, strategy=None, reduced=False):
+        """Dựng trước tập luật đã biên dịch, digest() và các bảng mà strategy/reduced cần"""
+        with self.lock:
+            self.compiled()
+            self.digest()
+            variants = (False, True) if reduced else (False,)
+            for variant in variants:
+                if variant:
+                    self.reduced()
+                if strategy == 'fpg':
+                    self.fpg_table(variant)
+                elif strategy == 'rpg':
+                    self.rpg_table(variant)
+    
+    def digest(self):
+        """Mã băm nội dung tập luật (theo thứ tự các luật), tính một lần cho mỗi phiên bản"""
+        def build():
+            h = hashlib.sha1()
+            for idx, rule in self.rules.items():
+                h.update(f"{idx}\t{rule['left']}\t{rule['right']}\n".encode('utf-8'))
+            return h.hexdigest()
+        return self._cached('digest', build)
+    
+    def compiled(self):
+        """Tập luật đã biên dịch (CompiledRuleBase), dựng một lần cho mỗi phiên bản"""
+        return self._cached('compiled', lambda: CompiledRuleBase.from_text_rules(self.rules))
+    
+    def closure(self):
+        """Bao đóng của GT theo tập luật hiện tại (IncrementalClosure); dựng một lần,
+        sau đó được apply() cập nhật tăng dần thay vì suy diễn lại từ đầu.
+        """
+        with self.lock:
+            if self._closure is None:
+                self._closure = IncrementalClosure.from_text_rules(self.rules, self.GT)
+            return self._closure
+    
+    def fpg_table(self, reduced=False):
+        return self._cached(('fpg', reduced), lambda: FPGDistanceTable(self.reduced() if reduced else self.compiled()))
+    
+    def rpg_table(self, reduced=False):
+        return self._cached(('rpg', reduced), lambda: RPGReachTable(self.reduced() if reduced else self.compiled()))
+    
+    def graph(self, kind, hops=0, collapse=False):
+        """Đồ thị FPG/RPG cùng bố cục để vẽ (xem graph_view), tính một lần cho mỗi phiên bản"""
+        return self._cached(('graph', kind, hops, collapse),
+                            lambda: graph_view(self.compiled(), kind, self.GT, self.KL, hops, collapse))
+    
+    def analysis(self):
+        """Phân tích các luật thừa (RuleAnalysis của analyze_rules), tính một lần cho mỗi phiên bản"""
+        return self._cached('analysis', lambda: analyze_rules(self.compiled(), self.GT))
+    
+    def reduced(self):
+        """Tập luật rút gọn (bỏ các luật thừa theo analysis()), đã biên dịch"""
+        return self._cached('reduced', lambda: CompiledRuleBase.from_text_rules(
+            self.analysis().reduced_rules(self.rules)))
+    
+    def _use_reduced(self, GT, reduced):
+        # Bỏ luật chết chỉ đúng khi mọi fact của GT là fact có thể thuộc GT lúc phân tích
+        return reduced and set(GT) <= self.analysis().inputs
+    
+    def _reduced_key(self, reduced):
+        # Tập luật rút gọn phụ thuộc cả GT của cơ sở tri thức (analysis()), không chỉ digest()
+        return reduced, sorted(self.GT) if reduced else None
+    
+    def measure_reduction(self, repeat=3):
+        """Thời gian suy diễn tiến (toàn bộ bao đóng của GT, không ghi vết) trên tập luật
+        đầy đủ và trên tập luật rút gọn: (giây, giây), lấy lần nhanh nhất
+        """
+        timings = []
+        for rules in (self.compiled(), self.reduced()):
+            best = float('inf')
+            for _ in range(repeat):
+                start = perf_counter()
+                forward_chain(rules, self.GT, (), verbosity='off')
+                best = min(best, perf_counter() - start)
+            timings.append(best)
+        return tuple(timings)
+    
+    def _query(self, key, run, emit, verbosity, cancel, stats):
+        """Trả lời qua bộ đệm kết quả: trúng thì phát lại vết đã ghi, trượt thì
+        chạy run(emit) rồi lưu kết quả cùng vết. Lần chạy bị hủy không được lưu;
+        vết dài hơn RESULT_CACHE_ENTRY_BYTES thì thôi ghi giữa chừng và không lưu.
+        """
+        results = self.results
+        if results is None:
+            return run(emit)
+        start = perf_counter()
+        level = trace_level(verbosity) if emit is not None else TRACE_OFF
+        key = results.key(self.digest(), *key, level)
+        hit = results.get(key)
+        if hit is not None:
+            result, lines = hit
+            if stats is not None:
+                stats.cache_hits += 1
+                stats.add_time('total', perf_counter() - start)
+            if emit is not None:
+                for line in lines:
+                    check_cancel(cancel)
+                    emit(line)
+            return result
+        lines = None
+        record = emit
+        if emit is not None:
+            lines = []
+            size = 0
+            def record(text):
+                nonlocal lines, size
+                if lines is not None:
+                    # len() theo ký tự không vượt số byte của pickle nên không bỏ nhầm vết lưu được
+                    size += len(text)
+                    if size > RESULT_CACHE_ENTRY_BYTES:
+                        lines = None  # vết quá lớn để lưu: thôi giữ bản sao, kết quả không được lưu
+                    else:
+                        lines.append(text)
+                emit(text)
+        result = run(record)
+        if emit is None or lines is not None:
+            results.put(key, (result, lines))
+        return result
+    
+    def forward(self, GT=None, KL=None, strategy='min', agenda_type='queue', emit=None,
+                verbosity='full', cancel=None, prune=False, stop_early=False, stats=None, reduced=False):
+        """Suy diễn tiến trên tập luật hiện tại (mặc định dùng GT/KL của cơ sở tri thức).
+        reduced=True dùng tập luật rút gọn (reduced()) khi GT cho phép.
+        """
+        kb = self.snapshot()
+        GT = kb.GT if GT is None else GT
+        KL = kb.KL if KL is None else KL
+        reduced = kb._use_reduced(GT, reduced)
+        key = ('forward', sorted(GT), sorted(KL), strategy, agenda_type, bool(prune), bool(stop_early),
+               *kb._reduced_key(reduced))
+        return kb._query(key, lambda emit: forward_chain(
+            kb.reduced() if reduced else kb.compiled(), GT, KL, strategy, agenda_type,
+            fpg_table=kb.fpg_table(reduced) if strategy == 'fpg' else None,
+            rpg_table=kb.rpg_table(reduced) if strategy == 'rpg' else None,
+            emit=emit, verbosity=verbosity, cancel=cancel, prune=prune, stop_early=stop_early, stats=stats),
+            emit, verbosity, cancel, stats)
+    
+    def forward_batch(self, GT_sets, KL=None, cancel=None, reduced=False):
+        """Suy diễn tiến theo lô cho nhiều tập giả thiết (mặc định dùng KL của cơ sở tri thức)"""
+        kb = self.snapshot()
+        reduced = kb._use_reduced(set().union(*GT_sets), reduced)
+        return forward_batch(kb.reduced() if reduced else kb.compiled(), GT_sets,
+                             kb.KL if KL is None else KL, cancel=cancel)
+    
+    def backward(self, goal, GT=None, strategy='min', tabled=False, emit=None,
+                 verbosity='full', cancel=None, stats=None, max_nodes=None, max_open=None, reduced=False):
+        """Suy diễn lùi chứng minh goal (mặc định dùng GT của cơ sở tri thức).
+        reduced=True dùng tập luật rút gọn (reduced()) khi GT cho phép.
+        """
+        kb = self.snapshot()
+        GT = kb.GT if GT is None else GT
+        reduced = kb._use_reduced(GT, reduced)
+        key = ('backward', goal, sorted(GT), strategy, bool(tabled), max_nodes, max_open, *kb._reduced_key(reduced))
+        return kb._query(key, lambda emit: prove(
+            goal, kb.reduced() if reduced else kb.compiled(), GT, strategy, tabled,
+            fpg_table=kb.fpg_table(reduced) if strategy == 'fpg' else None,
+            emit=emit, verbosity=verbosity, cancel=cancel, stats=stats, max_nodes=max_nodes, max_open=max_open),
+            emit, verbosity, cancel, stats)
+    
+    def backward_all(self, goals=None, GT=None, strategy='min', emit=None, verbosity='full',
+                     cancel=None, stats=None, max_nodes=None, max_open=None, reduced=False, proofs=True):
+        """Suy diễn lùi chứng minh mọi mục tiêu trong goals trong một lượt, dùng chung
+        bảng mục tiêu con (xem prove_all); mặc định là mọi fact của KL theo thứ tự tên.
+        """
+        kb = self.snapshot()
+        goals = sorted(kb.KL) if goals is None else list(goals)
+        GT = kb.GT if GT is None else GT
+        reduced = kb._use_reduced(GT, reduced)
+        key = ('backward_all', goals, sorted(GT), strategy, max_nodes, max_open, bool(proofs),
+               *kb._reduced_key(reduced))
+        return kb._query(key, lambda emit: prove_all(
+            goals, kb.reduced() if reduced else kb.compiled(), GT, strategy,
+            fpg_table=kb.fpg_table(reduced) if strategy == 'fpg' else None,
+            emit=emit, verbosity=verbosity, cancel=cancel, stats=stats, max_nodes=max_nodes, max_open=max_open,
+            proofs=proofs),
+            emit, verbosity, cancel, stats)
+
+# ============ BỘ ĐỆM KẾT QUẢ TRUY VẤN ============
+RESULT_CACHE_SIZE = 256  # số kết quả giữ trong bộ nhớ
+RESULT_CACHE_BYTES = 1 << 28  # tổng kích thước (pickle) các kết quả giữ trong bộ nhớ
+RESULT_CACHE_DISK_SIZE = 10000  # số kết quả giữ trên đĩa
+RESULT_CACHE_ENTRY_BYTES = 1 << 24  # kết quả (kèm vết) lớn hơn thì không lưu
+RESULT_CACHE_FORMAT = 1  # tăng khi dạng kết quả thay đổi để bỏ các mục cũ trên đĩa
+
+
+class ResultCache:
+    """Bộ đệm LRU kết quả suy diễn, có tầng lưu trên đĩa (sqlite3) tùy chọn.
+    Khóa là mã băm của các phần khóa (mã băm tập luật, GT, mục tiêu/KL, chiến
+    lược, ...); giá trị được lưu dạng pickle nên mỗi lần trúng trả về bản sao
+    riêng. Bộ nhớ bị giới hạn cả theo số mục (maxsize) lẫn tổng kích thước các
+    pickle (maxbytes): mục cũ nhất bị đẩy ra tới khi thỏa cả hai.
+    Mục trúng ở đĩa được đưa lên bộ nhớ. hits/disk_hits/misses cho biết
+    tỉ lệ trúng để chọn kích thước. Dùng được từ nhiều luồng; mỗi tiến trình
+    (kể cả tiến trình con tạo bằng fork) mở kết nối sqlite riêng.
+    """
+    def __init__(self, maxsize=RESULT_CACHE_SIZE, path=None, disk_size=RESULT_CACHE_DISK_SIZE,
+                 maxbytes=RESULT_CACHE_BYTES):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.path = path
+        self.disk_size = disk_size
+        self.entries = OrderedDict()  # khóa -> pickle, cũ nhất ở đầu
+        self.nbytes = 0  # tổng len() các pickle trong entries
+        self.lock = threading.Lock()
+        self.db = None
+        self.pid = None
+        self.hits = self.disk_hits = self.misses = self.stores = self.evictions = 0
+    
+    def __getstate__(self):
+        # Gửi sang tiến trình con (khi không có fork): không kèm khóa và kết nối
+        state = self.__dict__.copy()
+        state.update(lock=None, db=None, pid=None)
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def key(*parts):
+        """Khóa của một truy vấn: sha1 của các phần khóa (JSON được)"""
+        text = json.dumps([RESULT_CACHE_FORMAT, *parts], ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def _connect(self):
+        if self.db is None or self.pid != os.getpid():
+            import sqlite3
+            self.db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB)")
+            self.pid = os.getpid()
+        return self.db
+    
+    def _remember(self, key, blob):
+        entries = self.entries
+        old = entries.pop(key, None)
+        if old is not None:
+            self.nbytes -= len(old)
+        entries[key] = blob
+        self.nbytes += len(blob)
+        while len(entries) > self.maxsize or self.nbytes > self.maxbytes:
+            _, evicted = entries.popitem(last=False)
+            self.nbytes -= len(evicted)
+            self.evictions += 1
+    
+    def get(self, key):
+        """Kết quả đã lưu của khóa hoặc None"""
+        with self.lock:
+            blob = self.entries.get(key)
+            if blob is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            elif self.path is not None:
+                row = self._connect().execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    blob = row[0]
+                    self.disk_hits += 1
+                    self._remember(key, blob)
+            if blob is None:
+                self.misses += 1
+                return None
+        return pickle.loads(blob)
+    
+    def put(self, key, value):
+        """Lưu kết quả của khóa; trả về False nếu kết quả quá lớn để lưu"""
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(blob) > min(RESULT_CACHE_ENTRY_BYTES, self.maxbytes):
+            return False
+        with self.lock:
+            self._remember(key, blob)
+            self.stores += 1
+            if self.path is not None:
+                db = self._connect()
+                with db:
+                    # INSERT OR REPLACE cấp rowid mới nên rowid tăng theo thứ tự ghi
+                    db.execute("INSERT OR REPLACE INTO results VALUES (?, ?)", (key, blob))
+                    if self.stores % 64 == 0:
+                        db.execute("DELETE FROM results WHERE rowid NOT IN "
+                                   "(SELECT rowid FROM results ORDER BY rowid DESC LIMIT ?)", (self.disk_size,))
+        return True
+    
+    def clear(self):
+        """Bỏ mọi kết quả đã lưu (cả trên đĩa); các bộ đếm giữ nguyên"""
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+            if self.path is not None:
+                db = self._connect()
+                with db:
+                    db.execute("DELETE FROM results")
+    
+    def as_dict(self):
+        return {'entries': len(self.entries), 'bytes': self.nbytes, 'hits': self.hits, 'disk_hits': self.disk_hits,
+                'misses': self.misses, 'stores': self.stores, 'evictions': self.evictions}
+    
+    def format(self):
+        """Tóm tắt một dòng để hiển thị"""
+        lookups = self.hits + self.disk_hits + self.misses
+        rate = (self.hits + self.disk_hits) / lookups if lookups else 0.0
+        return (f"Bộ đệm kết quả: {len(self.entries)}/{self.maxsize} mục"
+                f" ({self.nbytes / (1 << 20):.1f}/{self.maxbytes / (1 << 20):.0f} MiB) · trúng {self.hits + self.disk_hits}"
+                f" (đĩa {self.disk_hits}) · trượt {self.misses} · tỉ lệ trúng {rate:.0%} · bị đẩy ra {self.evictions}")
+
+
+# ============ LƯU TRỮ CÓ NHẬT KÝ ============
+JOURNAL_SUFFIX = '.journal'
+
+
+class RuleStore:
+    """Lưu một KnowledgeBase vào file luật kèm nhật ký chỉ-ghi-thêm.
+    Mỗi giao dịch (một lô thay đổi, xem KnowledgeBase.apply) là một dòng JSON
+    trong '<file luật>.journal' nên một lần sửa chỉ tốn O(1) I/O. Khi nhật ký
+    đủ dài, file luật được ghi lại đầy đủ (compact) trên luồng phụ rồi nhật ký
+    chỉ giữ phần ghi thêm trong lúc compact. Các thay đổi đều là giá trị tuyệt
+    đối nên phát lại một giao dịch đã có trong file luật không làm sai kết quả.
+    """
+    COMPACT_MIN_OPS = 1000
+    
+    def __init__(self, kb, path):
+        self.kb = kb
+        self.path = str(path)
+        self.lock = threading.Lock()          # giữ khi sửa kb/nhật ký
+        self.compact_lock = threading.Lock()  # mỗi lúc chỉ một lần compact
+        self.journal_bytes = 0
+        self.journal_ops = 0
+        self.compactor = None
+    
+    @property
+    def journal_path(self):
+        return self.path + JOURNAL_SUFFIX
+    
+    def load(self, path=None, repair=True):
+        """Đọc file luật rồi phát lại nhật ký của nó (nếu có).
+        repair=False không cắt giao dịch ghi dở ở cuối nhật ký, dùng khi chỉ
+        đọc trong lúc tiến trình khác có thể đang ghi (vd. server.py).
+        """
+        self.wait()
+        with self.lock:
+            previous, self.path = self.path, str(path or self.path)
+            try:
+                self.kb.load(self.path)
+                self.journal_bytes, self.journal_ops = self._replay(repair)
+            except (RuleFileError, OSError):
+                self.path = previous
+                raise
+    
+    def _replay(self, repair=True):
+        path = self.journal_path
+        if not Path(path).exists():
+            return 0, 0
+        ops = 0
+        size = 0
+        with open(path, 'rb') as f:
+            for lineno, raw in enumerate(f, 1):
+                if not raw.endswith(b'\n'):
+                    break  # giao dịch cuối ghi dở (chương trình dừng đột ngột): bỏ qua
+                try:
+                    changes = json.loads(raw)
+                    self.kb.apply(changes, strict=False)
+                except (ValueError, TypeError) as e:
+                    raise RuleFileError(path, lineno, f"giao dịch hỏng: {e}") from None
+                ops += len(changes)
+                size += len(raw)
+        if repair and size != Path(path).stat().st_size:
+            # cắt phần ghi dở để các giao dịch sau nối tiếp đúng dòng
+            with open(path, 'r+b') as f:
+                f.truncate(size)
+        return size, ops
+    
+    def apply(self, changes):
+        """Áp dụng một lô thay đổi vào kb và ghi thêm một dòng vào nhật ký"""
+        with self.lock:
+            changes = self.kb.apply(changes)
+            if not changes:
+                return
+            line = (json.dumps(changes, ensure_ascii=False) + '\n').encode('utf-8')
+            with open(self.journal_path, 'ab') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.journal_bytes += len(line)
+            self.journal_ops += len(changes)
+            due = self.journal_ops >= max(self.COMPACT_MIN_OPS, len(self.kb.rules) // 2)
+        if due:
+            self.compact(background=True)
+    
+    def set_rule(self, idx, left, right):
+        self.apply([{'op': 'set', 'id': idx, 'left': left, 'right': right}])
+    
+    def delete_rule(self, idx):
+        self.apply([{'op': 'delete', 'id': idx}])
+    
+    def set_facts(self, GT, KL):
+        self.apply([{'op': 'GT', 'facts': sorted(GT)}, {'op': 'KL', 'facts': sorted(KL)}])
+    
+    def renumber(self):
+        """Đánh số lại các luật: đổi nhiều số thứ tự nên ghi lại file luật đầy đủ.
+        Nhật ký được làm rỗng trước để không bị phát lại lên các số thứ tự mới.
+        """
+        self.wait()
+        self.compact()
+        with self.lock:
+            self.kb.renumber()
+        self.compact()
+    
+    def save_as(self, path):
+        """Ghi đầy đủ sang file luật mới và dùng file đó (kèm nhật ký rỗng) từ nay"""
+        self.wait()
+        with self.lock:
+            self.path = str(path)
+            self.journal_bytes = self.journal_ops = 0
+            Path(self.journal_path).unlink(missing_ok=True)
+        self.compact()
+    
+    def compact(self, background=False):
+        """Ghi lại file luật từ trạng thái hiện tại và bỏ phần nhật ký đã có trong đó"""
+        if background:
+            if self.compactor is None or not self.compactor.is_alive():
+                self.compactor = threading.Thread(target=self.compact, daemon=True)
+                self.compactor.start()
+            return
+        with self.compact_lock:
+            with self.lock:
+                rules, GT, KL = dict(self.kb.rules), set(self.kb.GT), set(self.kb.KL)
+                path, offset, ops = self.path, self.journal_bytes, self.journal_ops
+            write_rules_atomic(path, rules, GT, KL)
+            with self.lock:
+                if path != self.path:
+                    return
+                # giữ lại các giao dịch được ghi thêm trong lúc compact
+                journal = Path(self.journal_path)
+                tail = b''
+                if journal.exists():
+                    with open(journal, 'rb') as f:
+                        f.seek(offset)
+                        tail = f.read()
+                if tail:
+                    tmp = journal.with_name(journal.name + '.tmp')
+                    with open(tmp, 'wb') as f:
+                        f.write(tail)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp, journal)
+                else:
+                    journal.unlink(missing_ok=True)
+                self.journal_bytes = len(tail)
+                self.journal_ops -= ops
+    
+    def wait(self):
+        """Chờ lần compact nền (nếu có) kết thúc"""
+        if self.compactor is not None:
+            self.compactor.join()
+
+
+def write_rules_atomic(path, rules, GT, KL):
+    """Ghi file luật (văn bản, JSON hoặc snapshot) ra file tạm rồi thay thế nguyên tử"""
+    path = Path(path)
+    # file tạm giữ phần mở rộng để chọn đúng định dạng khi ghi
+    tmp = path.with_name(f".{path.stem}.tmp{path.suffix}")
+    if path.suffix.lower() == SNAPSHOT_SUFFIX:
+        save_snapshot(tmp, CompiledRuleBase.from_text_rules(rules), GT, KL)
+    else:
+        write_rules_file(tmp, rules, GT, KL)
+    os.replace(tmp, path)
+
+
+# ============ FPG/RPG ============
+def build_fpg(rules, facts=None):
+    """Xây dựng đồ thị FPG (Facts Precedence Graph) theo tên fact.
+    rules: CompiledRuleBase; facts: tập mã fact giữ lại (None là toàn bộ).
+    """
+    import networkx as nx
+    
+    names = rules.fact_names
+    G = nx.DiGraph()
+    if facts is None:
+        selected = rules.rules
+    else:
+        G.add_nodes_from(names[f] for f in facts)
+        positions = {pos for f in facts for pos in rules.fact_index[f]}
+        selected = [rules.rules[pos] for pos in sorted(positions)]
+    for r in selected:
+        if facts is not None and r.conclusion not in facts:
+            continue
+        label = {'rule': f"r{r.idx}"}
+        G.add_edges_from((names[p], names[r.conclusion], label) for p in r.premises
+                         if facts is None or p in facts)
+    return G
+
+
+def build_rpg(rules, positions=None):
+    """Xây dựng đồ thị RPG (Rules Precedence Graph), đỉnh là 'r<số thứ tự luật>'.
+    rules: CompiledRuleBase; cung mang nhãn fact nối hai luật.
+    positions: tập vị trí luật giữ lại (None là toàn bộ).
+    """
+    import networkx as nx
+    
+    names = rules.fact_names
+    G = nx.DiGraph()
+    if positions is not None:
+        G.add_nodes_from(f"r{rules.rules[i].idx}" for i in positions)
+    for i in (range(len(rules.rules)) if positions is None else sorted(positions)):
+        r = rules.rules[i]
+        source, label = f"r{r.idx}", {'label': names[r.conclusion]}
+        G.add_edges_from((source, f"r{rules.rules[j].idx}", label) for j in rules.fact_index[r.conclusion]
+                         if i != j and (positions is None or j in positions))
+    return G
+
+
+def neighborhood(seeds, hops, neighbors):
+    """BFS từ seeds tối đa hops bước; trả về dict đỉnh -> số bước"""
+    dist = dict.fromkeys(seeds, 0)
+    frontier = list(dist)
+    for d in range(1, hops + 1):
+        next_frontier = []
+        for u in frontier:
+            for v in neighbors(u):
+                if v not in dist:
+                    dist[v] = d
+                    next_frontier.append(v)
+        frontier = next_frontier
+    return dist
+
+
+def collapse_sccs(G):
+    """Gộp mỗi thành phần liên thông mạnh nhiều đỉnh thành một đỉnh '{a, b, …}'.
+    Đỉnh gộp có thuộc tính members; cung giữa hai thành phần giữ dữ liệu của
+    một cung bất kỳ nối chúng, cung bên trong thành phần bị bỏ.
+    """
+    import networkx as nx
+    
+    mapping = {}
+    H = nx.DiGraph()
+    for comp in nx.strongly_connected_components(G):
+        if len(comp) == 1:
+            node = next(iter(comp))
+            mapping[node] = node
+            H.add_node(node, **G.nodes[node])
+            continue
+        members = sorted(comp)
+        name = '{' + ', '.join(members[:3]) + (f", … +{len(members) - 3}" if len(members) > 3 else '') + '}'
+        roles = {G.nodes[m].get('role') for m in members}
+        role = 'GT' if 'GT' in roles else 'KL' if 'KL' in roles else None
+        H.add_node(name, members=members, role=role)
+        mapping.update(dict.fromkeys(members, name))
+    H.add_edges_from((mapping[u], mapping[v], data) for u, v, data in G.edges(data=True)
+                     if mapping[u] != mapping[v])
+    return H
+
+
+def graph_view(rules, kind, GT, KL, hops=0, collapse=False):
+    """Dựng đồ thị 'fpg' hoặc 'rpg' để vẽ, trả về (G, pos).
+    hops > 0 chỉ giữ các đỉnh cách GT/KL (với RPG: R_GT/R_KL) không quá hops
+    bước theo cả hai chiều cung, bố cục xếp vòng theo số bước; collapse gộp
+    các thành phần liên thông mạnh. Đỉnh có thuộc tính role ('GT', 'KL' hoặc
+    None) để tô màu.
+    """
+    import networkx as nx
+    
+    rules = rules.with_facts([*GT, *KL])
+    gt = rules.ids(GT)
+    kl = rules.ids(KL)
+    if kind == 'fpg':
+        roles = {f: 'KL' for f in kl}
+        roles.update(dict.fromkeys(gt, 'GT'))
+        
+        def neighbors(f):
+            for pos in rules.fact_index[f]:
+                yield rules.rules[pos].conclusion
+            for pos in rules.producers[f]:
+                yield from rules.rules[pos].premises
+        
+        dist = neighborhood(roles, hops, neighbors) if hops > 0 else None
+        G = build_fpg(rules, dist)
+        node_name = rules.fact_names.__getitem__
+    else:
+        # Phân loại R_GT (mọi tiền đề thuộc GT) và R_KL (kết luận thuộc KL)
+        roles = {}
+        for i, r in enumerate(rules.rules):
+            if r.premises <= gt:
+                roles[i] = 'GT'
+            elif r.conclusion in kl:
+                roles[i] = 'KL'
+        
+        def neighbors(i):
+            r = rules.rules[i]
+            yield from rules.fact_index[r.conclusion]
+            for p in r.premises:
+                yield from rules.producers[p]
+        
+        dist = neighborhood(roles, hops, neighbors) if hops > 0 else None
+        G = build_rpg(rules, dist)
+        node_name = lambda i: f"r{rules.rules[i].idx}"
+    
+    for node, role in roles.items():
+        name = node_name(node)
+        if name in G:
+            G.nodes[name]['role'] = role
+    if collapse:
+        G = collapse_sccs(G)
+    
+    if dist is None or not G:
+        return G, nx.shell_layout(G)
+    # Mỗi vòng của bố cục là các đỉnh cùng số bước tới GT/KL
+    steps = {node_name(node): d for node, d in dist.items()}
+    shells = {}
+    for node, data in G.nodes(data=True):
+        d = min(steps[m] for m in data.get('members', (node,)))
+        shells.setdefault(d, []).append(node)
+    return G, nx.shell_layout(G, [shells[d] for d in sorted(shells)])
+
+
+def d_fpg(table, start, end):
+    return table.distance(start, end)
+
+
+def heuristic_fpg(table, pos):
+    """Tính h(r,GT) = max{d(f, goal) | f in premises} (the smaller the better),
+    với goal là kết luận của r. Nếu mọi d là inf thì trả về inf.
+    table: FPGDistanceTable; pos: vị trí luật trong CompiledRuleBase.
+    """
+    return table.rule_heuristic(pos)
+
+
+def heuristic_rpg(table, pos):
+    """Tính h(r) = số lượng luật phụ thuộc vào r trong RPG.
+    Luật càng ít ảnh hưởng đến luật khác thì càng tốt (nhỏ).
+    table: RPGReachTable; pos: vị trí luật trong CompiledRuleBase.
+    """
+    return table.descendants_count(pos)
+
+
+# ============ SUY DIỄN TIẾN ============
+def relevant_rules(rules, KL, known=()):
+    """Vị trí (đã sắp) các luật có thể góp phần suy ra một fact của KL.
+    Đi ngược FPG từ KL: luật sinh ra một fact cần có là luật liên quan và các
+    tiền đề của nó cũng thành fact cần có; fact đã biết (known) thì không cần
+    suy ra nên không đi tiếp. rules: CompiledRuleBase; KL, known: tập mã fact.
+    """
+    records = rules.rules
+    producers = rules.producers
+    needed = bytearray(len(rules.fact_names))
+    seen = bytearray(len(records))
+    for f in KL:
+        needed[f] = 1
+    stack = [f for f in KL if f not in known]
+    relevant = []
+    while stack:
+        for pos in producers[stack.pop()]:
+            if seen[pos]:
+                continue
+            seen[pos] = 1
+            relevant.append(pos)
+            for p in records[pos].premises:
+                if not needed[p]:
+                    needed[p] = 1
+                    if p not in known:
+                        stack.append(p)
+    relevant.sort()
+    return relevant
+
+
+def forward_chain(rules, GT, KL=(), strategy='min', agenda_type='queue',
+                  fpg_table=None, rpg_table=None, emit=None,
+                  verbosity='full', cancel=None, prune=False, stop_early=False, stats=None):
+    """Thực hiện suy diễn tiến từ GT.
+    rules: CompiledRuleBase (hoặc dict idx -> (premises_set, conclusion))
+    prune=True chỉ xét các luật có thể dẫn tới KL (relevant_rules), khi đó
+    facts chỉ gồm các fact suy ra được trong phần đó; stop_early=True dừng
+    ngay khi mọi fact của KL đã được suy ra. Cả hai bị bỏ qua khi KL rỗng.
+    Trả về dict: facts (tập fact cuối cùng), fired (các luật đã áp dụng theo
+    thứ tự), achieved (các fact của KL đã đạt được).
+    """
+    start = perf_counter()
+    tr = Tracer.of(emit, verbosity, stats)
+    stats = tr.stats
+    timing = stats is not None
+    rules = compile_rules(rules).with_facts([*GT, *KL])
+    records = rules.rules
+    facts = rules.ids(GT)
+    KL = rules.ids(KL)
+    
+    # Xây dựng bảng FPG/RPG nếu cần
+    if strategy == 'fpg' and fpg_table is None:
+        fpg_table = FPGDistanceTable(rules)
+    elif strategy == 'rpg' and rpg_table is None:
+        rpg_table = RPGReachTable(rules)
+        if timing:
+            stats.graph_traversals += 1
+    fpg_traversals = fpg_table.traversals if fpg_table is not None else 0
+    
+    if tr.summary:
+        tr.event('fwd_start', facts=rules.names(facts), strategy=strategy.upper(), agenda=agenda_type.upper())
+    
+    # Khởi tạo agenda: heap theo khóa ưu tiên cho min/max/FPG/RPG,
+    # hàng đợi/ngăn xếp thuần cho các trường hợp còn lại
+    h_values = {}
+    if strategy == 'min':
+        agenda = PriorityAgenda(lambda pos: records[pos].order)
+    elif strategy == 'max':
+        agenda = PriorityAgenda(lambda pos: -records[pos].order)
+    elif strategy == 'fpg':
+        def priority(pos):
+            h_values[pos] = heuristic_fpg(fpg_table, pos)
+            return h_values[pos]
+        agenda = PriorityAgenda(priority)
+    elif strategy == 'rpg':
+        def priority(pos):
+            h_values[pos] = heuristic_rpg(rpg_table, pos)
+            return h_values[pos]
+        agenda = PriorityAgenda(priority)
+    else:
+        agenda = Agenda(lifo=(agenda_type != 'queue'))
+    if timing and strategy in ('fpg', 'rpg'):
+        agenda.priority = stats.timed('heuristic', agenda.priority, 'heuristic_evals')
+    
+    # Số tiền đề chưa thỏa của từng luật: mỗi khi suy ra một fact chỉ cần
+    # duyệt các luật có chứa fact đó (chỉ mục fact_index của tập luật).
+    # Luật bị loại khi cắt tỉa theo KL có missing là None.
+    fact_index = rules.fact_index
+    if prune and KL:
+        active = relevant_rules(rules, KL, facts)
+        missing = [None] * len(records)
+        for pos in active:
+            missing[pos] = len(records[pos].premises - facts)
+        if timing:
+            stats.graph_traversals += 1
+        if tr.summary:
+            tr.event('fwd_pruned', used=len(active), total=len(records))
+    else:
+        active = range(len(records))
+        missing = [len(r.premises - facts) for r in records]
+    
+    # Tìm luật khả dụng ban đầu
+    for pos in active:
+        if missing[pos] == 0 and records[pos].conclusion not in facts:
+            agenda.push(pos)
+    if timing:
+        stats.rules_examined += len(active)
+        stats.premises_checked += sum(len(records[pos].premises) for pos in active)
+        stats.add_time('prepare', perf_counter() - start)
+    
+    fired = []
+    step = 1
+    remaining = len(KL - facts) if stop_early and KL else None
+    while agenda and remaining != 0:
+        check_cancel(cancel)
+        if timing:
+            phase_start = perf_counter()
+        # Chọn luật theo chiến lược
+        if tr.full and strategy in ('fpg', 'rpg'):
+            tr.event('fwd_h', label="h values" if strategy == 'fpg' else "h(r) values",
+                     values={records[pos].idx: h_values[pos] for pos in agenda})
+        chosen = agenda.pop()
+        if timing:
+            stats.rules_examined += 1
+            stats.add_time('select', perf_counter() - phase_start)
+        
+        r = records[chosen]
+        conclusion = r.conclusion
+        
+        if missing[chosen] == 0 and conclusion not in facts:
+            facts.add(conclusion)
+            fired.append(r.idx)
+            if tr.steps:
+                tr.event('fwd_fire', step=step, rule=r.idx, premises=rules.names(r.premises),
+                         conclusion=rules.fact_names[conclusion])
+                if tr.full:
+                    tr.event('fwd_facts', facts=rules.names(facts))
+                tr.event('fwd_step_end')
+            step += 1
+            
+            # Kiểm tra KL
+            if conclusion in KL:
+                if tr.summary:
+                    tr.event('fwd_goal', fact=rules.fact_names[conclusion])
+                if remaining is not None:
+                    remaining -= 1
+                    if remaining == 0:
+                        if tr.summary:
+                            tr.event('fwd_stop')
+                        break
+            
+            # Thêm luật mới khả dụng: chỉ các luật có conclusion ở vế trái
+            if timing:
+                phase_start = perf_counter()
+                stats.rules_examined += len(fact_index[conclusion])
+                stats.premises_checked += len(fact_index[conclusion])
+            for pos in fact_index[conclusion]:
+                if missing[pos] is None:
+                    continue
+                missing[pos] -= 1
+                if missing[pos] == 0 and records[pos].conclusion not in facts and pos not in agenda:
+                    agenda.push(pos)
+            if timing:
+                stats.add_time('propagate', perf_counter() - phase_start)
+    
+    achieved = rules.names(KL & facts)
+    if tr.summary:
+        tr.event('fwd_final', facts=rules.names(facts))
+        if KL:
+            if achieved:
+                tr.event('fwd_achieved', achieved=achieved)
+            else:
+                tr.event('fwd_not_achieved', KL=rules.names(KL))
+    
+    if timing:
+        if fpg_table is not None:
+            stats.graph_traversals += fpg_table.traversals - fpg_traversals
+        stats.add_time('total', perf_counter() - start)
+    return {'facts': rules.names(facts), 'fired': fired, 'achieved': achieved}
+
+
+# Số từ 64 bit tối đa của một ma trận trung gian khi suy diễn theo lô (giới hạn bộ nhớ)
+BATCH_WORDS = 1 << 22
+
+
+def forward_batch(rules, GT_sets, KL=(), cancel=None):
+    """Suy diễn tiến cùng lúc cho nhiều tập giả thiết, không ghi vết.
+    Luật được biểu diễn bằng ma trận liên thuộc tiền đề (dạng CSR) và các tập
+    GT bằng ma trận boolean fact x tập, mỗi từ uint64 chứa bit của 64 tập.
+    Mỗi vòng lặp là một phép nhân ma trận trên nửa vành boolean: luật thỏa
+    khi mọi hàng tiền đề của nó đúng (bitwise_and.reduceat), fact mới là OR
+    theo kết luận; lặp tới điểm bất động. Khi có KL chỉ các luật liên quan tới KL (relevant_rules) được xét.
+    rules: CompiledRuleBase (hoặc dict idx -> (premises_set, conclusion)).
+    Trả về danh sách (theo thứ tự GT_sets) các tập fact của KL đạt được; KL
+    rỗng thì là toàn bộ tập fact suy ra được. Cần numpy.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError("forward_batch cần numpy (pip install numpy)") from None
+    rules = compile_rules(rules).with_facts(KL)
+    fact_ids = rules.fact_ids
+    KL_ids = sorted(rules.ids(KL))
+    positions = relevant_rules(rules, KL_ids) if KL_ids else range(len(rules.rules))
+    records = [rules.rules[pos] for pos in positions]
+    
+    # Chỉ các fact xuất hiện trong các luật được xét (và KL) mới cần một hàng
+    used = set(KL_ids)
+    for r in records:
+        used.update(r.premises)
+        used.add(r.conclusion)
+    used = sorted(used)
+    row_of = {f: i for i, f in enumerate(used)}
+    
+    # Ma trận liên thuộc tiền đề: hàng của luật i là prem_rows[prem_offsets[i]:prem_offsets[i+1]]
+    prem_offsets, prem_rows = _csr(sorted(row_of[p] for p in r.premises) for r in records)
+    prem_offsets = np.frombuffer(prem_offsets, dtype=np.uint32).astype(np.intp)
+    prem_rows = np.frombuffer(prem_rows, dtype=np.uint32).astype(np.intp)
+    no_premises = prem_offsets[1:] == prem_offsets[:-1]
+    prem_starts = np.minimum(prem_offsets[:-1], max(len(prem_rows) - 1, 0))
+    # Các luật được nhóm theo kết luận để OR theo từng fact kết luận
+    conclusions = np.array([row_of[r.conclusion] for r in records], dtype=np.intp)
+    order = np.argsort(conclusions, kind='stable')
+    targets, concl_starts = np.unique(conclusions[order], return_index=True)
+    out_rows = np.array([row_of[f] for f in KL_ids] if KL_ids else range(len(used)), dtype=np.intp)
+    out_names = [rules.fact_names[used[i]] for i in out_rows]
+    KL = set(KL)
+    
+    results = []
+    all_sets = np.uint64(0xFFFFFFFFFFFFFFFF)
+    chunk = 64 * max(1, BATCH_WORDS // max(len(prem_rows), len(used), 1))
+    for first in range(0, len(GT_sets), chunk):
+        block = [set(GT) for GT in GT_sets[first:first + chunk]]
+        X = np.zeros((len(used), (len(block) + 63) // 64), dtype='<u8')
+        for col, GT in enumerate(block):
+            rows = [row_of[f] for f in map(fact_ids.get, GT) if f in row_of]
+            X[rows, col >> 6] |= np.uint64(1 << (col & 63))
+        while records:
+            check_cancel(cancel)
+            if len(prem_rows):
+                satisfied = np.bitwise_and.reduceat(X[prem_rows], prem_starts, axis=0)
+                satisfied[no_premises] = all_sets
+            else:
+                satisfied = np.full((len(records), X.shape[1]), all_sets, dtype='<u8')
+            derived = np.bitwise_or.reduceat(satisfied[order], concl_starts, axis=0)
+            if not (derived & ~X[targets]).any():
+                break
+            X[targets] |= derived
+        # bit col & 63 của từ col >> 6 là tập thứ col (thứ tự byte little-endian)
+        bits = np.unpackbits(X[out_rows].view(np.uint8), axis=1, bitorder='little')
+        for GT, hits in zip(block, bits.T):
+            reached = {out_names[i] for i in np.flatnonzero(hits)}
+            # fact có sẵn trong GT luôn đạt được, kể cả khi không có trong tập luật
+            results.append(reached | (GT & KL if KL else GT))
+    return results
+
+
+
+class IncrementalClosure:
+    """Bao đóng của GT theo toàn bộ tập luật, cập nhật tăng dần khi GT hoặc luật đổi.
+    reason[f] là luật đã suy ra f (None với fact của GT); các lý do này tạo
+    thành một DAG vì luật chỉ được ghi làm lý do khi mọi tiền đề đã có.
+    Thêm fact/luật chỉ lan truyền tiến từ phần mới. Bỏ fact/luật theo kiểu
+    DRed: xóa quá tay các fact có lý do phụ thuộc vào phần bị bỏ, rồi suy lại
+    những fact trong số đó còn một luật khác đủ tiền đề. Chi phí mỗi lần chỉ
+    tỉ lệ với phần bao đóng bị ảnh hưởng, không phải với cả tập luật.
+    """
+    def __init__(self, rules=None, GT=()):
+        self.rules = {}      # idx -> (frozenset tiền đề, kết luận)
+        self.index = {}      # fact -> các luật có fact ở vế trái
+        self.producers = {}  # fact -> các luật suy ra fact
+        self.missing = {}    # idx -> số tiền đề chưa có trong bao đóng
+        self.GT = set()
+        self.reason = {}     # fact trong bao đóng -> luật suy ra (None: thuộc GT)
+        index, producers, missing = self.index, self.producers, self.missing
+        for idx, (premises, conclusion) in (rules or {}).items():
+            premises = frozenset(premises)
+            self.rules[idx] = (premises, conclusion)
+            for p in premises:
+                if p in index:
+                    index[p].add(idx)
+                else:
+                    index[p] = {idx}
+            if conclusion in producers:
+                producers[conclusion].add(idx)
+            else:
+                producers[conclusion] = {idx}
+            missing[idx] = len(premises)
+            if not premises:
+                self.reason.setdefault(conclusion, idx)
+        self._propagate(list(self.reason))
+        self.set_facts(GT)
+    
+    @classmethod
+    def from_text_rules(cls, rules, GT=()):
+        """Dựng từ dict idx -> {'left': 'a^b', 'right': 'c'} (dạng lưu trong file)"""
+        return cls({idx: ([i.strip() for i in rule['left'].split('^') if i.strip()], rule['right'])
+                    for idx, rule in rules.items()}, GT)
+    
+    @property
+    def facts(self):
+        return self.reason.keys()
+    
+    def achieved(self, KL):
+        return {f for f in KL if f in self.reason}
+    
+    def _link(self, idx, premises, conclusion):
+        self.rules[idx] = (premises, conclusion)
+        for p in premises:
+            self.index.setdefault(p, set()).add(idx)
+        self.producers.setdefault(conclusion, set()).add(idx)
+        self.missing[idx] = sum(p not in self.reason for p in premises)
+    
+    def _propagate(self, added):
+        """Lan truyền tiến từ các fact vừa thêm (đã có trong reason)"""
+        stack = list(added)
+        while stack:
+            f = stack.pop()
+            for idx in self.index.get(f, ()):
+                self.missing[idx] -= 1
+                if not self.missing[idx]:
+                    conclusion = self.rules[idx][1]
+                    if conclusion not in self.reason:
+                        self.reason[conclusion] = idx
+                        stack.append(conclusion)
+    
+    def _retract(self, seeds):
+        """Bỏ các fact seeds (đang có trong bao đóng) cùng mọi fact có lý do phụ thuộc vào chúng, rồi suy lại"""
+        removed = list(seeds)
+        for f in removed:
+            del self.reason[f]
+        i = 0
+        while i < len(removed):
+            f = removed[i]
+            i += 1
+            for idx in self.index.get(f, ()):
+                self.missing[idx] += 1
+                conclusion = self.rules[idx][1]
+                if self.reason.get(conclusion) == idx:
+                    del self.reason[conclusion]
+                    removed.append(conclusion)
+        
+        # Suy lại: fact còn một luật đủ tiền đề (không dựa vào phần đã xóa) được thêm lại
+        for f in removed:
+            if f in self.reason:
+                continue
+            for idx in self.producers.get(f, ()):
+                if not self.missing[idx]:
+                    self.reason[f] = idx
+                    self._propagate((f,))
+                    break
+    
+    def set_rule(self, idx, premises, conclusion):
+        """Thêm hoặc thay luật idx"""
+        if idx in self.rules:
+            self.delete_rule(idx)
+        self._link(idx, frozenset(premises), conclusion)
+        if not self.missing[idx] and conclusion not in self.reason:
+            self.reason[conclusion] = idx
+            self._propagate((conclusion,))
+    
+    def delete_rule(self, idx):
+        premises, conclusion = self.rules.pop(idx)
+        for p in premises:
+            self.index[p].discard(idx)
+        self.producers[conclusion].discard(idx)
+        del self.missing[idx]
+        if self.reason.get(conclusion) == idx:
+            self._retract((conclusion,))
+    
+    def set_facts(self, GT):
+        """Đổi tập giả thiết GT"""
+        GT = set(GT)
+        dropped = self.GT - GT  # fact của GT luôn có lý do None
+        added = GT - self.GT
+        self.GT = GT
+        if dropped:
+            self._retract(dropped)
+        new = [f for f in added if f not in self.reason]
+        for f in added:
+            self.reason[f] = None
+        self._propagate(new)
+    
+    def derivation(self, goal):
+        """Các luật dẫn tới goal theo lý do đã ghi: dict fact -> luật; None nếu goal chưa suy ra được"""
+        if goal not in self.reason:
+            return None
+        proof = {}
+        stack = [goal]
+        while stack:
+            f = stack.pop()
+            idx = self.reason[f]
+            if idx is None or f in proof:
+                continue
+            proof[f] = idx
+            stack.extend(self.rules[idx][0])
+        return proof
+
+
+# ============ PHÂN TÍCH TẬP LUẬT ============
+ANALYSIS_REASONS = {
+    'tautology': ("Luật hiển nhiên", "kết luận có sẵn trong vế trái"),
+    'dead': ("Luật chết", "có tiền đề không thể có với bất kỳ GT nào"),
+    'duplicate': ("Luật trùng", "trùng với r{other}"),
+    'subsumed': ("Luật bị bao hàm", "bị r{other} bao hàm (vế trái nhỏ hơn, cùng kết luận)"),
+    'implied': ("Luật suy ra được", "kết luận suy ra được từ vế trái bằng các luật khác"),
+}
+# Số tiền đề tối đa để tìm luật bao hàm bằng cách thử mọi tập con của vế trái
+SUBSET_PREMISES = 8
+# Số lần xét luật tối đa khi thử suy ra kết luận của một luật từ vế trái của nó
+IMPLIED_STEPS = 10000
+
+
+class RuleAnalysis:
+    """Kết quả của analyze_rules trên một CompiledRuleBase.
+    removed: vị trí luật bỏ được -> (lý do trong ANALYSIS_REASONS, vị trí luật
+    thay thế hoặc None); redundant_premises: vị trí luật -> các tiền đề suy ra
+    được từ các tiền đề còn lại (chỉ báo cáo, không sửa luật); cycles: các chu
+    trình của FPG (thành phần liên thông mạnh nhiều fact, đã sắp); inputs: các
+    fact có thể có trong GT (fact không do luật nào suy ra cùng GT đã cho).
+    """
+    def __init__(self, rules):
+        self.rules = rules
+        self.removed = {}
+        self.redundant_premises = {}
+        self.cycles = []
+        self.inputs = set()
+    
+    @property
+    def kept(self):
+        return [pos for pos in range(len(self.rules.rules)) if pos not in self.removed]
+    
+    def reduced_rules(self, text_rules=None):
+        """Tập luật rút gọn dạng dict idx -> {'left', 'right'}; text_rules giữ nguyên cách viết trong file"""
+        records = self.rules.rules
+        if text_rules is None:
+            text_rules = self.rules.text_rules()
+        return {records[pos].idx: text_rules[records[pos].idx] for pos in self.kept}
+    
+    def format(self, timings=None):
+        """Báo cáo dạng văn bản; timings: (giây với tập luật đầy đủ, giây với tập luật rút gọn)"""
+        records = self.rules.rules
+        names = self.rules.fact_names
+        n = len(records)
+        lines = [f"Tập luật: {n} luật, bỏ được {len(self.removed)} luật (còn {n - len(self.removed)})"]
+        for reason, (title, text) in ANALYSIS_REASONS.items():
+            found = sorted((records[pos].order, records[pos].idx, other)
+                           for pos, (why, other) in self.removed.items() if why == reason)
+            if found:
+                lines.append(f"- {title} ({len(found)}):")
+                lines.extend(f"    r{idx}: " + text.format(other=records[other].idx if other is not None else '')
+                             for _, idx, other in found)
+        if self.redundant_premises:
+            lines.append(f"- Tiền đề thừa ({len(self.redundant_premises)} luật, giữ nguyên):")
+            for pos in sorted(self.redundant_premises, key=lambda pos: records[pos].order):
+                lines.append(f"    r{records[pos].idx}: {', '.join(self.redundant_premises[pos])} "
+                             f"suy ra được từ các tiền đề còn lại")
+        if self.cycles:
+            lines.append(f"- Chu trình FPG ({len(self.cycles)}):")
+            lines.extend(f"    {{{', '.join(cycle)}}}" for cycle in self.cycles)
+        if timings is not None:
+            full, reduced = timings
+            ratio = f"{full / reduced:.2f}x" if reduced > 0 else "∞"
+            lines.append(f"Suy diễn tiến trên GT: {full * 1000:.2f} ms → {reduced * 1000:.2f} ms ({ratio})")
+        return '\n'.join(lines)
+
+
+def fact_cycles(rules):
+    """Các thành phần liên thông mạnh nhiều đỉnh của FPG (Tarjan, không đệ quy), theo tên fact"""
+    records, fact_index = rules.rules, rules.fact_index
+    n = len(rules.fact_names)
+    succ = [sorted({records[pos].conclusion for pos in fact_index[f]}) for f in range(n)]
+    index = [-1] * n
+    lowlink = [0] * n
+    on_stack = bytearray(n)
+    scc_stack = []
+    counter = 0
+    cycles = []
+    for root in range(n):
+        if index[root] != -1:
+            continue
+        work = [(root, 0)]
+        while work:
+            v, i = work.pop()
+            if i == 0:
+                index[v] = lowlink[v] = counter
+                counter += 1
+                scc_stack.append(v)
+                on_stack[v] = 1
+            recurse = False
+            while i < len(succ[v]):
+                w = succ[v][i]
+                i += 1
+                if index[w] == -1:
+                    work.append((v, i))
+                    work.append((w, 0))
+                    recurse = True
+                    break
+                if on_stack[w]:
+                    lowlink[v] = min(lowlink[v], index[w])
+            if recurse:
+                continue
+            if lowlink[v] == index[v]:
+                members = []
+                while True:
+                    w = scc_stack.pop()
+                    on_stack[w] = 0
+                    members.append(w)
+                    if w == v:
+                        break
+                if len(members) > 1:
+                    cycles.append(sorted(rules.fact_names[w] for w in members))
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[v])
+    cycles.sort()
+    return cycles
+
+
+def analyze_rules(rules, GT=(), implied=True, max_steps=IMPLIED_STEPS):
+    """Tìm các luật thừa của tập luật (CompiledRuleBase), trả về RuleAnalysis.
+    Theo thứ tự: luật có kết luận nằm trong vế trái; luật chết (có tiền đề
+    không suy ra được từ mọi fact có thể thuộc GT: các fact không do luật nào
+    suy ra cùng GT đã cho); luật trùng; luật bị bao hàm (luật khác cùng kết
+    luận có vế trái là tập con thực sự); với implied, luật có kết luận suy ra
+    được từ vế trái bằng các luật còn lại (thử tối đa max_steps lần xét luật).
+    Luật có số thứ tự nhỏ hơn được giữ lại. Mỗi luật chỉ bị bỏ khi phần còn
+    lại vẫn cho cùng bao đóng, nên tập luật rút gọn cho cùng tập fact suy ra
+    được với mọi GT gồm các fact của inputs.
+    """
+    rules = rules.with_facts(GT)
+    records = rules.rules
+    names = rules.fact_names
+    analysis = RuleAnalysis(rules)
+    removed = analysis.removed
+    order = sorted(range(len(records)), key=lambda pos: (records[pos].order, pos))
+    
+    for pos in order:
+        if records[pos].conclusion in records[pos].premises:
+            removed[pos] = ('tautology', None)
+    
+    # Fact có thể thuộc GT: không luật nào (còn lại) suy ra, hoặc có trong GT đã cho
+    produced = bytearray(len(names))
+    for pos, r in enumerate(records):
+        if pos not in removed:
+            produced[r.conclusion] = 1
+    inputs = {f for f in range(len(names)) if not produced[f]} | rules.ids(GT)
+    analysis.inputs = rules.names(inputs)
+    reachable = bytearray(len(names))
+    missing = [len(r.premises) for r in records]
+    stack = list(inputs)
+    for f in inputs:
+        reachable[f] = 1
+    for pos, r in enumerate(records):
+        if not r.premises and pos not in removed and not reachable[r.conclusion]:
+            reachable[r.conclusion] = 1
+            stack.append(r.conclusion)
+    while stack:
+        for pos in rules.fact_index[stack.pop()]:
+            missing[pos] -= 1
+            c = records[pos].conclusion
+            if not missing[pos] and pos not in removed and not reachable[c]:
+                reachable[c] = 1
+                stack.append(c)
+    for pos in order:
+        if pos not in removed and not all(reachable[p] for p in records[pos].premises):
+            removed[pos] = ('dead', None)
+    
+    # Luật trùng và luật bị bao hàm: tra vế trái (và các tập con của nó) theo kết luận
+    by_key = {}
+    for pos in order:
+        if pos in removed:
+            continue
+        r = records[pos]
+        key = (r.premises, r.conclusion)
+        if key in by_key:
+            removed[pos] = ('duplicate', by_key[key])
+        else:
+            by_key[key] = pos
+    for pos in order:
+        if pos in removed:
+            continue
+        r = records[pos]
+        premises = sorted(r.premises)
+        if len(premises) <= SUBSET_PREMISES:
+            subsets = (frozenset(p for i, p in enumerate(premises) if mask >> i & 1)
+                       for mask in range((1 << len(premises)) - 1))
+            by = next((by_key[(sub, r.conclusion)] for sub in subsets
+                       if (sub, r.conclusion) in by_key and by_key[(sub, r.conclusion)] not in removed), None)
+        else:
+            by = next((other for other in rules.producers[r.conclusion] if other not in removed
+                       and records[other].premises < r.premises), None)
+        if by is not None:
+            removed[pos] = ('subsumed', by)
+    
+    def derivable(start, target, skip):
+        """target có suy ra được từ tập fact start bằng các luật còn lại (trừ skip) không;
+        None nếu vượt max_steps
+        """
+        have = set(start)
+        have.update(records[pos].conclusion for pos in axioms if pos != skip and pos not in removed)
+        if target in have:
+            return True
+        counts = {}
+        stack = list(have)
+        steps = 0
+        while stack:
+            for pos in rules.fact_index[stack.pop()]:
+                if pos == skip or pos in removed:
+                    continue
+                steps += 1
+                if steps > max_steps:
+                    return None
+                left = counts.get(pos, len(records[pos].premises)) - 1
+                counts[pos] = left
+                c = records[pos].conclusion
+                if not left and c not in have:
+                    if c == target:
+                        return True
+                    have.add(c)
+                    stack.append(c)
+        return False
+    
+    axioms = [pos for pos, r in enumerate(records) if not r.premises]
+    if implied:
+        # Xét từ luật có số thứ tự lớn nhất để giữ lại các luật đứng trước
+        for pos in reversed(order):
+            if pos not in removed and derivable(records[pos].premises, records[pos].conclusion, pos):
+                removed[pos] = ('implied', None)
+        for pos in order:
+            premises = records[pos].premises
+            if pos in removed or len(premises) < 2:
+                continue
+            extra = [p for p in premises if derivable(premises - {p}, p, pos)]
+            if extra:
+                analysis.redundant_premises[pos] = sorted(names[p] for p in extra)
+    
+    analysis.cycles = fact_cycles(rules)
+    return analysis
+
+# ============ SUY DIỄN LÙI ============
+def prove(goal, rules, GT, strategy='min', tabled=False, fpg_table=None, emit=None,
+          verbosity='full', cancel=None, stats=None, max_nodes=None, max_open=None):
+    """Thực hiện suy diễn lùi chứng minh goal từ GT.
+    rules: CompiledRuleBase (hoặc dict idx -> (premises_set, conclusion))
+    tabled=True dùng suy diễn lùi có ghi nhớ (backward_chain_tabled).
+    strategy='best' tìm chứng minh ít luật nhất (backward_best_first, bỏ qua
+    tabled) với các giới hạn max_nodes/max_open (None: BEST_FIRST_NODES/BEST_FIRST_OPEN).
+    Trả về dict: goal, success, proof (dict mục tiêu -> luật đã dùng); với
+    'best' có thêm dag (mục tiêu -> các tiền đề cần chứng minh) và optimal.
+    """
+    start = perf_counter()
+    tr = Tracer.of(emit, verbosity, stats)
+    stats = tr.stats
+    rules = compile_rules(rules).with_facts([goal, *GT])
+    known = rules.ids(GT)
+    goal_id = rules.fact_id(goal)
+    
+    # Xây dựng bảng FPG nếu cần
+    if strategy == 'fpg':
+        if fpg_table is None:
+            fpg_table = FPGDistanceTable(rules)
+        if tr.summary:
+            tr.event('bwd_build_fpg')
+    fpg_traversals = fpg_table.traversals if fpg_table is not None else 0
+    
+    if tr.summary:
+        tr.event('bwd_start', facts=rules.names(known), goal=goal, strategy=strategy.upper())
+    
+    if stats is not None:
+        search_start = perf_counter()
+        stats.add_time('prepare', search_start - start)
+    extra = {}
+    if strategy == 'best':
+        result, proven, optimal = backward_best_first(goal_id, known, rules, tr, cancel, max_nodes, max_open)
+        proof = extract_proof(goal_id, proven, rules)
+        extra = {'optimal': optimal,
+                 'dag': {rules.fact_names[g]: sorted(rules.names(rules.rules[pos].premises))
+                         for g, pos in proven.items()}}
+        if result and proof and tr.summary:
+            tr.event('bwd_proof_rules',
+                     rules=', '.join(f"r{r}" for r in sorted(set(proof.values()), key=rule_order)))
+    elif tabled:
+        result, proof = backward_chain_tabled(goal_id, known, rules, strategy, fpg_table, tr, cancel)
+        if result and tr.summary:
+            tr.event('bwd_proof_rules',
+                     rules=', '.join(f"r{r}" for r in sorted(set(proof.values()), key=rule_order)))
+    else:
+        proven = {}
+        result = backward_chain(goal_id, known, rules, strategy, 0, set(), fpg_table, tr, proven, cancel)
+        proof = extract_proof(goal_id, proven, rules) if result else {}
+    if stats is not None:
+        stats.add_time('search', perf_counter() - search_start)
+    
+    if tr.summary:
+        tr.event('bwd_success' if result else 'bwd_failure', goal=goal)
+    
+    if stats is not None:
+        if fpg_table is not None:
+            stats.graph_traversals += fpg_table.traversals - fpg_traversals
+        stats.add_time('total', perf_counter() - start)
+    return {'goal': goal, 'success': result, 'proof': proof, **extra}
+
+
+def prove_all(goals, rules, GT, strategy='min', fpg_table=None, emit=None, verbosity='full',
+              cancel=None, stats=None, max_nodes=None, max_open=None, proofs=True):
+    """Suy diễn lùi chứng minh lần lượt mọi mục tiêu trong goals trong một lượt.
+    Các mục tiêu dùng chung một bảng ghi nhớ (backward_chain_tabled với table)
+    nên mục tiêu con đã chứng minh hoặc đã thất bại chắc chắn khi xét một mục
+    tiêu không phải giải lại cho các mục tiêu sau. strategy='best' tìm chứng
+    minh ít luật nhất riêng cho từng mục tiêu (backward_best_first, không dùng
+    chung bảng).
+    Trả về dict: goals (các mục tiêu theo thứ tự), success (mọi mục tiêu đều
+    chứng minh được), results (mục tiêu -> dict success, proof; với 'best' có
+    thêm optimal và dag như prove) và subgoals (số mục tiêu con trong bảng chung).
+    Trừ 'best', kết quả có thêm proof chung (hợp các chứng minh, đi theo luật
+    từ một mục tiêu là dựng lại được chứng minh của nó); proofs=False bỏ proof
+    riêng của từng mục tiêu, vốn có thể gần bằng cả tập luật với mỗi mục tiêu.
+    """
+    start = perf_counter()
+    tr = Tracer.of(emit, verbosity, stats)
+    stats = tr.stats
+    goals = list(dict.fromkeys(goals))
+    rules = compile_rules(rules).with_facts([*goals, *GT])
+    known = rules.ids(GT)
+    
+    if strategy == 'fpg':
+        if fpg_table is None:
+            fpg_table = FPGDistanceTable(rules)
+        if tr.summary:
+            tr.event('bwd_build_fpg')
+    fpg_traversals = fpg_table.traversals if fpg_table is not None else 0
+    
+    if tr.summary:
+        tr.event('bwd_multi_start', facts=rules.names(known), goals=', '.join(goals), total=len(goals),
+                 strategy=strategy.upper())
+    
+    if stats is not None:
+        search_start = perf_counter()
+        stats.add_time('prepare', search_start - start)
+    table = ({}, set())
+    results = {}
+    for n, goal in enumerate(goals, 1):
+        check_cancel(cancel)
+        if tr.summary:
+            tr.event('bwd_multi_goal', n=n, total=len(goals), goal=goal)
+        goal_id = rules.fact_id(goal)
+        if strategy == 'best':
+            result, proven, optimal = backward_best_first(goal_id, known, rules, tr, cancel, max_nodes, max_open)
+            proof = extract_proof(goal_id, proven, rules)
+            results[goal] = {'success': result, 'proof': proof, 'optimal': optimal,
+                             'dag': {rules.fact_names[g]: sorted(rules.names(rules.rules[pos].premises))
+                                     for g, pos in proven.items()}}
+        else:
+            result, proof = backward_chain_tabled(goal_id, known, rules, strategy, fpg_table, tr, cancel, table,
+                                                  extract=proofs or tr.summary)
+            results[goal] = {'success': result, 'proof': proof} if proofs else {'success': result}
+        if result and proof and tr.summary:
+            tr.event('bwd_proof_rules',
+                     rules=', '.join(f"r{r}" for r in sorted(set(proof.values()), key=rule_order)))
+        if tr.summary:
+            tr.event('bwd_success' if result else 'bwd_failure', goal=goal)
+    if stats is not None:
+        stats.add_time('search', perf_counter() - search_start)
+    
+    failed = [goal for goal in goals if not results[goal]['success']]
+    subgoals = len(table[0]) + len(table[1])
+    extra = {}
+    if strategy != 'best':
+        extra['proof'] = extract_proofs([rules.fact_id(goal) for goal in goals if results[goal]['success']],
+                                        table[0], rules)
+    if tr.summary:
+        tr.event('bwd_multi_done', proven=len(goals) - len(failed), total=len(goals), subgoals=subgoals)
+        if failed:
+            tr.event('bwd_multi_failed', goals=', '.join(failed))
+    
+    if stats is not None:
+        if fpg_table is not None:
+            stats.graph_traversals += fpg_table.traversals - fpg_traversals
+        stats.add_time('total', perf_counter() - start)
+    return {'goals': goals, 'success': not failed, 'results': results, 'subgoals': subgoals, **extra}
+
+
+def sort_applicable(applicable, goal, rules, strategy, fpg_table, depth, emit=None):
+    """Sắp xếp các luật (vị trí) suy ra goal theo chiến lược min/max/fpg"""
+    records = rules.rules
+    if strategy == 'min':
+        return sorted(applicable, key=lambda pos: records[pos].order)
+    elif strategy == 'max':
+        return sorted(applicable, key=lambda pos: records[pos].order, reverse=True)
+    elif strategy == 'fpg' and fpg_table is not None:
+        # Tính h(r,GT) cho từng luật và sắp xếp theo h tăng dần
+        start = perf_counter()
+        h_values = {}
+        for pos in applicable:
+            h_values[pos] = heuristic_fpg(fpg_table, pos)
+        
+        tr = Tracer.of(emit)
+        if tr.stats is not None:
+            tr.stats.heuristic_evals += len(h_values)
+            tr.stats.add_time('heuristic', perf_counter() - start)
+        if tr.full:
+            tr.event('bwd_h', depth=depth, values={records[pos].idx: h for pos, h in h_values.items()})
+        return sorted(applicable, key=lambda pos: h_values.get(pos, float('inf')))
+    else:
+        return sorted(applicable, key=lambda pos: records[pos].order)
+
+
+def backward_chain(goal, known, rules, strategy, depth, used, fpg_table=None,
+                   emit=None, proven=None, cancel=None):
+    """Thuật toán suy diễn lùi (đệ quy, quay lui) trên CompiledRuleBase.
+    goal, known: mã fact; used: vị trí các luật đã dùng trên nhánh hiện tại.
+    proven: dict (tùy chọn) nhận mã mục tiêu -> vị trí luật đã chứng minh được nó.
+    emit: hàm nhận chuỗi hoặc Tracer (mức chi tiết của Tracer được giữ qua các lời gọi đệ quy).
+    """
+    tr = Tracer.of(emit)
+    check_cancel(cancel)
+    names = rules.fact_names
+    
+    if tr.full:
+        tr.event('bwd_goal', depth=depth, goal=names[goal])
+    
+    if goal in known:
+        if tr.full:
+            tr.event('bwd_in_gt', depth=depth, goal=names[goal])
+        return True
+    
+    # Tìm luật có kết luận là goal
+    applicable = [pos for pos in rules.producers[goal] if pos not in used]
+    
+    if not applicable:
+        if tr.full:
+            tr.event('bwd_no_rule', depth=depth, goal=names[goal])
+        return False
+    
+    # Sắp xếp các luật áp dụng được theo chiến lược
+    sorted_rules = sort_applicable(applicable, goal, rules, strategy, fpg_table, depth, tr)
+    
+    # Thử từng luật một (Backtracking)
+    stats = tr.stats
+    for r_chosen in sorted_rules:
+        r = rules.rules[r_chosen]
+        if stats is not None:
+            stats.rules_examined += 1
+        
+        if tr.steps:
+            tr.event('bwd_try', depth=depth, rule=r.idx, premises=rules.names(r.premises),
+                     conclusion=names[r.conclusion])
+        
+        # Đánh dấu luật đã dùng trong nhánh này
+        new_used = used.copy()
+        new_used.add(r_chosen)
+        
+        all_proven = True
+        for p in r.premises:
+            if stats is not None:
+                stats.premises_checked += 1
+            if not backward_chain(p, known, rules, strategy, depth + 1, new_used, fpg_table, tr, proven, cancel):
+                all_proven = False
+                if tr.full:
+                    tr.event('bwd_premise_failed', depth=depth, premise=names[p], rule=r.idx)
+                break
+        
+        if all_proven:
+            if tr.steps:
+                tr.event('bwd_proved', depth=depth, goal=names[goal], rule=r.idx)
+            known.add(goal)
+            if proven is not None:
+                proven[goal] = r_chosen
+            return True
+        if stats is not None:
+            stats.backtracks += 1
+        if tr.steps:
+            tr.event('bwd_backtrack', depth=depth, rule=r.idx)
+    
+    if tr.steps:
+        tr.event('bwd_exhausted', depth=depth, goal=names[goal])
+    return False
+
+
+def backward_chain_tabled(goal, known, rules, strategy, fpg_table=None, emit=None, cancel=None, table=None,
+                          extract=True):
+    """Suy diễn lùi có ghi nhớ (tabled), dùng ngăn xếp tường minh thay cho đệ quy.
+    Mỗi mục tiêu đã chứng minh hoặc đã thất bại chắc chắn được lưu lại trong
+    lần truy vấn nên chỉ được giải một lần. Mục tiêu gặp lại khi đang chứng
+    minh chính nó (chu trình) bị coi là thất bại tạm thời.
+    Các mục tiêu được mở nằm trên một ngăn xếp hoàn tất (như completion của
+    SLG, low là vị trí trên ngăn xếp này như trong Tarjan). Thất bại tạm thời
+    được ghi nhớ cho tới khi một mục tiêu từng bị giả định thất bại lại chứng
+    minh được (giả định bị lật). Khi mục tiêu đứng đầu một nhóm phụ thuộc lẫn
+    nhau (low >= vị trí của nó) thử hết luật: nếu giả định bị lật trong lúc
+    giải nhóm thì nhóm được giải lại, ngược lại mọi mục tiêu của nhóm chưa
+    chứng minh được đều được ghi nhớ là thất bại chắc chắn. Mỗi mục tiêu vì
+    thế chỉ được mở lại sau mỗi lần giả định bị lật, không bùng nổ theo số
+    đường đi qua chu trình.
+    goal, known: mã fact trong CompiledRuleBase rules.
+    table: (proven, failed) dùng chung giữa các lần gọi với cùng known (xem
+    prove_all); None thì mỗi lần gọi có bảng riêng.
+    Trả về (kết quả, proof) với proof: dict tên mục tiêu -> luật đã dùng
+    (extract=False thì proof rỗng, không tốn công dựng chứng minh).
+    """
+    tr = Tracer.of(emit)
+    stats = tr.stats
+    no_cycle = float('inf')
+    names = rules.fact_names
+    records = rules.rules
+    
+    # proven: mục tiêu -> vị trí luật đã chứng minh được nó; failed: mục tiêu thất bại chắc chắn
+    proven, failed = table if table is not None else ({}, set())
+    in_progress = {}  # mục tiêu đang chứng minh -> vị trí trên ngăn xếp hoàn tất
+    completion = []   # các mục tiêu đã mở của các nhóm chưa hoàn tất, theo thứ tự mở
+    tentative = {}    # mục tiêu thất bại tạm thời -> low của nó (xóa khi giả định bị lật)
+    assumed = set()   # mục tiêu từng bị coi là thất bại tạm thời
+    revised = 0       # số lần một mục tiêu trong assumed lại chứng minh được
+    
+    def enter(g, depth):
+        """Mở mục tiêu g: trả về GoalFrame cần duyệt tiếp, hoặc (kết quả, low)."""
+        if tr.full:
+            tr.event('bwd_goal', depth=depth, goal=names[g])
+        if g in known:
+            if tr.full:
+                tr.event('bwd_in_gt', depth=depth, goal=names[g])
+            return True, no_cycle
+        if g in proven:
+            if tr.full:
+                tr.event('bwd_memo_proven', depth=depth, goal=names[g], rule=records[proven[g]].idx)
+            return True, no_cycle
+        if g in failed:
+            if tr.full:
+                tr.event('bwd_memo_failed', depth=depth, goal=names[g])
+            return False, no_cycle
+        if g in in_progress:
+            if tr.full:
+                tr.event('bwd_cycle', depth=depth, goal=names[g])
+            assumed.add(g)
+            return False, in_progress[g]
+        if g in tentative:
+            if tr.full:
+                tr.event('bwd_memo_tentative', depth=depth, goal=names[g])
+            return False, tentative[g]
+        applicable = rules.producers[g]
+        if not applicable:
+            if tr.full:
+                tr.event('bwd_no_rule', depth=depth, goal=names[g])
+            failed.add(g)
+            return False, no_cycle
+        in_progress[g] = len(completion)
+        completion.append(g)
+        return GoalFrame(g, depth, sort_applicable(applicable, g, rules, strategy, fpg_table, depth, tr),
+                         len(completion) - 1, revised)
+    
+    res = enter(goal, 0)
+    stack = [res] if isinstance(res, GoalFrame) else []
+    while stack:
+        check_cancel(cancel)
+        frame = stack[-1]
+        depth = frame.depth
+        
+        if isinstance(res, tuple) and frame.premises is not None:
+            # Vừa giải xong tiền đề hiện tại của luật đang thử
+            ok, low = res
+            frame.low = min(frame.low, low)
+            if ok:
+                frame.prem_pos += 1
+            else:
+                r = records[frame.rules[frame.rule_pos]]
+                if stats is not None:
+                    stats.backtracks += 1
+                if tr.full:
+                    tr.event('bwd_premise_failed', depth=depth, premise=names[frame.premises[frame.prem_pos]], rule=r.idx)
+                if tr.steps:
+                    tr.event('bwd_backtrack', depth=depth, rule=r.idx)
+                frame.rule_pos += 1
+                frame.premises = None
+        
+        if frame.premises is None:
+            if frame.rule_pos >= len(frame.rules):
+                # Đã thử hết luật
+                if tr.steps:
+                    tr.event('bwd_exhausted', depth=depth, goal=names[frame.goal])
+                if frame.low < frame.base:
+                    # Phụ thuộc mục tiêu tầng trên: chỉ thất bại tạm thời
+                    del in_progress[frame.goal]
+                    stack.pop()
+                    assumed.add(frame.goal)
+                    tentative[frame.goal] = frame.low
+                    res = (False, frame.low)
+                    continue
+                members = completion[frame.base + 1:]
+                del completion[frame.base + 1:]
+                if revised != frame.revised:
+                    # Giả định bị lật trong lúc giải nhóm: giải lại nhóm từ đầu
+                    if tr.steps:
+                        tr.event('bwd_reopen', depth=depth, goal=names[frame.goal])
+                    for g in members:
+                        tentative.pop(g, None)
+                    frame.rule_pos = 0
+                    frame.low = no_cycle
+                    frame.revised = revised
+                    res = None
+                    continue
+                del completion[frame.base:]
+                del in_progress[frame.goal]
+                stack.pop()
+                failed.add(frame.goal)
+                for g in members:
+                    if g not in proven:
+                        failed.add(g)
+                        tentative.pop(g, None)
+                res = (False, no_cycle)
+                continue
+            r = records[frame.rules[frame.rule_pos]]
+            if stats is not None:
+                stats.rules_examined += 1
+            if tr.steps:
+                tr.event('bwd_try', depth=depth, rule=r.idx, premises=rules.names(r.premises),
+                         conclusion=names[r.conclusion])
+            frame.premises = list(r.premises)
+            frame.prem_pos = 0
+        
+        if frame.prem_pos == len(frame.premises):
+            pos = frame.rules[frame.rule_pos]
+            if tr.steps:
+                tr.event('bwd_proved', depth=depth, goal=names[frame.goal], rule=records[pos].idx)
+            proven[frame.goal] = pos
+            if frame.goal in assumed:
+                # các thất bại tạm thời có thể đã dựa vào giả định goal thất bại
+                revised += 1
+                tentative.clear()
+            del in_progress[frame.goal]
+            if frame.base == len(completion) - 1:
+                completion.pop()
+            stack.pop()
+            res = (True, no_cycle)
+            continue
+        
+        if stats is not None:
+            stats.premises_checked += 1
+        res = enter(frame.premises[frame.prem_pos], frame.depth + 1)
+        if isinstance(res, GoalFrame):
+            stack.append(res)
+    
+    result = res[0]
+    return result, extract_proof(goal, proven, rules) if result and extract else {}
+
+
+# Giới hạn mặc định của tìm kiếm best-first: số trạng thái được mở và số trạng thái chờ giữ trong bộ nhớ
+BEST_FIRST_NODES = 100000
+BEST_FIRST_OPEN = 50000
+
+
+def proof_levels(rules, goal, known):
+    """Số tầng suy diễn tối thiểu của các fact có thể góp phần suy ra goal.
+    Là khoảng cách FPG từ GT tới fact nhưng có tính tới phép AND: fact thuộc
+    known ở tầng 0, kết luận của một luật ở tầng 1 + tầng lớn nhất của các
+    tiền đề. Mọi chứng minh của f cần ít nhất levels[f] luật (một đường từ
+    GT tới f), nên đây là cận dưới chấp nhận được cho A*. Fact không có
+    trong kết quả thì không chứng minh được.
+    Trả về (levels, via): via[f] là vị trí luật cho f tầng nhỏ nhất.
+    """
+    records = rules.rules
+    positions = relevant_rules(rules, (goal,), known)
+    missing = {}
+    watch = {}  # fact -> vị trí các luật liên quan có fact ở vế trái
+    for pos in positions:
+        premises = records[pos].premises
+        missing[pos] = len(premises)
+        for p in premises:
+            watch.setdefault(p, []).append(pos)
+    
+    levels = {f: 0 for f in known if f in watch}
+    via = {}
+    queue = deque(levels)
+    for pos in positions:
+        c = records[pos].conclusion
+        if not missing[pos] and c not in levels and c not in known:
+            levels[c] = 1
+            via[c] = pos
+            queue.append(c)
+    while queue:
+        f = queue.popleft()
+        for pos in watch.get(f, ()):
+            missing[pos] -= 1
+            c = records[pos].conclusion
+            if not missing[pos] and c not in levels and c not in known:
+                # các fact ra khỏi hàng theo tầng tăng dần nên f là tiền đề có tầng lớn nhất
+                levels[c] = levels[f] + 1
+                via[c] = pos
+                queue.append(c)
+    return levels, via
+
+
+def backward_best_first(goal, known, rules, emit=None, cancel=None, max_nodes=None, max_open=None):
+    """Suy diễn lùi best-first (A*) trên không gian trạng thái AND-OR của chứng minh.
+    Mỗi trạng thái là một chứng minh dở dang: các mục tiêu đã chọn luật
+    (proof) và các mục tiêu mở còn phải chứng minh. Mở một trạng thái là chọn
+    luật cho mục tiêu mở khó nhất; g là số luật đã dùng (mỗi mục tiêu chỉ
+    chứng minh một lần nên chứng minh là một DAG), h là cận dưới
+    max(số mục tiêu mở, tầng lớn nhất của chúng) theo proof_levels. h nhất
+    quán nên chứng minh đầu tiên lấy ra là chứng minh ít luật nhất.
+    h không dùng khoảng cách d(f, goal) của bảng FPG: đó là số bước từ f đi
+    lên tới goal, không nói gì về số luật còn cần để chứng minh f từ GT nên
+    không phải cận dưới. proof_levels là khoảng cách FPG theo chiều ngược lại
+    (từ GT tới f) có tính phép AND: chứng minh của f chứa một chuỗi ít nhất
+    levels[f] luật, và mỗi mục tiêu mở cần một luật riêng (mỗi luật chỉ có
+    một kết luận), nên h không vượt số luật còn thiếu.
+    max_nodes giới hạn số trạng thái được mở; khi hàng đợi vượt max_open thì
+    chỉ giữ nửa tốt nhất (khi đó không còn bảo đảm tối ưu). Hết giới hạn thì
+    trả về chứng minh theo tầng của proof_levels (đúng nhưng có thể dài hơn).
+    goal, known: mã fact trong CompiledRuleBase rules.
+    Trả về (kết quả, proven: mã mục tiêu -> vị trí luật, tối ưu hay không).
+    """
+    tr = Tracer.of(emit)
+    stats = tr.stats
+    names = rules.fact_names
+    records = rules.rules
+    producers = rules.producers
+    max_nodes = BEST_FIRST_NODES if max_nodes is None else max_nodes
+    max_open = BEST_FIRST_OPEN if max_open is None else max_open
+    
+    if goal in known:
+        if tr.full:
+            tr.event('bwd_in_gt', depth=0, goal=names[goal])
+        return True, {}, True
+    levels, via = proof_levels(rules, goal, known)
+    if stats is not None:
+        stats.graph_traversals += 1
+    if goal not in levels:
+        if tr.summary:
+            tr.event('bwd_best_unprovable', goal=names[goal])
+        return False, {}, True
+    if tr.summary:
+        tr.event('bwd_best_start', bound=levels[goal], nodes=max_nodes, limit=max_open)
+    
+    def h(open_goals):
+        return max(len(open_goals), max(levels[g] for g in open_goals)) if open_goals else 0
+    
+    def reaches(start, target, proof):
+        """target có nằm trong chứng minh con của start (theo proof) không"""
+        stack = [start]
+        seen = set()
+        while stack:
+            f = stack.pop()
+            if f == target:
+                return True
+            if f in seen or f not in proof:
+                continue
+            seen.add(f)
+            stack.extend(records[proof[f]].premises)
+        return False
+    
+    def expand(proof, open_goals):
+        """Các trạng thái con (f, chứng minh, mục tiêu mở) khi chọn luật cho mục tiêu mở khó nhất"""
+        g = max(open_goals, key=lambda x: (levels[x], -x))
+        candidates = []
+        for pos in sorted(producers[g], key=lambda pos: records[pos].order):
+            premises = records[pos].premises
+            if stats is not None:
+                stats.rules_examined += 1
+                stats.premises_checked += len(premises)
+            # bỏ luật có tiền đề không chứng minh được hoặc tạo chu trình trong chứng minh
+            if not any(p not in levels or reaches(p, g, proof) for p in premises):
+                candidates.append(pos)
+        
+        rest = open_goals - {g}
+        children = []
+        for i, pos in enumerate(candidates):
+            r = records[pos]
+            # trạng thái cha không dùng nữa nên con cuối cùng nhận luôn dict của nó
+            child = proof if i == len(candidates) - 1 else dict(proof)
+            child[g] = pos
+            child_open = rest | {p for p in r.premises if p not in known and p not in child}
+            bound = len(child) + h(child_open)
+            if stats is not None:
+                stats.heuristic_evals += 1
+            if tr.full:
+                tr.event('bwd_best_rule', rule=r.idx, goal=names[g], bound=bound)
+            children.append((bound, child, child_open))
+        return g, children
+    
+    # Mục tiêu được chọn chỉ phụ thuộc vào trạng thái và mỗi con gán một luật khác
+    # nhau cho nó, nên mỗi chứng minh dở dang chỉ sinh ra một lần (không cần tập đã thăm)
+    heap = [(levels[goal], 0, 0, {}, frozenset((goal,)))]
+    seq = 0
+    expanded = 0
+    optimal = True
+    while heap:
+        check_cancel(cancel)
+        f, neg_g, _, proof, open_goals = heapq.heappop(heap)
+        if not open_goals:
+            if tr.summary:
+                tr.event('bwd_best_found', size=len(proof), nodes=expanded,
+                         optimal="tối ưu" if optimal else "chưa chắc tối ưu")
+            return True, proof, optimal
+        if expanded >= max_nodes:
+            if tr.summary:
+                tr.event('bwd_best_budget', nodes=max_nodes)
+            heapq.heappush(heap, (f, neg_g, 0, proof, open_goals))
+            break
+        expanded += 1
+        
+        if tr.steps:
+            tr.event('bwd_best_expand', node=expanded, cost=-neg_g, bound=f,
+                     goal=names[max(open_goals, key=lambda x: (levels[x], -x))], open=rules.names(open_goals))
+        for bound, child, child_open in expand(proof, open_goals)[1]:
+            seq += 1
+            heapq.heappush(heap, (bound, -len(child), seq, child, child_open))
+        
+        if len(heap) > max_open:
+            kept = heapq.nsmallest(max_open // 2, heap)  # danh sách đã sắp cũng là một heap
+            if tr.summary:
+                tr.event('bwd_best_dropped', dropped=len(heap) - len(kept))
+            heap = kept
+            optimal = False
+    
+    # Hết giới hạn: chứng minh theo tầng luôn tồn tại khi goal có tầng
+    proof = {}
+    pending = [goal]
+    while pending:
+        f = pending.pop()
+        if f in proof or f in known:
+            continue
+        proof[f] = via[f]
+        pending.extend(records[via[f]].premises)
+    
+    # Hoàn tất tham lam từ trạng thái chờ tốt nhất, giữ chứng minh ngắn hơn
+    if heap:
+        _, _, _, state, open_goals = heap[0]
+        while open_goals and len(state) < len(proof):
+            check_cancel(cancel)
+            children = expand(state, open_goals)[1]
+            if not children:
+                break
+            _, state, open_goals = min(children, key=lambda child: child[0])
+        if not open_goals and len(state) < len(proof):
+            proof = state
+    if tr.summary:
+        tr.event('bwd_best_fallback', size=len(proof))
+    return True, proof, False
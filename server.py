@@ -0,0 +1,266 @@
+"""Dịch vụ suy diễn cục bộ chạy lâu dài qua HTTP (chỉ dùng thư viện chuẩn).
+
+Tập luật được nạp và biên dịch một lần; các bảng FPG/RPG được dựng sẵn và giữ
+nóng giữa các truy vấn. Mỗi yêu cầu chạy trên một luồng riêng nên nhiều truy
+vấn được trả lời đồng thời. Mặc định chỉ nghe trên 127.0.0.1:
+
+    python server.py -r rules.txt --port 8765 --watch 1
+
+Các điểm cuối (JSON):
+
+    GET  /status   phiên bản tập luật, số luật, số yêu cầu, bộ đệm kết quả
+    POST /query    một truy vấn (cùng dạng với cli.py) hoặc một mảng truy vấn
+    POST /reload   đọc lại file luật (kèm nhật ký) và chuyển sang phiên bản mới
+
+    curl -s localhost:8765/query -d '{"mode": "backward", "goals": ["r", "s"]}'
+
+Truy vấn lỗi trả mã 400 kèm "error"; với một mảng truy vấn, mỗi phần tử lỗi
+được báo riêng như trong cli.py.
+
+Nạp lại dựng một KnowledgeBase mới ở bên cạnh (biên dịch, bảng FPG/RPG) rồi
+mới thay tham chiếu bằng một phép gán: yêu cầu đang chạy vẫn dùng phiên bản cũ
+tới khi xong, yêu cầu mới dùng phiên bản mới. File luật lỗi thì giữ phiên bản
+cũ. --watch SECONDS tự nạp lại khi file luật hoặc nhật ký của nó thay đổi. Bộ
+đệm kết quả được dùng chung giữa các phiên bản (khóa theo nội dung tập luật).
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from cli import answer
+from inference_core import (JOURNAL_SUFFIX, KnowledgeBase, RESULT_CACHE_SIZE, ResultCache, RuleFileError, RuleStore,
+                            TRACE_LEVELS)
+
+
+class InferenceService:
+    """Giữ phiên bản tập luật đang phục vụ và nạp lại nó một cách nguyên tử.
+    self.kb chỉ được thay bằng một phép gán sau khi phiên bản mới đã sẵn sàng;
+    mỗi yêu cầu đọc self.kb một lần lúc bắt đầu và dùng nó tới khi trả lời xong.
+    """
+    def __init__(self, path, trace=None, stats=False, reduced=False, results=None):
+        self.path = str(path)
+        self.trace = trace
+        self.stats = stats
+        self.reduced = reduced
+        self.results = results
+        self.kb = None
+        self.generation = 0
+        self.loaded_at = None
+        self.signature = None
+        self.last_error = None
+        self.started = time.time()
+        self.requests = self.errors = self.in_flight = 0
+        self.reload_lock = threading.Lock()
+        self.counter_lock = threading.Lock()
+    
+    def file_signature(self):
+        """(mtime, kích thước) của file luật và nhật ký; None cho file không tồn tại"""
+        signature = []
+        for path in (self.path, self.path + JOURNAL_SUFFIX):
+            try:
+                st = Path(path).stat()
+                signature.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+    
+    def warm(self, kb):
+        """Dựng trước tập luật đã biên dịch và các bảng mà truy vấn cần"""
+        kb.compiled()
+        kb.digest()
+        kb.fpg_table()
+        kb.rpg_table()
+        if self.reduced:
+            kb.reduced()
+            kb.fpg_table(True)
+            kb.rpg_table(True)
+    
+    def reload(self):
+        """Đọc lại file luật thành phiên bản mới rồi chuyển sang nó; trả về status().
+        File lỗi thì ném RuleFileError/OSError và phiên bản đang phục vụ giữ nguyên.
+        """
+        with self.reload_lock:
+            signature = self.file_signature()
+            kb = KnowledgeBase()
+            kb.results = self.results
+            try:
+                RuleStore(kb, self.path).load(repair=False)
+                self.warm(kb)
+            except (RuleFileError, OSError) as e:
+                # không thử lại cùng nội dung file ở lần kiểm tra --watch sau
+                self.signature = signature
+                self.last_error = str(e)
+                raise
+            self.kb = kb
+            self.generation += 1
+            self.loaded_at = time.time()
+            self.signature = signature
+            self.last_error = None
+        return self.status()
+    
+    def watch(self, interval, stop):
+        """Nạp lại khi file luật hoặc nhật ký thay đổi, kiểm tra mỗi interval giây tới khi stop được bật"""
+        while not stop.wait(interval):
+            if self.file_signature() == self.signature:
+                continue
+            try:
+                status = self.reload()
+                print(f"Đã nạp lại {self.path}: phiên bản {status['generation']}, {status['rules']} luật",
+                      file=sys.stderr)
+            except (RuleFileError, OSError) as e:
+                print(f"Không nạp lại được {self.path}, giữ phiên bản cũ: {e}", file=sys.stderr)
+    
+    def query(self, payload):
+        """Trả lời một truy vấn (dict) hoặc một danh sách truy vấn; trả về (kết quả, số truy vấn lỗi)"""
+        kb = self.kb
+        with self.counter_lock:
+            self.in_flight += 1
+        failed = 1  # lỗi ngoài dự kiến (ném ra khỏi answer) cũng được đếm
+        try:
+            if isinstance(payload, list):
+                answers = [answer(kb, lineno, query, self.trace, self.stats, self.reduced)
+                           for lineno, query in enumerate(payload, 1)]
+                result = [result for result, _ in answers]
+                failed = sum(failed for _, failed in answers)
+            else:
+                result, failed = answer(kb, 1, payload, self.trace, self.stats, self.reduced)
+                failed = int(failed)
+        finally:
+            with self.counter_lock:
+                self.in_flight -= 1
+                self.requests += 1
+                self.errors += failed
+        return result, failed
+    
+    def status(self):
+        kb = self.kb
+        return {
+            'path': self.path,
+            'generation': self.generation,
+            'digest': kb.digest(),
+            'rules': len(kb.compiled()),
+            'GT': sorted(kb.GT),
+            'KL': sorted(kb.KL),
+            'loaded_at': self.loaded_at,
+            'uptime': round(time.time() - self.started, 3),
+            'requests': self.requests,
+            'errors': self.errors,
+            'in_flight': self.in_flight,
+            'cache': self.results.as_dict() if self.results is not None else None,
+            'last_error': self.last_error,
+        }
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """Chuyển các yêu cầu HTTP tới InferenceService của server (self.server.service)"""
+    server_version = "InferenceService/1.0"
+    
+    def send_json(self, code, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        if self.path == '/status':
+            self.send_json(200, self.server.service.status())
+        else:
+            self.send_json(404, {'error': f"không có điểm cuối {self.path}"})
+    
+    def do_POST(self):
+        service = self.server.service
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.path == '/query':
+            try:
+                payload = json.loads(body)
+            except ValueError as e:
+                self.send_json(400, {'error': f"JSON không hợp lệ: {e}"})
+                return
+            try:
+                result, failed = service.query(payload)
+            except Exception as e:
+                self.send_json(500, {'error': f"{type(e).__name__}: {e}"})
+                return
+            self.send_json(400 if failed and isinstance(payload, dict) else 200, result)
+        elif self.path == '/reload':
+            try:
+                self.send_json(200, service.reload())
+            except (RuleFileError, OSError) as e:
+                self.send_json(500, {'error': str(e), 'status': service.status()})
+        else:
+            self.send_json(404, {'error': f"không có điểm cuối {self.path}"})
+    
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class ServiceServer(ThreadingHTTPServer):
+    # Luồng yêu cầu không phải daemon: khi dừng, server_close() chờ các yêu cầu đang chạy trả lời xong
+    daemon_threads = False
+    
+    def __init__(self, address, service, quiet=False):
+        super().__init__(address, ServiceHandler)
+        self.service = service
+        self.quiet = quiet
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dịch vụ suy diễn cục bộ qua HTTP, giữ tập luật đã biên dịch")
+    parser.add_argument('-r', '--rules', default='rules.txt',
+                        help="file luật .txt/.json hoặc snapshot .kbs (mặc định: rules.txt)")
+    parser.add_argument('--host', default='127.0.0.1', help="địa chỉ nghe (mặc định: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8765, help="cổng nghe (mặc định: 8765; 0 = cổng bất kỳ)")
+    parser.add_argument('--watch', type=float, metavar='SECONDS',
+                        help="tự nạp lại khi file luật thay đổi, kiểm tra mỗi SECONDS giây")
+    parser.add_argument('--trace', nargs='?', const='full', choices=list(TRACE_LEVELS),
+                        help="kèm vết suy diễn trong mỗi kết quả với mức chi tiết cho trước (mặc định: full)")
+    parser.add_argument('--stats', action='store_true',
+                        help="kèm bộ đếm và thời gian từng pha suy diễn trong mỗi kết quả")
+    parser.add_argument('--reduced', action='store_true', help="suy diễn trên tập luật rút gọn")
+    parser.add_argument('--cache', metavar='PATH', help="lưu bộ đệm kết quả trên đĩa (sqlite) ở PATH")
+    parser.add_argument('--cache-size', type=int, default=RESULT_CACHE_SIZE,
+                        help=f"số kết quả giữ trong bộ đệm trong bộ nhớ (mặc định: {RESULT_CACHE_SIZE})")
+    parser.add_argument('--no-cache', action='store_true', help="không dùng bộ đệm kết quả")
+    parser.add_argument('-q', '--quiet', action='store_true', help="không ghi nhật ký từng yêu cầu ra stderr")
+    args = parser.parse_args(argv)
+
+    if args.cache_size < 0 or (args.watch is not None and args.watch <= 0):
+        parser.error("--cache-size phải >= 0 và --watch phải > 0")
+
+    results = None if args.no_cache else ResultCache(args.cache_size, args.cache)
+    service = InferenceService(args.rules, args.trace, args.stats, args.reduced, results)
+    try:
+        status = service.reload()
+    except (RuleFileError, OSError) as e:
+        print(e, file=sys.stderr)
+        return 2
+    try:
+        server = ServiceServer((args.host, args.port), service, args.quiet)
+    except OSError as e:
+        print(f"Không mở được {args.host}:{args.port}: {e}", file=sys.stderr)
+        return 2
+
+    stop = threading.Event()
+    if args.watch:
+        threading.Thread(target=service.watch, args=(args.watch, stop), daemon=True).start()
+    host, port = server.server_address[:2]
+    print(f"Đang phục vụ http://{host}:{port} ({status['rules']} luật từ {args.rules})", file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
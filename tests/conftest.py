@@ -0,0 +1,5 @@
+"""Cấu hình chung cho các kiểm thử: thư mục gốc của repo nằm trên sys.path"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,17 @@
+"""Tập luật ngẫu nhiên nhỏ cho các kiểm thử"""
+from inference_core import forward_chain
+
+
+def random_base(rng, facts=10, rules=24):
+    """Tập luật ngẫu nhiên dày đặc chu trình trên ít fact, trả về (rules, GT)"""
+    text = {}
+    for i in range(rules):
+        premises = {f"f{rng.randrange(facts)}" for _ in range(rng.randint(1, 3))}
+        text[str(i + 1)] = {'left': '^'.join(sorted(premises)), 'right': f"f{rng.randrange(facts)}"}
+    GT = {f"f{i}" for i in rng.sample(range(facts), rng.randint(1, 3))}
+    return text, GT
+
+
+def closure(compiled, GT):
+    """Tập fact suy ra được từ GT (suy diễn tiến không ghi vết)"""
+    return forward_chain(compiled, GT, verbosity='off')['facts']
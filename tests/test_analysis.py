@@ -0,0 +1,36 @@
+"""Kiểm thử phân tích tập luật: tập luật rút gọn giữ nguyên bao đóng"""
+import random
+
+import pytest
+
+from inference_core import CompiledRuleBase, KnowledgeBase, analyze_rules
+from rulegen import closure, random_base
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_reduced_base_preserves_closure(seed):
+    rng = random.Random(seed)
+    text, GT = random_base(rng, 12, 40)
+    # thêm luật trùng, bị bao hàm và hiển nhiên để có gì rút gọn
+    for i, idx in enumerate(rng.sample(sorted(text), 5)):
+        rule = text[idx]
+        text[f"{100 + 3 * i}"] = dict(rule)
+        text[f"{101 + 3 * i}"] = {'left': rule['left'] + f"^f{rng.randrange(12)}", 'right': rule['right']}
+        text[f"{102 + 3 * i}"] = {'left': rule['left'] + '^' + rule['right'], 'right': rule['right']}
+    compiled = CompiledRuleBase.from_text_rules(text)
+    analysis = analyze_rules(compiled, GT)
+    assert analysis.removed
+    reduced = CompiledRuleBase.from_text_rules(analysis.reduced_rules(text))
+    assert len(reduced) == len(compiled) - len(analysis.removed)
+    inputs = sorted(analysis.inputs)
+    for _ in range(20):
+        sample = set(rng.sample(inputs, rng.randint(1, min(4, len(inputs)))))
+        assert closure(reduced, sample) == closure(compiled, sample)
+
+
+def test_reduced_query_falls_back_outside_inputs():
+    kb = KnowledgeBase()
+    kb.load('rules.txt')
+    produced = {rule['right'] for rule in kb.rules.values()}
+    GT = set(kb.GT) | {sorted(produced - kb.analysis().inputs)[0]}
+    assert kb.forward(GT, verbosity='off', reduced=True)['facts'] == kb.forward(GT, verbosity='off')['facts']
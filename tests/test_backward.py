@@ -0,0 +1,115 @@
+"""Kiểm thử suy diễn lùi: bản có ghi nhớ khớp bản đệ quy và bao đóng suy diễn tiến"""
+import itertools
+import random
+import time
+
+import pytest
+
+from benchmark import gen_cyclic
+from inference_core import CompiledRuleBase, parse_goals, prove, prove_all
+from rulegen import closure, random_base
+
+
+def check_proof(result, compiled, GT):
+    """Mỗi luật trong chứng minh có kết luận đúng và tiền đề thuộc GT hoặc đã được chứng minh"""
+    proof = result['proof']
+    assert result['goal'] in proof or result['goal'] in GT
+    by_idx = {r.idx: r for r in compiled.rules}
+    for goal, idx in proof.items():
+        rule = by_idx[idx]
+        assert compiled.fact_names[rule.conclusion] == goal
+        assert set(compiled.names(rule.premises)) <= set(GT) | set(proof)
+
+
+@pytest.mark.parametrize('seed', range(40))
+@pytest.mark.parametrize('strategy', ['min', 'max', 'fpg'])
+def test_tabled_matches_plain(seed, strategy):
+    rng = random.Random(seed)
+    text, GT = random_base(rng)
+    compiled = CompiledRuleBase.from_text_rules(text)
+    facts = closure(compiled, GT)
+    for goal in sorted({rule['right'] for rule in text.values()}):
+        plain = prove(goal, compiled, GT, strategy, verbosity='off')
+        tabled = prove(goal, compiled, GT, strategy, tabled=True, verbosity='off')
+        assert tabled['success'] == plain['success'] == (goal in facts), goal
+        if tabled['success']:
+            check_proof(tabled, compiled, GT)
+
+
+def test_tabled_cyclic_scales():
+    # Trước đây mục tiêu thất bại trong chu trình không được ghi nhớ và thời gian bùng nổ theo số đường đi
+    text, GT, _ = gen_cyclic(400, random.Random(0))
+    compiled = CompiledRuleBase.from_text_rules(text)
+    facts = closure(compiled, GT)
+    start = time.perf_counter()
+    for goal in sorted({rule['right'] for rule in text.values()}):
+        result = prove(goal, compiled, GT, 'min', tabled=True, verbosity='off',
+                       cancel=lambda: time.perf_counter() - start > 20)
+        assert result['success'] == (goal in facts), goal
+    assert time.perf_counter() - start < 20
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_prove_all_matches_prove(seed):
+    rng = random.Random(seed)
+    text, GT = random_base(rng)
+    compiled = CompiledRuleBase.from_text_rules(text)
+    goals = sorted({rule['right'] for rule in text.values()})
+    result = prove_all(goals, compiled, GT, verbosity='off')
+    for goal in goals:
+        single = prove(goal, compiled, GT, verbosity='off')
+        assert result['results'][goal]['success'] == single['success'], goal
+        if single['success']:
+            check_proof(dict(result['results'][goal], goal=goal), compiled, GT)
+    assert result['success'] == all(result['results'][goal]['success'] for goal in goals)
+
+
+def test_prove_all_cyclic_scales():
+    text, GT, _ = gen_cyclic(2000, random.Random(0))
+    compiled = CompiledRuleBase.from_text_rules(text)
+    facts = closure(compiled, GT)
+    goals = sorted({rule['right'] for rule in text.values()})
+    start = time.perf_counter()
+    result = prove_all(goals, compiled, GT, verbosity='off', proofs=False,
+                       cancel=lambda: time.perf_counter() - start > 10)
+    assert time.perf_counter() - start < 10
+    assert {goal for goal in goals if result['results'][goal]['success']} == set(goals) & facts
+
+
+def test_parse_goals():
+    assert parse_goals("r, s") == ['r', 's']
+    assert parse_goals(" s r  s,,r ") == ['s', 'r']
+    assert parse_goals("x-1") == ['x-1']
+    assert parse_goals("") == []
+
+
+def smallest_proof(text, GT, goal):
+    """Số luật ít nhất để suy ra goal: tập luật nhỏ nhất có bao đóng chứa goal (duyệt vét cạn)"""
+    rules = [({p for p in rule['left'].split('^')}, rule['right']) for rule in text.values()]
+    for size in range(len(rules) + 1):
+        for subset in itertools.combinations(rules, size):
+            facts = set(GT)
+            changed = True
+            while changed:
+                changed = False
+                for premises, conclusion in subset:
+                    if conclusion not in facts and premises <= facts:
+                        facts.add(conclusion)
+                        changed = True
+            if goal in facts:
+                return size
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_best_first_proof_is_minimal(seed):
+    rng = random.Random(seed)
+    text, GT = random_base(rng, 8, 12)
+    compiled = CompiledRuleBase.from_text_rules(text)
+    facts = closure(compiled, GT)
+    for goal in sorted({rule['right'] for rule in text.values()}):
+        result = prove(goal, compiled, GT, 'best', verbosity='off')
+        assert result['success'] == (goal in facts), goal
+        if result['success']:
+            check_proof(result, compiled, GT)
+            assert result['optimal']
+            assert len(result['proof']) == smallest_proof(text, GT, goal), goal
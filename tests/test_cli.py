@@ -0,0 +1,35 @@
+"""Kiểm thử cli.py: trả lời truy vấn hàng loạt, mỗi truy vấn lỗi được báo riêng"""
+import io
+import json
+import random
+
+from benchmark import gen_chain
+from cli import run_batch
+from inference_core import KnowledgeBase
+
+
+def test_deep_recursive_backward_is_reported_per_query():
+    rules, GT, KL = gen_chain(5000, random.Random(0))
+    kb = KnowledgeBase(rules, GT, KL)
+    queries = [{'id': 1, 'mode': 'backward', 'goal': 'f5000'},
+               {'id': 2, 'mode': 'backward', 'goal': 'f5000', 'tabled': True},
+               {'id': 3, 'mode': 'forward'}]
+    out = io.StringIO()
+    errors = run_batch(kb, [json.dumps(query) for query in queries], out)
+    results = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert errors == 1
+    assert 'tabled' in results[0]['error'] and results[0]['line'] == 1
+    assert results[1]['success'] is True
+    assert results[2]['achieved'] == ['f5000']
+
+
+def test_goals_keep_input_order_and_hyphens():
+    kb = KnowledgeBase({'1': {'left': 'a', 'right': 'x-1'}, '2': {'left': 'x-1', 'right': 'b'}}, {'a'}, {'b'})
+    queries = [{'mode': 'backward', 'goals': 'x-1, b zz,b'},
+               {'mode': 'backward', 'goals': ['zz', 'x-1', 'zz']}]
+    out = io.StringIO()
+    assert run_batch(kb, [json.dumps(query) for query in queries], out) == 0
+    first, second = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert first['goals'] == list(first['results']) == ['x-1', 'b', 'zz']
+    assert first['results']['x-1']['success'] and not first['results']['zz']['success']
+    assert second['goals'] == ['zz', 'x-1']
@@ -0,0 +1,86 @@
+"""Kiểm thử IncrementalClosure: sau mọi chuỗi thay đổi vẫn bằng bao đóng tính lại từ đầu"""
+import random
+import threading
+
+import pytest
+
+from inference_core import IncrementalClosure, KnowledgeBase, parse_premises
+from rulegen import random_base
+
+
+def check(closure, rules, GT):
+    fresh = IncrementalClosure.from_text_rules(rules, GT)
+    assert set(closure.facts) == set(fresh.facts)
+    # lý do của mỗi fact là một luật đủ tiền đề, tạo thành DAG dẫn về GT
+    for fact, idx in closure.reason.items():
+        if idx is None:
+            assert fact in GT
+        else:
+            premises, conclusion = closure.rules[idx]
+            assert conclusion == fact and all(p in closure.reason for p in premises)
+    for fact in closure.facts:
+        proof = closure.derivation(fact)
+        assert set(proof) <= set(closure.facts)
+        for goal, idx in proof.items():
+            assert parse_premises(rules[idx]['left']) <= set(GT) | set(proof)
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_random_edits(seed):
+    rng = random.Random(seed)
+    rules, GT = random_base(rng, 10, 20)
+    closure = IncrementalClosure.from_text_rules(rules, GT)
+    next_id = len(rules) + 1
+    for _ in range(60):
+        op = rng.random()
+        if op < 0.35 or not rules:
+            idx = str(next_id) if rng.random() < 0.5 else rng.choice(list(rules) or ['1'])
+            next_id += 1
+            left = '^'.join(sorted({f"f{rng.randrange(10)}" for _ in range(rng.randint(1, 3))}))
+            rules[idx] = {'left': left, 'right': f"f{rng.randrange(10)}"}
+            closure.set_rule(idx, parse_premises(left), rules[idx]['right'])
+        elif op < 0.7:
+            idx = rng.choice(list(rules))
+            del rules[idx]
+            closure.delete_rule(idx)
+        else:
+            GT = random_base(rng, 10, 1)[1]
+            closure.set_facts(GT)
+        check(closure, rules, GT)
+    assert closure.derivation('nowhere') is None
+
+
+def test_knowledge_base_keeps_closure_incremental():
+    kb = KnowledgeBase()
+    kb.load('rules.txt')
+    closure = kb.closure()
+    kb.apply([{'op': 'delete', 'id': '10'}, {'op': 'set', 'id': '99', 'left': 'a', 'right': 'zz'}])
+    assert kb.closure() is closure
+    check(closure, kb.rules, kb.GT)
+
+
+def test_closure_is_built_under_the_lock():
+    kb = KnowledgeBase()
+    kb.load('rules.txt')
+    stop = threading.Event()
+    errors = []
+    
+    def rebuild():
+        try:
+            while not stop.is_set():
+                kb.renumber()  # bỏ bao đóng để closure() phải dựng lại
+                kb.closure()
+        except Exception as e:
+            errors.append(e)
+    
+    worker = threading.Thread(target=rebuild)
+    worker.start()
+    try:
+        for i in range(300):
+            kb.apply([{'op': 'set', 'id': f"x{i}", 'left': 'a', 'right': f"z{i}"},
+                      {'op': 'GT', 'facts': ['a', f"g{i}"]}])
+    finally:
+        stop.set()
+        worker.join()
+    assert not errors
+    check(kb.closure(), kb.rules, kb.GT)
@@ -0,0 +1,27 @@
+"""Kiểm thử CompiledRuleBase: tập luật đã biên dịch chỉ được đọc sau khi biên dịch"""
+from inference_core import CompiledRuleBase, forward_chain, prove, prove_all
+
+
+RULES = {'1': {'left': 'a^b', 'right': 'c'}, '2': {'left': 'c', 'right': 'd'}}
+
+
+def test_unknown_facts_are_query_local():
+    compiled = CompiledRuleBase.from_text_rules(RULES)
+    names = list(compiled.fact_names)
+    result = forward_chain(compiled, {'a', 'b', 'x-1'}, {'d', 'y'}, verbosity='off')
+    assert result['facts'] == {'a', 'b', 'c', 'd', 'x-1'} and result['achieved'] == {'d'}
+    assert prove('y', compiled, {'a'}, verbosity='off')['success'] is False
+    assert prove('y', compiled, {'y'}, tabled=True, verbosity='off')['success'] is True
+    assert prove_all(['d', 'z'], compiled, {'a', 'b', 'w'}, verbosity='off')['results']['z']['success'] is False
+    assert compiled.fact_names == names
+    assert len(compiled.fact_ids) == len(compiled.fact_index) == len(compiled.producers) == len(names)
+
+
+def test_with_facts():
+    compiled = CompiledRuleBase.from_text_rules(RULES)
+    assert compiled.with_facts(['a', 'd']) is compiled
+    local = compiled.with_facts(['a', 'x', 'x'])
+    assert local.fact_id('x') == len(compiled.fact_names)
+    assert local.fact_names[local.fact_id('x')] == 'x' and local.fact_id('a') == compiled.fact_id('a')
+    assert local.producers[local.fact_id('x')] == [] and local.rules is compiled.rules
+    assert 'x' not in compiled.fact_ids
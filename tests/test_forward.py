@@ -0,0 +1,163 @@
+"""Kiểm thử suy diễn tiến: cùng thứ tự áp dụng luật với thuật toán gốc, suy diễn theo lô khớp forward_chain"""
+import random
+from collections import deque
+
+import pytest
+
+from inference_core import (CompiledRuleBase, FPGDistanceTable, KnowledgeBase, RPGReachTable, forward_batch,
+                            forward_chain)
+from rulegen import closure, random_base
+
+STRATEGIES = ['min', 'max', 'fpg', 'rpg']
+AGENDAS = ['queue', 'stack']
+
+
+def baseline_forward(text, GT, strategy, agenda_type):
+    """Thuật toán gốc của InferenceSystem.run_forward: quét lại mọi luật sau mỗi bước,
+    chọn luật trong tập THOA theo chiến lược. Trả về (các luật đã áp dụng, tập fact).
+    """
+    rules = {idx: ({p.strip() for p in rule['left'].split('^') if p.strip()}, rule['right'])
+             for idx, rule in text.items()}
+    order = lambda x: int(x) if str(x).isdigit() else 0
+    
+    # FPG: cung tiền đề -> kết luận, d là độ dài đường đi ngắn nhất (BFS)
+    succ = {}
+    for premises, conclusion in rules.values():
+        for p in premises:
+            succ.setdefault(p, set()).add(conclusion)
+            succ.setdefault(conclusion, set())
+    
+    def d_fpg(start, end):
+        if start not in succ or end not in succ:
+            return float('inf')
+        seen, frontier, d = {start}, [start], 0
+        while frontier:
+            if end in frontier:
+                return d
+            d += 1
+            frontier = [w for v in frontier for w in succ[v] if w not in seen and not seen.add(w)]
+        return float('inf')
+    
+    def heuristic_fpg(premises, goal):
+        return max(d_fpg(f, goal) for f in premises) if premises else float('inf')
+    
+    # RPG: cung r_i -> r_j khi kết luận của r_i là tiền đề của r_j, h là số luật con cháu
+    def heuristic_rpg(idx):
+        seen, stack = set(), [idx]
+        while stack:
+            i = stack.pop()
+            for j, (premises, _) in rules.items():
+                if j != i and rules[i][1] in premises and j not in seen:
+                    seen.add(j)
+                    stack.append(j)
+        seen.discard(idx)
+        return len(seen)
+    
+    facts = set(GT)
+    container = deque() if agenda_type == 'queue' else []
+    pop = container.popleft if agenda_type == 'queue' else container.pop
+    for idx, (prem, concl) in rules.items():
+        if prem <= facts and concl not in facts:
+            container.append(idx)
+    fired = []
+    while container:
+        indices = list(container)
+        if strategy == 'min':
+            chosen = min(indices, key=order)
+        elif strategy == 'max':
+            chosen = max(indices, key=order)
+        elif strategy == 'fpg':
+            h = {idx: heuristic_fpg(*rules[idx]) for idx in indices}
+            chosen = min(indices, key=h.get)
+        elif strategy == 'rpg':
+            h = {idx: heuristic_rpg(idx) for idx in indices}
+            chosen = min(indices, key=h.get)
+        else:
+            chosen = pop()
+        if strategy in ('min', 'max', 'fpg', 'rpg'):
+            container.remove(chosen)
+        premises, conclusion = rules[chosen]
+        if premises <= facts and conclusion not in facts:
+            facts.add(conclusion)
+            fired.append(chosen)
+            for idx, (prem, concl) in rules.items():
+                if prem <= facts and concl not in facts and idx not in container:
+                    container.append(idx)
+    return fired, facts
+
+
+def check_parity(text, GT, KL):
+    compiled = CompiledRuleBase.from_text_rules(text)
+    fpg, rpg = FPGDistanceTable(compiled), RPGReachTable(compiled)
+    for strategy in STRATEGIES:
+        for agenda_type in AGENDAS:
+            fired, facts = baseline_forward(text, GT, strategy, agenda_type)
+            result = forward_chain(compiled, GT, KL, strategy, agenda_type, fpg_table=fpg, rpg_table=rpg,
+                                   verbosity='off')
+            assert result['fired'] == fired, (strategy, agenda_type)
+            assert result['facts'] == facts
+            assert result['achieved'] == set(KL) & facts
+
+
+def test_parity_rules_txt():
+    kb = KnowledgeBase()
+    kb.load('rules.txt')
+    check_parity(kb.rules, kb.GT, kb.KL)
+
+
+@pytest.mark.parametrize('seed', range(60))
+def test_parity_random(seed):
+    rng = random.Random(seed)
+    text, GT = random_base(rng, rng.randint(6, 16), rng.randint(8, 40))
+    check_parity(text, GT, {f"f{rng.randrange(10)}"})
+
+
+def test_trace_matches_fired_order():
+    kb = KnowledgeBase()
+    kb.load('rules.txt')
+    lines = []
+    result = kb.forward(strategy='fpg', emit=lines.append, verbosity='steps')
+    steps = [line for line in lines if line.startswith('Bước')]
+    assert len(steps) == len(result['fired'])
+    for line, idx in zip(steps, result['fired']):
+        assert f"r{idx} " in line
+
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_fpg_table_matches_bfs(seed):
+    rng = random.Random(seed)
+    text, _ = random_base(rng, 10, 20)
+    compiled = CompiledRuleBase.from_text_rules(text)
+    succ = [set() for _ in compiled.fact_names]
+    for r in compiled.rules:
+        for p in r.premises:
+            succ[p].add(r.conclusion)
+    
+    def bfs(start, end):
+        seen, frontier, d = {start}, [start], 0
+        while frontier:
+            if end in frontier:
+                return d
+            d += 1
+            frontier = [w for v in frontier for w in succ[v] if w not in seen and not seen.add(w)]
+        return float('inf')
+    
+    table = FPGDistanceTable(compiled, max_targets=3)
+    for target in range(len(succ)):
+        for start in range(len(succ)):
+            assert table.distance(start, target) == bfs(start, target)
+        assert len(table.tables) <= 3
+    for pos, r in enumerate(compiled.rules):
+        assert table.rule_heuristic(pos) == max(bfs(p, r.conclusion) for p in r.premises)
+
+@pytest.mark.parametrize('seed', range(20))
+def test_forward_batch_matches_forward_chain(seed):
+    pytest.importorskip('numpy')
+    rng = random.Random(seed)
+    text, _ = random_base(rng, 12, 30)
+    compiled = CompiledRuleBase.from_text_rules(text)
+    GT_sets = [random_base(rng, 12, 1)[1] | ({'unknown'} if rng.random() < 0.3 else set()) for _ in range(25)]
+    assert forward_batch(compiled, GT_sets) == [closure(compiled, GT) for GT in GT_sets]
+    KL = {'f1', 'f5', 'f7', 'nowhere'}
+    assert forward_batch(compiled, GT_sets, KL) == [closure(compiled, GT) & KL for GT in GT_sets]
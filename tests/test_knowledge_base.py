@@ -0,0 +1,176 @@
+"""Kiểm thử KnowledgeBase: bộ đệm kết quả, ảnh chụp phiên bản và khóa của bộ đệm"""
+import pickle
+import threading
+
+import pytest
+
+import inference_core
+from inference_core import InferenceCancelled, InferenceStats, KnowledgeBase, ResultCache, forward_chain
+
+
+RULES = {
+    '1': {'left': 'a', 'right': 'b'},
+    '2': {'left': 'b', 'right': 'c'},
+    '3': {'left': 'e', 'right': 'd'},
+    '4': {'left': 'd', 'right': 'e'},
+}
+
+
+def make_kb():
+    return KnowledgeBase(RULES, {'a'}, {'c'})
+
+
+def test_cache_hit_replays_trace():
+    kb = make_kb()
+    first, second = [], []
+    result = kb.backward('c', emit=first.append, verbosity='full')
+    stats = InferenceStats()
+    again = kb.backward('c', emit=second.append, verbosity='full', stats=stats)
+    assert again == result and again is not result
+    assert first == second and stats.cache_hits == 1
+    assert (kb.results.hits, kb.results.misses, kb.results.stores) == (1, 1, 1)
+
+
+def test_cache_key_covers_query_and_rules():
+    kb = make_kb()
+    kb.forward(verbosity='off')
+    kb.forward(strategy='max', verbosity='off')
+    kb.forward({'a', 'e'}, verbosity='off')
+    kb.forward(verbosity='summary', emit=lambda text: None)
+    assert kb.results.hits == 0 and kb.results.misses == 4
+    kb.forward(verbosity='off')
+    assert kb.results.hits == 1
+    # sửa luật làm đổi digest(): kết quả cũ không còn trúng, kể cả khi kết quả giống nhau
+    kb.apply([{'op': 'set', 'id': '9', 'left': 'x', 'right': 'y'}])
+    assert kb.forward(verbosity='off')['facts'] == {'a', 'b', 'c'}
+    assert kb.results.hits == 1 and kb.results.misses == 5
+    kb.apply([{'op': 'delete', 'id': '9'}])
+    kb.forward(verbosity='off')
+    assert kb.results.hits == 2
+
+
+def test_cancelled_run_is_not_stored():
+    kb = make_kb()
+    with pytest.raises(InferenceCancelled):
+        kb.forward(verbosity='off', cancel=lambda: True)
+    assert kb.results.stores == 0
+
+
+def test_cache_lru_and_disk(tmp_path):
+    cache = ResultCache(2, str(tmp_path / 'results.sqlite'))
+    for i in range(3):
+        cache.put(cache.key('q', i), ({'i': i}, None))
+    assert len(cache) == 2 and cache.evictions == 1
+    assert cache.get(cache.key('q', 0)) == ({'i': 0}, None)
+    assert cache.disk_hits == 1
+    # tiến trình khác (bộ đệm mới trên cùng file) đọc được từ đĩa
+    other = ResultCache(2, str(tmp_path / 'results.sqlite'))
+    assert other.get(cache.key('q', 2)) == ({'i': 2}, None) and other.disk_hits == 1
+    assert other.get(cache.key('q', 3)) is None and other.misses == 1
+    other.clear()
+    assert cache.get(cache.key('q', 0)) is not None  # mục trúng ở đĩa đã được đưa lên bộ nhớ
+    assert ResultCache(2, str(tmp_path / 'results.sqlite')).get(cache.key('q', 0)) is None
+
+
+def test_cache_byte_budget():
+    blob = len(pickle.dumps(('x' * 1000, None), pickle.HIGHEST_PROTOCOL))
+    cache = ResultCache(100, maxbytes=3 * blob)
+    for i in range(5):
+        cache.put(cache.key(i), ('x' * 1000, None))
+    assert len(cache) == 3 and cache.nbytes == 3 * blob and cache.evictions == 2
+    cache.put(cache.key(4), ('x' * 1000, None))
+    assert len(cache) == 3 and cache.nbytes == 3 * blob
+    assert cache.put(cache.key('big'), ('x' * 4000, None)) is False
+
+
+def test_long_trace_is_not_recorded(monkeypatch):
+    monkeypatch.setattr(inference_core, 'RESULT_CACHE_ENTRY_BYTES', 200)
+    kb = make_kb()
+    lines = []
+    kb.forward(verbosity='full', emit=lines.append)
+    assert sum(map(len, lines)) > 200 and kb.results.stores == 0
+    kb.forward(verbosity='off')
+    assert kb.results.stores == 1
+
+def test_cache_can_be_disabled():
+    kb = make_kb()
+    kb.results = None
+    assert kb.forward(verbosity='off')['facts'] == {'a', 'b', 'c'}
+    assert kb.snapshot().results is None
+
+
+def test_snapshot_is_isolated_from_edits():
+    kb = make_kb()
+    snapshot = kb.snapshot('fpg')
+    digest, compiled = kb.digest(), kb.compiled()
+    kb.apply([{'op': 'delete', 'id': '2'}])
+    assert snapshot.digest() == digest and snapshot.compiled() is compiled
+    assert kb.digest() != digest
+    assert snapshot.forward(verbosity='off')['facts'] == {'a', 'b', 'c'}
+    assert kb.forward(verbosity='off')['facts'] == {'a', 'b'}
+    assert snapshot.rules == RULES
+
+
+
+def test_cold_snapshot_builds_nothing():
+    kb = make_kb()
+    snapshot = kb.snapshot(warm=False)
+    assert 'compiled' not in kb.cache
+    kb.apply([{'op': 'delete', 'id': '2'}])
+    snapshot.warm('fpg', reduced=True)
+    assert 'compiled' not in kb.cache and snapshot.rules == RULES
+    assert snapshot.forward(verbosity='off')['facts'] == {'a', 'b', 'c'}
+    assert kb.forward(verbosity='off')['facts'] == {'a', 'b'}
+
+def test_reduced_key_includes_kb_gt():
+    # Luật 3, 4 chết với GT = {a} nhưng không chết khi d có thể thuộc GT: tập luật rút gọn khác nhau
+    kb = make_kb()
+    first = kb.forward({'a'}, verbosity='off', reduced=True)
+    kb.apply([{'op': 'GT', 'facts': ['a', 'd']}])
+    assert kb.analysis().inputs >= {'a', 'd'}
+    stats = InferenceStats()
+    second = kb.forward({'a'}, verbosity='off', reduced=True, stats=stats)
+    assert stats.cache_hits == 0
+    assert first['facts'] == second['facts']
+
+
+def test_fact_edits_keep_rule_caches():
+    kb = make_kb()
+    snapshot = kb.snapshot('fpg', reduced=True)
+    compiled, fpg, analysis = kb.compiled(), kb.fpg_table(), kb.analysis()
+    version, digest = kb.version, kb.digest()
+    kb.apply([{'op': 'KL', 'facts': ['b']}])
+    assert kb.analysis() is analysis and kb.fpg_table(True) is snapshot.fpg_table(True)
+    kb.apply([{'op': 'GT', 'facts': ['a', 'd']}, {'op': 'KL', 'facts': ['c']}])
+    assert (kb.version, kb.digest()) == (version, digest)
+    assert kb.compiled() is compiled and kb.fpg_table() is fpg
+    assert kb.analysis() is not analysis and kb.analysis().inputs >= {'a', 'd'}
+    assert snapshot.analysis() is analysis
+    kb.apply([{'op': 'GT', 'facts': ['a']}, {'op': 'delete', 'id': '3'}])
+    assert kb.version == version + 1 and kb.compiled() is not compiled
+
+def test_results_match_version_under_concurrent_edits():
+    kb = make_kb()
+    stop = threading.Event()
+    
+    def query():
+        while not stop.is_set():
+            kb.forward(verbosity='off')
+            kb.backward('c', verbosity='off')
+    
+    worker = threading.Thread(target=query)
+    worker.start()
+    try:
+        for i in range(300):
+            if i % 2:
+                kb.apply([{'op': 'set', 'id': '2', 'left': 'b', 'right': 'c'}])
+            else:
+                kb.apply([{'op': 'delete', 'id': '2'}])
+    finally:
+        stop.set()
+        worker.join()
+    for change in ({'op': 'delete', 'id': '2'}, {'op': 'set', 'id': '2', 'left': 'b', 'right': 'c'}):
+        kb.apply([change])
+        expected = forward_chain(kb.compiled(), kb.GT, kb.KL, verbosity='off')['facts']
+        assert kb.forward(verbosity='off')['facts'] == expected
+        assert kb.backward('c', verbosity='off')['success'] == ('c' in expected)
@@ -0,0 +1,179 @@
+"""Kiểm thử file luật: đọc/ghi văn bản, JSON, snapshot .kbs và nhật ký của RuleStore"""
+import json
+import random
+import shutil
+
+import pytest
+
+from inference_core import (JOURNAL_SUFFIX, KnowledgeBase, RuleFileError, RuleStore, iter_rules_json, load_snapshot,
+                            parse_premises, read_rules_file)
+from rulegen import random_base
+
+
+def rule_sets(rules):
+    """Luật theo số thứ tự dạng (tập tiền đề, kết luận): snapshot không giữ cách viết vế trái"""
+    return {idx: (parse_premises(rule['left']), rule['right']) for idx, rule in rules.items()}
+
+
+def loaded(path):
+    kb = KnowledgeBase()
+    kb.load(path)
+    return kb
+
+
+@pytest.mark.parametrize('suffix', ['.txt', '.json', '.kbs'])
+def test_round_trip(tmp_path, suffix):
+    kb = loaded('rules.txt')
+    text, _ = random_base(random.Random(0), 30, 200)
+    kb.apply([{'op': 'set', 'id': idx, **rule} for idx, rule in text.items()])
+    kb.apply([{'op': 'set', 'id': 'x', 'left': 'p q^r', 'right': 's-1'}])
+    path = tmp_path / f"rules{suffix}"
+    kb.save(path)
+    again = loaded(path)
+    assert rule_sets(again.rules) == rule_sets(kb.rules)
+    assert (again.GT, again.KL) == (kb.GT, kb.KL)
+    if suffix != '.kbs':
+        assert again.rules == kb.rules
+
+
+def test_shipped_files_agree():
+    txt, js = read_rules_file('rules.txt'), read_rules_file('rules.json')
+    assert rule_sets(txt[0]) == rule_sets(js[0])
+
+
+def test_snapshot_keeps_facts_outside_rules(tmp_path):
+    kb = loaded('rules.txt')
+    kb.apply([{'op': 'GT', 'facts': ['a', 'only-in-gt']}])
+    kb.save(tmp_path / 'kb.kbs')
+    compiled, GT, KL = load_snapshot(tmp_path / 'kb.kbs')
+    assert GT == {'a', 'only-in-gt'} and KL == kb.KL
+    assert len(compiled) == len(kb.compiled())
+
+
+
+def test_snapshot_keeps_large_rule_ids(tmp_path):
+    ids = ['2147483648', str(1 << 63), '99999999999999999999', '7']
+    kb = KnowledgeBase({idx: {'left': 'a', 'right': f"b{idx}"} for idx in ids}, {'a'})
+    kb.save(tmp_path / 'kb.kbs')
+    compiled, _, _ = load_snapshot(tmp_path / 'kb.kbs')
+    assert [(r.idx, r.order) for r in compiled.rules] == [(idx, int(idx)) for idx in ids]
+
+@pytest.mark.parametrize('content, lineno', [
+    ("1\ta->b\n\n3\ta-b\n", 3),
+    ("1\ta->b\n2 a->c\n", 2),
+    ("1\ta->b->c\n", 1),
+    ("1\ta->b\nGT = a\nhello\n", 3),
+    ("1\ta->b\n2\tb->c\n1\tc->d\n", 3),
+])
+def test_text_errors_report_line(tmp_path, content, lineno):
+    path = tmp_path / 'bad.txt'
+    path.write_text(content, encoding='utf-8')
+    with pytest.raises(RuleFileError) as e:
+        read_rules_file(path)
+    assert e.value.lineno == lineno
+    assert f"bad.txt:{lineno}:" in str(e.value)
+
+
+@pytest.mark.parametrize('items, lineno', [
+    ([{'id': 1, 'antecedent': 'a', 'consequent': 'b'}, {'id': 2, 'antecedent': 'b'}], 7),
+    ([{'id': 1, 'antecedent': 'a', 'consequent': 'b'}, [1, 2]], 7),
+    ([{'id': 1, 'antecedent': 'a', 'consequent': 'b'}, {'id': 1, 'antecedent': 'c', 'consequent': 'd'}], 7),
+])
+def test_json_errors_report_line(tmp_path, items, lineno):
+    path = tmp_path / 'bad.json'
+    path.write_text(json.dumps(items, indent=2), encoding='utf-8')
+    with pytest.raises(RuleFileError) as e:
+        read_rules_file(path)
+    assert e.value.lineno == lineno
+
+
+def test_json_streams_in_small_chunks():
+    items = list(iter_rules_json('rules.json', chunk_size=7))
+    assert [value for _, kind, value in items if kind == 'rule'] == \
+           [value for _, kind, value in iter_rules_json('rules.json') if kind == 'rule']
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    path = tmp_path / 'rules.txt'
+    shutil.copy('rules.txt', path)
+    return path
+
+
+def test_journal_replay(store_path):
+    kb = KnowledgeBase()
+    store = RuleStore(kb, store_path)
+    store.load()
+    original = store_path.read_bytes()
+    store.set_rule('100', 'a^b', 'zz')
+    store.delete_rule('1')
+    store.apply([{'op': 'set', 'id': '2', 'left': 'a', 'right': 'c'}, {'op': 'delete', 'id': '3'}])
+    store.set_facts({'a', 'b'}, {'zz'})
+    assert store_path.read_bytes() == original  # chỉ ghi thêm vào nhật ký
+    assert len(open(str(store_path) + JOURNAL_SUFFIX, encoding='utf-8').readlines()) == 4
+    
+    again = KnowledgeBase()
+    RuleStore(again, store_path).load()
+    assert (again.rules, again.GT, again.KL) == (kb.rules, kb.GT, kb.KL)
+    assert '1' not in again.rules and again.rules['100'] == {'left': 'a^b', 'right': 'zz'}
+
+
+def test_journal_compaction(store_path):
+    kb = KnowledgeBase()
+    store = RuleStore(kb, store_path)
+    store.load()
+    store.set_rule('100', 'a', 'zz')
+    store.compact()
+    assert not (store_path.parent / (store_path.name + JOURNAL_SUFFIX)).exists()
+    assert read_rules_file(store_path)[0]['100'] == {'left': 'a', 'right': 'zz'}
+    store.set_rule('101', 'zz', 'yy')
+    again = KnowledgeBase()
+    RuleStore(again, store_path).load()
+    assert again.rules == kb.rules
+
+
+def test_journal_compacts_in_background(store_path, monkeypatch):
+    monkeypatch.setattr(RuleStore, 'COMPACT_MIN_OPS', 5)
+    kb = KnowledgeBase()
+    store = RuleStore(kb, store_path)
+    store.load()
+    for i in range(40):
+        store.set_rule(str(100 + i), 'a', f"z{i}")
+    store.wait()
+    assert store.journal_ops < 40
+    again = KnowledgeBase()
+    RuleStore(again, store_path).load()
+    assert again.rules == kb.rules
+
+
+@pytest.mark.parametrize('repair', [True, False])
+def test_journal_torn_tail(store_path, repair):
+    kb = KnowledgeBase()
+    store = RuleStore(kb, store_path)
+    store.load()
+    store.set_rule('100', 'a', 'zz')
+    journal = store_path.parent / (store_path.name + JOURNAL_SUFFIX)
+    complete = journal.stat().st_size
+    with open(journal, 'ab') as f:
+        f.write(b'[{"op": "set", "id": "101", "le')
+    again = KnowledgeBase()
+    RuleStore(again, store_path).load(repair=repair)
+    assert again.rules == kb.rules
+    assert journal.stat().st_size == (complete if repair else complete + 31)
+    if repair:
+        # giao dịch sau nối tiếp đúng dòng sau khi cắt phần ghi dở
+        store = RuleStore(again, store_path)
+        store.load()
+        store.set_rule('102', 'zz', 'yy')
+        last = KnowledgeBase()
+        RuleStore(last, store_path).load()
+        assert last.rules['102'] == {'left': 'zz', 'right': 'yy'}
+
+
+def test_journal_corrupt_line(store_path):
+    journal = store_path.parent / (store_path.name + JOURNAL_SUFFIX)
+    journal.write_text('[{"op": "delete", "id": "1"}]\n{"op": 1}\n', encoding='utf-8')
+    kb = KnowledgeBase()
+    with pytest.raises(RuleFileError) as e:
+        RuleStore(kb, store_path).load()
+    assert e.value.lineno == 2
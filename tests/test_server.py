@@ -0,0 +1,67 @@
+"""Kiểm thử khói cho server.py: truy vấn, trạng thái và nạp lại qua HTTP"""
+import json
+import shutil
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from inference_core import ResultCache
+from server import InferenceService, ServiceServer
+
+
+@pytest.fixture
+def service(tmp_path):
+    path = tmp_path / 'rules.txt'
+    shutil.copy('rules.txt', path)
+    service = InferenceService(path, results=ResultCache())
+    service.reload()
+    server = ServiceServer(('127.0.0.1', 0), service, quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    service.url = 'http://127.0.0.1:%d' % server.server_address[1]
+    yield service
+    server.shutdown()
+    server.server_close()
+
+
+def request(service, path, payload=None):
+    data = None if payload is None else json.dumps(payload).encode('utf-8')
+    try:
+        with urllib.request.urlopen(service.url + path, data, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_query_status_reload(service):
+    code, result = request(service, '/query', {'mode': 'backward', 'goal': 'r'})
+    assert code == 200 and result['success'] is True
+    code, results = request(service, '/query', [{'mode': 'forward'}, {'mode': 'nope'},
+                                                {'mode': 'backward', 'goals': ['r', 'zz']}])
+    assert code == 200 and 'r' in results[0]['achieved'] and 'error' in results[1]
+    assert results[2]['results']['zz']['success'] is False
+    code, result = request(service, '/query', {'mode': 'backward', 'goals': 's, r'})
+    assert code == 200 and result['goals'] == list(result['results']) == ['s', 'r']
+    code, error = request(service, '/query', {'mode': 'nope'})
+    assert code == 400 and 'error' in error
+    
+    code, status = request(service, '/status')
+    assert code == 200 and status['generation'] == 1 and status['requests'] == 4 and status['errors'] == 2
+    
+    with open(service.path, 'a', encoding='utf-8') as f:
+        f.write("99\tr->zz\n")
+    code, status = request(service, '/reload', {})
+    assert code == 200 and status['generation'] == 2 and status['rules'] == len(service.kb.rules)
+    code, result = request(service, '/query', {'mode': 'backward', 'goal': 'zz'})
+    assert code == 200 and result['success'] is True
+
+
+def test_bad_reload_keeps_serving(service):
+    with open(service.path, 'a', encoding='utf-8') as f:
+        f.write("not a rule\n")
+    code, error = request(service, '/reload', {})
+    assert code == 500 and error['status']['generation'] == 1 and error['status']['last_error']
+    code, result = request(service, '/query', {'mode': 'backward', 'goal': 'r'})
+    assert code == 200 and result['success'] is True